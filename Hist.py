@@ -2,24 +2,52 @@ import sys
 import numpy as np
 class Histogram:
 	# -----------------------------------------------
-	def __init__(self, min_lim,max_lim,width_bin):
+	def __init__(self, min_lim,max_lim,width_bin,nodes=None):
 		"""
 		Initialize the class
 
 		The created histo will have a bin width that is as close
 		as possible to the one specified in the arguments
+
+		OPTIONAL arg : nodes, the (increasing) positions of the bins
+		from min_lim to max_lim, for a non-uniform histo. The bin 
+		width is then the smallest spacing of the nodes
 		"""
 		self.min       = min_lim
 		self.max       = max_lim
 
-		# the width specified by the user cannot be used always. We chose
-		# the closent value that is feasible based on the specified boundaries
-		NBins          = round((max_lim - min_lim) / width_bin) + 1
-		feasible_width = (max_lim - min_lim)       / (NBins-1)
+		if (nodes is None):
+			# the width specified by the user cannot be used always. We chose
+			# the closent value that is feasible based on the specified boundaries
+			NBins          = round((max_lim - min_lim) / width_bin) + 1
+			feasible_width = (max_lim - min_lim)       / (NBins-1)
+
+			self.width_bin = feasible_width
+			self.NBins     = NBins
+			self.nodes     = min_lim + np.arange(NBins)*feasible_width
+			self.uniform   = True
+		else:
+			self.NBins     = len(nodes)
+			self.nodes     = np.zeros(self.NBins,np.double)
+			self.set_nodes(nodes)
+
+		self.binValue  = np.zeros(self.NBins,np.double)
+
+	# -----------------------------------------------
+	def set_nodes(self,nodes):
+		"""
+		Moves the bins to the positions nodes. The array of the 
+		nodes is changed in place, so objects sharing it follow
+		"""
+		nodes = np.asarray(nodes,np.double)
+		if (len(nodes) != self.NBins or len(nodes) < 2 or np.any(np.diff(nodes) <= 0.0)):
+			sys.exit('Histogram.set_nodes : ERROR - The %d nodes should be increasing' %self.NBins)
+		if (abs(nodes[0] - self.min) > 1.e-8 or abs(nodes[-1] - self.max) > 1.e-8):
+			sys.exit('Histogram.set_nodes : ERROR - The nodes should span %g ... %g' %(self.min, self.max))
 
-		self.width_bin = feasible_width
-		self.NBins     = NBins
-		self.binValue  = np.zeros(NBins,np.double)
+		self.nodes[:]  = nodes
+		self.width_bin = np.min(np.diff(nodes))
+		self.uniform   = False
 
 	# -----------------------------------------------
 	def __call__(self,iBin):
@@ -39,7 +67,19 @@ class Histogram:
 	# -----------------------------------------------
 	def idx_of(self,value):
 		"""find the correct bin that "value" (arg 1) belongs to"""
-		return int(round((value - self.min)/self.width_bin))
+		if (self.uniform):
+			return int(round((value - self.min)/self.width_bin))
+
+		# the closest node
+		iBin = int(np.searchsorted(self.nodes, value))
+		if (iBin == self.NBins or (iBin > 0 and value - self.nodes[iBin-1] < self.nodes[iBin] - value)):
+			iBin -= 1
+		return iBin
+
+	# -----------------------------------------------
+	def coord(self,iBin):
+		"""the position of the bin iBin"""
+		return self.nodes[iBin]
 
 	# -----------------------------------------------
 	def write_histo(self,tag,file):
@@ -1,6 +1,8 @@
 import numpy as np
+import sys
 
 from Hist   import Histogram  # parent class
+from hist_history import write_record
 from typing import Dict       # used to enforce the parent class typing
 
 class WL_histogram(Histogram):
@@ -12,9 +14,16 @@ class WL_histogram(Histogram):
   lnf_crit      = 0.0                        # when lnf <= crit_lnf the WL_histogram is considered equilibrated
   isItDone      = False                      # becomes True when lnf <= crit_lnf
   NVisits       = 0                          # number os visits logged for each sub-ensemble
+  schedule      = 'geometric'                # lnf reduction: geometric, or 1/t once lnf drops below NSubs/NPenalties
+  oneOverT      = False                      # becomes True when the 1/t stage of the schedule starts
+  NPenalties    = 0                          # number of penalties so far (the MC time of the 1/t schedule)
+  NResets       = 0                          # number of times the visits were reset (new WL stages)
+  NVisitsTot    = 0                          # sum of NVisits
+  minVisits     = 0                          # min of NVisits
+  NSubsWith     = {}                         # number of sub-ensembles with n visits (n: NSubsWith[n], only n with some)
 
   # 
-  def __init__(self,EEHisto: Histogram,lnf,lnf_scaler,ratio_crit, lnf_crit):
+  def __init__(self,EEHisto: Histogram,lnf,lnf_scaler,ratio_crit, lnf_crit, schedule='geometric'):
     """
     Initializes a Wang-Landau histogram
 
@@ -24,6 +33,11 @@ class WL_histogram(Histogram):
     lnf_scaler  -  The WL correction factor is decreases according to lnf *= lnf_scaler
     ratio_crit  -  Flatness ratio that results in a decrease of lnf through the scaler 
     lnf_crit    -  When lnf <= crit_lnf the WL_histogram is considered equilibrated
+    schedule    -  (OPTIONAL) geometric: lnf *= lnf_scaler whenever the visits are flat
+                   1/t      : as geometric until lnf drops below NSubs/NPenalties. From
+                              then on lnf = NSubs/NPenalties, i.e. 1/t with t in sweeps
+                              over the sub-ensembles (Belardinelli and Pereyra), which
+                              avoids the saturation of the error of the geometric schedule
 
     The variable EEHisto should be of the Histogram type
     """
@@ -38,11 +52,21 @@ class WL_histogram(Histogram):
     self.lnf_crit      = lnf_crit                   
     self.isItDone      = False                      
     self.NVisits       = np.zeros(NSubs,np.int64)   
+    self.NPenalties    = 0
+    self.oneOverT      = False
+    self.NResets       = 0
+
+    if (schedule != 'geometric' and schedule != '1/t'):
+      sys.exit('WL_histogram.__init__ : ERROR - Unknown lnf schedule %s (use geometric or 1/t)' %schedule)
+    self.schedule      = schedule
+
+    self.reset_visits()
 
     # inherited histogram variables
     self.min           = EEHisto.min
     self.max           = EEHisto.max
     self.width_bin     = EEHisto.width_bin
+    self.nodes         = EEHisto.nodes    # shared, follows moves of the nodes
     self.binValue      = self.wts
 
   #-----------------------------------------------------
@@ -56,15 +80,51 @@ class WL_histogram(Histogram):
   #-----------------------------------------------------
   def reset_visits(self):
     self.NVisits[:] = 0
+    self.NResets   += 1
+    self.recount_visits()
+
+  #-----------------------------------------------------
+  def recount_visits(self):
+    """
+    Rebuilds the flatness bookkeeping from NVisits. Has to be 
+    called when NVisits is set directly (merges, checkpoints)
+    """
+    counts, NSubs   = np.unique(self.NVisits, return_counts=True)
+    self.NSubsWith  = {int(n): int(NSub) for n, NSub in zip(counts, NSubs)}
+    self.NVisitsTot = int(np.sum(self.NVisits))
+    self.minVisits  = int(counts[0])
 
   #-----------------------------------------------------
   def incr_visits(self,i_sub):
+    """
+    Logs a visit of i_sub. The min and total of the visits are kept
+    up to date in O(1), so the flatness is known without a pass over
+    the sub-ensembles
+    """
+    n = int(self.NVisits[i_sub])
     self.NVisits[i_sub] += 1
+    self.NVisitsTot     += 1
+
+    self.NSubsWith[n]   -= 1
+    self.NSubsWith[n+1]  = self.NSubsWith.get(n+1,0) + 1
+    if (self.NSubsWith[n] == 0):
+      del self.NSubsWith[n]
+      if (n == self.minVisits):
+        self.minVisits = n+1  # i_sub was the last sub-ensemble with the min visits
+
+  #-----------------------------------------------------
+  def flatness(self):
+    """The ratio of the min over the mean visits"""
+    if (self.NVisitsTot == 0):
+      return 0.0
+
+    return self.minVisits * self.NSubs / self.NVisitsTot
 
   #-----------------------------------------------------
   def penalize(self,i_sub):
     self.incr_visits(i_sub)
-    self.wts[i_sub] -= self.lnf
+    self.NPenalties  += 1
+    self.wts[i_sub]  -= self.lnf
     self.check_for_convergence()
 
   #-----------------------------------------------------
@@ -72,15 +132,33 @@ class WL_histogram(Histogram):
     self.lnf *= self.lnf_scaler
     self.reset_visits()
 
+  #-----------------------------------------------------
+  def set_time(self,NPenalties,oneOverT):
+    """
+    Sets the MC time and the stage of the 1/t schedule, 
+    e.g. to the ones shared by all walkers after a merge
+    """
+    self.NPenalties = NPenalties
+    self.oneOverT   = oneOverT
+    if (self.oneOverT):
+      self.lnf      = self.NSubs / max(self.NPenalties,1)
+
   #-----------------------------------------------------
   def check_for_convergence(self):
     """
     Checks the flatness of the WL histogram and 
     updates lnf and isItDone accordingly
     """
-    ratio_current = np.min(self.NVisits/np.mean(self.NVisits))
-    if (ratio_current > self.ratio_crit):
+    if (self.oneOverT):
+      self.lnf = self.NSubs / self.NPenalties
+    elif (self.flatness() > self.ratio_crit):
       self.update_penalty()
+
+      if (self.schedule == '1/t' and self.lnf*self.NPenalties < self.NSubs):
+        # lnf dropped below 1/t. From now on it follows 1/t
+        self.oneOverT = True
+        self.lnf      = self.NSubs / self.NPenalties
+
     if (self.lnf <= self.lnf_crit):
       self.isItDone = True
 
@@ -107,9 +185,24 @@ class WL_histogram(Histogram):
       dev_from_mean[:] = self.NVisits[:] / mean_visits
 
     for i_sub in range(self.NSubs):
-      subEnsCoord = self.min + i_sub*self.width_bin
+      subEnsCoord = self.nodes[i_sub]
       file.write('%12.3f %16.3f %16.5f \n' \
                %(subEnsCoord, dev_from_mean[i_sub], dos[i_sub]))
 
     file.write("\n")
-    file.flush()
\ No newline at end of file
+    file.flush()
+
+  #-----------------------------------------------------
+  def write_record(self,step,file):
+    """Append the WL histogram at step as a record of a binary history file"""
+    record = np.zeros(1,[('step','<i8'), ('lnf','<f8'), ('isItDone','?'),   \
+                         ('wts','<f8',(self.NSubs,)), ('NVisits','<i8',(self.NSubs,)), \
+                         ('coords','<f8',(self.NSubs,))])
+    record['step']     = step
+    record['lnf']      = self.lnf
+    record['isItDone'] = self.isItDone
+    record['wts']      = self.wts
+    record['NVisits']  = self.NVisits
+    record['coords']   = self.nodes
+
+    write_record(self,record,file)
@@ -11,9 +11,9 @@ class atom:
 	Type   = -1
 	xyz    = []
 	charge = 0.0
-	Img    = np.zeros(0,np.integer)
+	Img    = np.zeros(0,np.int64)
 
-	def __init__(self, idx, iSpc, Type, charge, xyz, Img=np.zeros(0,np.integer)):
+	def __init__(self, idx, iSpc, Type, charge, xyz, Img=np.zeros(0,np.int64)):
 		self.idx    = idx
 		self.iSpc   = iSpc
 		self.Type   = Type
@@ -0,0 +1,156 @@
+#-----------------------------------------------------------------------
+#                              bench_ee_loop.py
+#-----------------------------------------------------------------------
+#
+# End-to-end benchmark of the expanded ensemble driver
+# (examples/ee_run/ee_lammps.py) on the mock lammps backend, at an
+# increasing number of MPI ranks. A small LJ + ions system is generated
+# in a temporary directory and the driver is run with its per-phase
+# timers (timing keyword) exported at the end of the production.
+#
+# The mock replicates the whole system on every rank, so the scaling
+# measures the overhead of the python layer and of the synchronization
+# (barriers, broadcasts) on top of the MD, not a parallel MD speedup.
+# Use EE_MOCK_STEP_LATENCY to emulate the cost of the MD.
+#
+# usage: python bench_ee_loop.py [output.json] [--ranks 1 2 4] [--atoms N]
+#                                [--steps NProd] [--energy run0|quadratic|partial|auto]
+#                                [--mpirun "mpirun -n"] [--compare baseline.json]
+#
+# requires mpi4py and an MPI launcher
+#
+#-----------------------------------------------------------------------
+
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from bench_util import RepoDir, write_results, compare_results
+
+DriverPath = os.path.join(RepoDir, "examples", "ee_run", "ee_lammps.py")
+
+ForceField = """mass 1 18.015
+mass 2 22.990
+mass 3 35.453
+
+pair_style  lj/cut/coul/long 10.0
+kspace_style ewald 1.0e-5
+
+pair_coeff 1 1 0.1500 3.150
+pair_coeff 2 2 0.3526 2.160
+pair_coeff 3 3 0.0128 4.830
+"""
+
+InputFile = """ee_histo        0.0 1.0 0.1
+use_wl          yes 1.0 0.5 0.8 0.0001
+use_tmmc        yes 100
+roam_ee_with    wl_and_tmmc
+ee_energy       %s
+iseed           123456
+read_data       data.bench
+sim_steps       0 %d %d
+tp_IonPair      2 Na 3 Cl
+set_temp        300.00
+timing          %d timing.json
+"""
+
+
+#-----------------------------------------------------------------------
+def write_system(FileName, NAtoms, NIonPairs):
+  """Writes a data file of LJ solvent and NIonPairs ion pairs (last) on a cubic lattice"""
+  NSide = int(np.ceil(NAtoms**(1.0/3.0)))
+  edge  = 3.1 * NSide
+  grid  = np.array([(i,j,k) for i in range(NSide) for j in range(NSide) for k in range(NSide)])[:NAtoms] * 3.1
+  types = np.ones(NAtoms,np.int64)
+  types[NAtoms-2*NIonPairs:NAtoms-NIonPairs] = 2
+  types[NAtoms-NIonPairs:]                    = 3
+  charges = np.select([types == 2, types == 3], [1.0, -1.0], 0.0)
+
+  with open(FileName,"w") as DataFile:
+    DataFile.write("LAMMPS data file - bench_ee_loop\n\n")
+    DataFile.write("%8d atoms\n%8d bonds\n%8d angles\n\n" %(NAtoms, 0, 0))
+    DataFile.write("%8d atom types\n%8d bond types\n%8d angle types\n\n" %(3, 0, 0))
+    for dim in "xyz":
+      DataFile.write("%8g %8g %slo %shi\n" %(0.0, edge, dim, dim))
+    DataFile.write("\nAtoms\n\n")
+    for iAt in range(NAtoms):
+      DataFile.write("%8d %8d %8d %12.4f %12.5f %12.5f %12.5f\n" \
+        %(iAt+1, iAt+1, types[iAt], charges[iAt], grid[iAt,0], grid[iAt,1], grid[iAt,2]))
+
+
+#-----------------------------------------------------------------------
+def run_driver(NRanks, mpirun, RunDir):
+  """Runs the driver on NRanks ranks and returns the gathered timing entries"""
+  env = dict(os.environ, EE_LAMMPS_BACKEND="mock", PYTHONPATH=RepoDir)
+  cmd = shlex.split(mpirun) + [str(NRanks), sys.executable, DriverPath, "input.bench"]
+  subprocess.run(cmd, cwd=RunDir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+  with open(os.path.join(RunDir, "timing.json"),"r") as TimingFile:
+    return json.load(TimingFile)
+
+
+#-----------------------------------------------------------------------
+def summarize(entries, NRanks, NAtoms, NAttempts, energy):
+  """Reduces the per rank timers to the benchmark metrics"""
+  mean   = lambda key, name: float(np.mean([e[key].get(name,0.0) for e in entries]))
+  wall   = float(np.mean([e['wall'] for e in entries]))
+  tProd  = wall - mean('totals','setup')
+  tMD    = mean('totals','md')
+  phases = sorted(set(name for e in entries for name in e['totals']))
+
+  return {'ranks'           : NRanks,
+          'atoms'           : NAtoms,
+          'energy'          : energy,
+          'attempts'        : NAttempts,
+          'production_s'    : tProd,
+          'attempts_per_s'  : NAttempts / tProd,
+          'overhead_fraction': (tProd - tMD) / tProd,
+          'phases_mean_s'   : {name: mean('totals',name) for name in phases},
+          'lammps_calls'    : entries[0]['NCalls']}
+
+
+#-----------------------------------------------------------------------
+if __name__ == "__main__":
+  args = sys.argv[1:]
+  def option(name, default, nargs=1):
+    if (name not in args):
+      return default
+    i      = args.index(name)
+    values = args[i+1:i+1+nargs]
+    del args[i:i+1+nargs]
+    return values if (nargs > 1) else values[0]
+
+  ranks    = [int(r) for r in option('--ranks', '1 2 4').split()]
+  NAtoms   = int(option('--atoms', 500))
+  NProd    = int(option('--steps', 2000))
+  energy   = option('--energy', 'quadratic')
+  mpirun   = option('--mpirun', 'mpirun -n')
+  baseline = option('--compare', None)
+  OutFile  = args[0] if (len(args) > 0) else "bench_ee_loop.json"
+  NStepsSE = 10
+
+  results = []
+  with tempfile.TemporaryDirectory() as RunDir:
+    write_system(os.path.join(RunDir, "data.bench"), NAtoms, max(1, NAtoms // 50))
+    with open(os.path.join(RunDir, "CGLJ.ff"),"w") as FFFile:
+      FFFile.write(ForceField)
+    with open(os.path.join(RunDir, "input.bench"),"w") as InFile:
+      InFile.write(InputFile %(energy, NProd, NStepsSE, NProd))
+
+    for NRanks in ranks:
+      entries = run_driver(NRanks, mpirun, RunDir)
+      result  = summarize(entries, NRanks, NAtoms, NProd // NStepsSE, energy)
+      results.append(result)
+      print("%4d ranks %10.1f attempts/s  overhead %5.1f %%" \
+        %(NRanks, result['attempts_per_s'], 100.0*result['overhead_fraction']), flush=True)
+
+  write_results(OutFile, 'ee_loop', results)
+
+  if (baseline is not None):
+    print("\nComparison with %s (attempts per second, higher is better)" %baseline)
+    sys.exit(int(compare_results(OutFile, baseline, ('ranks', 'atoms', 'energy'), 'attempts_per_s', True) > 0))
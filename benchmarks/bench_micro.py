@@ -0,0 +1,141 @@
+#-----------------------------------------------------------------------
+#                              bench_micro.py
+#-----------------------------------------------------------------------
+#
+# Micro-benchmarks of the building blocks of the expanded ensemble
+# code across increasing sizes:
+#
+#   WL_histogram.penalize             vs number of sub-ensembles
+#   TMMC_histogram.update_TMMC_weights vs number of sub-ensembles
+#   Histogram.idx_of                  vs number of bins
+#   Create_config_on_lattice          vs number of species
+#   data_lammps write / parse         vs number of atoms
+#
+# usage: python bench_micro.py [output.json] [--quick] [--compare baseline.json]
+#
+#-----------------------------------------------------------------------
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from bench_util import time_call, write_results, compare_results
+
+from Hist     import Histogram
+from WL       import WL_histogram
+from tmmc     import TMMC_histogram
+from atom     import atom
+from lattice  import lattice
+from molSys   import Create_config_on_lattice
+from data_lmp import data_lammps, Mol_System_to_data
+
+
+#-----------------------------------------------------------------------
+def bench_wl_penalize(NSubs):
+  EEHist = Histogram(0.0, 1.0, 1.0/(NSubs-1))
+  WLHist = WL_histogram(EEHist, 1.0, 0.5, 0.9, 1.e-8)
+  subs   = np.random.default_rng(1).integers(0, NSubs, 4096)
+  state  = {'i': 0}
+
+  def call():
+    WLHist.penalize(subs[state['i'] & 4095])
+    state['i'] += 1
+
+  return call
+
+#-----------------------------------------------------------------------
+def bench_tmmc_weights(NSubs):
+  EEHist = Histogram(0.0, 1.0, 1.0/(NSubs-1))
+  TMHist = TMMC_histogram(EEHist)
+  rng    = np.random.default_rng(1)
+  for i_sub in range(NSubs):
+    for iDir in (-1, 1):
+      TMHist.update_collection_matrix(i_sub, iDir, rng.random())
+
+  return TMHist.update_TMMC_weights
+
+#-----------------------------------------------------------------------
+def bench_idx_of(NBins):
+  EEHist = Histogram(0.0, 1.0, 1.0/(NBins-1))
+  values = np.random.default_rng(1).random(4096)
+  state  = {'i': 0}
+
+  def call():
+    EEHist.idx_of(values[state['i'] & 4095])
+    state['i'] += 1
+
+  return call
+
+#-----------------------------------------------------------------------
+def lattice_directions(NSpecies):
+  """Cations, anions and a neutral solvent, NSpecies in total"""
+  NIons = max(1, NSpecies // 20)
+  Solv  = atom(idx=0, iSpc=0, Type=0, charge= 0.0, xyz=np.zeros(3,np.double))
+  Cat   = atom(idx=0, iSpc=1, Type=1, charge=+1.0, xyz=np.zeros(3,np.double))
+  An    = atom(idx=0, iSpc=2, Type=2, charge=-1.0, xyz=np.zeros(3,np.double))
+  return [(Solv, NSpecies - 2*NIons), (Cat, NIons), (An, NIons)]
+
+#-----------------------------------------------------------------------
+def bench_lattice(NSpecies):
+  Directions = lattice_directions(NSpecies)
+
+  def call():
+    Create_config_on_lattice(lattice('cub', [3.1]*3, NSpecies), Directions)
+
+  return call
+
+#-----------------------------------------------------------------------
+def make_data(NAtoms):
+  return Mol_System_to_data(Create_config_on_lattice(lattice('cub', [3.1]*3, NAtoms), lattice_directions(NAtoms)))
+
+#-----------------------------------------------------------------------
+def bench_data_write(NAtoms, TmpDir):
+  Data     = make_data(NAtoms)
+  FileName = os.path.join(TmpDir, "data.write.%d" %NAtoms)
+  return lambda: Data.write(FileName)
+
+#-----------------------------------------------------------------------
+def bench_data_parse(NAtoms, TmpDir):
+  FileName = os.path.join(TmpDir, "data.parse.%d" %NAtoms)
+  make_data(NAtoms).write(FileName)
+  return lambda: data_lammps(FileName)
+
+
+#-----------------------------------------------------------------------
+if __name__ == "__main__":
+  args     = sys.argv[1:]
+  quick    = ('--quick' in args)
+  baseline = None
+  if ('--compare' in args):
+    baseline = args[args.index('--compare')+1]
+    args.remove('--compare')
+    args.remove(baseline)
+  args     = [a for a in args if not a.startswith('--')]
+  OutFile  = args[0] if (len(args) > 0) else "bench_micro.json"
+
+  histSizes = [10, 100, 1000] if quick else [10, 100, 1000, 10000]
+  confSizes = [100, 1000]     if quick else [100, 1000, 10000]
+  NRepeats  = 3               if quick else 5
+  tMin      = 0.05            if quick else 0.2
+
+  results = []
+  with tempfile.TemporaryDirectory() as TmpDir:
+    cases = [('wl_penalize',       n, lambda n=n: bench_wl_penalize(n))         for n in histSizes] \
+          + [('tmmc_weights',      n, lambda n=n: bench_tmmc_weights(n))        for n in histSizes] \
+          + [('hist_idx_of',       n, lambda n=n: bench_idx_of(n))              for n in histSizes] \
+          + [('lattice_config',    n, lambda n=n: bench_lattice(n))             for n in confSizes] \
+          + [('data_lammps_write', n, lambda n=n: bench_data_write(n, TmpDir))  for n in confSizes] \
+          + [('data_lammps_parse', n, lambda n=n: bench_data_parse(n, TmpDir))  for n in confSizes]
+
+    for (name, size, setup) in cases:
+      tCall, NCalls = time_call(setup(), NRepeats, tMin)
+      results.append({'name': name, 'size': size, 'time_per_call_s': tCall, 'calls_per_round': NCalls})
+      print("%-20s %8d %14.3e s/call" %(name, size, tCall), flush=True)
+
+  write_results(OutFile, 'micro', results)
+
+  if (baseline is not None):
+    print("\nComparison with %s (time per call, lower is better)" %baseline)
+    sys.exit(int(compare_results(OutFile, baseline, ('name', 'size'), 'time_per_call_s') > 0))
@@ -0,0 +1,99 @@
+#-----------------------------------------------------------------------
+#                              bench_util.py
+#-----------------------------------------------------------------------
+#
+# Helpers shared by the benchmarks: timing of a callable, the json
+# result files and the comparison of two result files.
+#
+#-----------------------------------------------------------------------
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RepoDir)    # the modules of the package live in the repo root
+
+
+#-----------------------------------------------------------------------
+def time_call(func, NRepeats=5, tMin=0.2):
+  """
+  Times func() and returns the best time per call (s) out of NRepeats
+  rounds. Each round calls func as many times as needed to last at
+  least tMin seconds, so fast functions are timed accurately.
+  """
+  NCalls = 1
+  while (True):
+    t0 = time.perf_counter()
+    for i in range(NCalls):
+      func()
+    elapsed = time.perf_counter() - t0
+    if (elapsed >= tMin or NCalls >= 1e7):
+      break
+    NCalls *= 2 if (elapsed <= 0.0) else max(2, int(1.2*tMin/elapsed))
+
+  best = elapsed / NCalls
+  for iRep in range(NRepeats-1):
+    t0 = time.perf_counter()
+    for i in range(NCalls):
+      func()
+    best = min(best, (time.perf_counter() - t0) / NCalls)
+
+  return best, NCalls
+
+
+#-----------------------------------------------------------------------
+def metadata():
+  """Describes the environment the benchmarks ran in"""
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=RepoDir, capture_output=True,
+                            text=True).stdout.strip()
+  except OSError:
+    commit = ""
+
+  return {'date'    : time.strftime("%Y-%m-%dT%H:%M:%S"),
+          'commit'  : commit,
+          'python'  : platform.python_version(),
+          'numpy'   : np.__version__,
+          'machine' : platform.machine(),
+          'node'    : platform.node()}
+
+
+#-----------------------------------------------------------------------
+def write_results(FileName, suite, results):
+  """Writes the results of a suite (a list of dicts) in a json file"""
+  with open(FileName,"w") as OutFile:
+    json.dump({'suite': suite, 'meta': metadata(), 'results': results}, OutFile, indent=1)
+
+
+#-----------------------------------------------------------------------
+def compare_results(FileName, BaseFileName, key, metric, higherIsBetter=False, tol=0.1):
+  """
+  Compares the metric of the results in FileName with the ones in
+  BaseFileName. Results are matched by the tuple of the fields in key.
+  Prints a line per result and returns the number of regressions,
+  i.e. results worse than the baseline by more than tol (relative).
+  """
+  with open(FileName,"r") as InFile:
+    new  = json.load(InFile)['results']
+  with open(BaseFileName,"r") as InFile:
+    base = {tuple(r[k] for k in key): r for r in json.load(InFile)['results']}
+
+  NRegressions = 0
+  for result in new:
+    ref = base.get(tuple(result[k] for k in key))
+    if (ref is None or ref[metric] == 0.0):
+      continue
+
+    ratio = result[metric] / ref[metric]
+    worse = (ratio < 1.0 - tol) if higherIsBetter else (ratio > 1.0 + tol)
+    NRegressions += int(worse)
+    print("%-40s %12.4g %12.4g %8.2f %s" %(" ".join(str(result[k]) for k in key), ref[metric], \
+          result[metric], ratio, "REGRESSION" if worse else ""))
+
+  return NRegressions
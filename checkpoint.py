@@ -0,0 +1,268 @@
+import numpy  as np
+import os
+import pickle
+import sys
+
+from simData import simData
+
+
+# -------------------------------------------------------------
+# Checkpoints of the expanded ensemble state.
+#
+# A checkpoint consists of a lammps restart file and a numpy archive
+# (prefix.npz) with the WL/TMMC histograms, the roaming weights, the
+# test particle state and the state of the random number stream.
+# The restart file is named after the timestep, and the archive, which
+# points to it, is only replaced once both files are complete. The
+# archive is therefore always consistent with the restart it points to.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+def checkpoint_exists(prefix):
+  """Returns True if a complete checkpoint with this prefix exists"""
+  if (not os.path.isfile(prefix + ".npz")):
+    return False
+
+  chk = read_checkpoint(prefix)
+  return os.path.isfile(str(chk['RestartFile']))
+
+# -------------------------------------------------------------
+def write_checkpoint(prefix,lmp,sim: simData,testPart,eeRng,NStepsRan,isWriter,team=None):
+  """
+  Writes a checkpoint. Has to be called by all ranks of the lammps
+  instance, while only isWriter=True writes the archive.
+
+  prefix    : path and name prefix of the checkpoint files
+  lmp       : the lammps simulation
+  sim       : the simulation info with the histograms
+  testPart  : the test object
+  eeRng     : the random number stream of the attempts (ee_random)
+  NStepsRan : production steps done so far
+  team      : (OPTIONAL) the walker_team. Its merge reference is saved
+  """
+  ntimestep   = lmp.extract_global("ntimestep")
+  RestartFile = "%s.%d.restart" %(prefix, ntimestep)
+
+  lmp.command("write_restart %s" %RestartFile)
+
+  if (not isWriter):
+    return
+
+  state = {}
+  state['RestartFile'] = RestartFile
+  state['ntimestep']   = ntimestep
+  state['NStepsRan']   = NStepsRan
+  state['sim_wts']     = sim.wts
+  state['sim_NJump']   = sim.NJump
+  state['use_wl_bool'] = sim.use_wl_bool
+  state['ee_nodes']    = sim.EEHist.nodes
+  state['sim_NSteps_equil'] = sim.NSteps_equil
+
+  if (sim.Tuner != 0):
+    state['sim_NSteps_subEns'] = sim.NSteps_subEns
+    state['tune_tSetup']       = sim.Tuner.tSetup
+
+  if (sim.GridFeedback != 0):
+    feedback              = sim.GridFeedback
+    state['grid_state']   = [feedback.NDone, feedback.label]
+    state['grid_accSum']  = feedback.accSum
+    state['grid_NAtt']    = feedback.NAtt
+    state['grid_NUp']     = feedback.NUp
+    state['grid_NDown']   = feedback.NDown
+
+  if (sim.WLHist != 0):
+    state['wl_wts']      = sim.WLHist.wts
+    state['wl_lnf']      = sim.WLHist.lnf
+    state['wl_NVisits']  = sim.WLHist.NVisits
+    state['wl_isItDone'] = sim.WLHist.isItDone
+    state['wl_NPenalties'] = sim.WLHist.NPenalties
+    state['wl_oneOverT']   = sim.WLHist.oneOverT
+    state['wl_NResets']    = sim.WLHist.NResets
+
+  if (sim.TMHist != 0):
+    state['tm_wts']           = sim.TMHist.wts
+    state['tm_CM']            = sim.TMHist.CM
+    state['tm_TM']            = sim.TMHist.TM
+    state['tm_NProposed']     = sim.TMHist.NProposed
+    state['tm_CMBlocks']      = sim.TMHist.CMBlocks
+    state['tm_NPBlocks']      = sim.TMHist.NPBlocks
+    state['tm_CMStart']       = sim.TMHist.CMStart
+    state['tm_NPStart']       = sim.TMHist.NPStart
+    state['tm_blocks']        = [sim.TMHist.NBlocks, sim.TMHist.NPerBlock, sim.TMHist.NUpdatesBlock]
+    state['tm_NVisits']       = sim.TMHist.NVisits
+    state['tm_activated']     = sim.TMHist.activated
+    state['tm_allSubsLogged'] = sim.TMHist.allSubsLogged
+
+  state['tp_charge'] = testPart.charge
+  if (testPart.Type == 'Ion Pair'):
+    state['tp_idx'] = [testPart.idxCat, testPart.idxAn]
+  else:
+    state['tp_idx'] = [testPart.idx]
+
+  for key, array in sim.Mixing.arrays().items():
+    state['mx_' + key] = array
+
+  state['rng_state']  = np.frombuffer(pickle.dumps(eeRng.gen.bit_generator.state), np.uint8)
+  state['rng_NDrawn'] = eeRng.NDrawn
+
+  if (team is not None):
+    state['team_ref'] = team.ref
+    state['team_refPenalties'] = team.refPenalties
+    state['team_refResets']    = team.refResets
+
+  # output written after the checkpoint is dropped when resuming
+  if (sim.write_wl):
+    sim.WL_FILE_out.flush()
+    state['wl_FilePos'] = sim.WL_FILE_out.tell()
+
+  if (sim.write_tmmc):
+    sim.TM_FILE_out.flush()
+    state['tm_FilePos'] = sim.TM_FILE_out.tell()
+
+  if (sim.write_mixing):
+    sim.MX_FILE_out.flush()
+    state['mx_FilePos'] = sim.MX_FILE_out.tell()
+
+  if (sim.write_mbar):
+    state['mb_iSub'], state['mb_coeffs'] = sim.MBSamples.arrays()
+    sim.MB_FILE_out.flush()
+    state['mb_FilePos'] = sim.MB_FILE_out.tell()
+
+  # the archive is the commit point of the checkpoint
+  ArchiveTmp = prefix + ".npz.tmp"
+  with open(ArchiveTmp,"wb") as ArchiveFile:
+    np.savez(ArchiveFile, **state)
+    ArchiveFile.flush()
+    os.fsync(ArchiveFile.fileno())
+
+  OldRestartFile = None
+  if (os.path.isfile(prefix + ".npz")):
+    OldRestartFile = str(read_checkpoint(prefix)['RestartFile'])
+
+  os.replace(ArchiveTmp, prefix + ".npz")
+
+  if (OldRestartFile is not None and OldRestartFile != RestartFile and os.path.isfile(OldRestartFile)):
+    os.remove(OldRestartFile)
+
+# -------------------------------------------------------------
+def read_checkpoint(prefix):
+  """Returns the archive of the checkpoint with this prefix as a dictionary"""
+  with np.load(prefix + ".npz") as archive:
+    chk = {key: archive[key] for key in archive.files}
+
+  return chk
+
+# -------------------------------------------------------------
+def restore_checkpoint(chk,lmp,sim: simData,testPart,eeRng,isWriter,team=None):
+  """
+  Restores the expanded ensemble state from the checkpoint chk (see
+  read_checkpoint). The configuration should already have been read
+  from chk['RestartFile']. Returns the production steps done so far.
+
+  isWriter : True for the rank that writes the output files. The
+             output written after the checkpoint is truncated
+  """
+  if (lmp.extract_global("ntimestep") != int(chk['ntimestep'])):
+    sys.exit('restore_checkpoint : ERROR - The restart file does not match the checkpoint')
+
+  sim.wts[:]      = chk['sim_wts']
+  if ('sim_NJump' in chk):
+    sim.NJump     = int(chk['sim_NJump'])
+  sim.use_wl_bool = bool(chk['use_wl_bool'])
+  if ('sim_NSteps_equil' in chk):
+    sim.NSteps_equil = int(chk['sim_NSteps_equil']) # as run, if detected automatically
+
+  # the segment length may have been tuned
+  if (sim.Tuner != 0 and 'sim_NSteps_subEns' in chk):
+    sim.NSteps_subEns     = int(chk['sim_NSteps_subEns'])
+    sim.Mixing.NSteps_seg = sim.NSteps_subEns
+    sim.Tuner.tSetup      = float(chk['tune_tSetup'])
+
+  # the nodes may have been moved by the grid feedback
+  if ('ee_nodes' in chk and not np.array_equal(chk['ee_nodes'], sim.EEHist.nodes)):
+    sim.EEHist.set_nodes(chk['ee_nodes'])
+    testPart.Dcharge = sim.EEHist.width_bin
+
+  if (sim.GridFeedback != 0 and 'grid_state' in chk):
+    feedback               = sim.GridFeedback
+    feedback.NDone, feedback.label = [int(n) for n in chk['grid_state']]
+    feedback.accSum[:]     = chk['grid_accSum']
+    feedback.NAtt[:]       = chk['grid_NAtt']
+    feedback.NUp[:]        = chk['grid_NUp']
+    feedback.NDown[:]      = chk['grid_NDown']
+
+  if (sim.WLHist != 0):
+    sim.WLHist.wts[:]     = chk['wl_wts']
+    sim.WLHist.lnf        = float(chk['wl_lnf'])
+    sim.WLHist.NVisits[:] = chk['wl_NVisits']
+    sim.WLHist.isItDone   = bool(chk['wl_isItDone'])
+    sim.WLHist.recount_visits()
+    if ('wl_NPenalties' in chk):
+      sim.WLHist.NPenalties = int(chk['wl_NPenalties'])
+      sim.WLHist.oneOverT   = bool(chk['wl_oneOverT'])
+    if ('wl_NResets' in chk):
+      sim.WLHist.NResets    = int(chk['wl_NResets'])
+
+  if (sim.TMHist != 0):
+    sim.TMHist.wts[:]        = chk['tm_wts']
+    sim.TMHist.CM[:,:]       = chk['tm_CM']
+    sim.TMHist.TM            = np.copy(chk['tm_TM'])
+    if ('tm_NProposed' in chk):
+      sim.TMHist.NProposed[:,:] = chk['tm_NProposed']
+    if ('tm_CMBlocks' in chk and chk['tm_CMBlocks'].shape == sim.TMHist.CMBlocks.shape):
+      sim.TMHist.CMBlocks[:] = chk['tm_CMBlocks']
+      sim.TMHist.NPBlocks[:] = chk['tm_NPBlocks']
+      sim.TMHist.CMStart[:]  = chk['tm_CMStart']
+      sim.TMHist.NPStart[:]  = chk['tm_NPStart']
+      sim.TMHist.NBlocks, sim.TMHist.NPerBlock, sim.TMHist.NUpdatesBlock = [int(n) for n in chk['tm_blocks']]
+    sim.TMHist.NVisits[:]    = chk['tm_NVisits']
+    sim.TMHist.activated     = bool(chk['tm_activated'])
+    sim.TMHist.allSubsLogged = bool(chk['tm_allSubsLogged'])
+
+  # the test object was initialized on the restart as if it were a new
+  # run, which may have scaled the charges of its initial atoms. These
+  # get the full charge back before the stored test atoms are restored
+  testPart.set_lmp_charge(lmp, testPart.fullCharge)
+
+  testPart.charge = float(chk['tp_charge'])
+  if (testPart.Type == 'Ion Pair'):
+    testPart.idxCat, testPart.idxAn = [int(i) for i in chk['tp_idx']]
+    flag = lmp.set_variable("idx_testCat",testPart.idxCat)
+    flag = lmp.set_variable("idx_testAn", testPart.idxAn)
+  else:
+    testPart.idx = int(chk['tp_idx'][0])
+    flag = lmp.set_variable("idx_testIon",testPart.idx)
+
+  testPart.set_lmp_charge(lmp, testPart.charge)
+
+  if (len(testPart.testGroups) > 0):
+    testPart.define_test_groups(lmp)
+
+  if ('mx_series' in chk):
+    sim.Mixing.set_arrays({key[3:]: chk[key] for key in chk if key.startswith('mx_') and key != 'mx_FilePos'})
+
+  eeRng.gen.bit_generator.state = pickle.loads(chk['rng_state'].tobytes())
+  eeRng.NDrawn                  = int(chk['rng_NDrawn'])
+
+  if (team is not None and 'team_ref' in chk):
+    team.ref = np.copy(chk['team_ref'])
+    if ('team_refPenalties' in chk):
+      team.refPenalties = int(chk['team_refPenalties'])
+    if ('team_refResets' in chk):
+      team.refResets    = int(chk['team_refResets'])
+
+  if (isWriter and sim.write_wl and 'wl_FilePos' in chk):
+    sim.WL_FILE_out.truncate(int(chk['wl_FilePos']))
+
+  if (isWriter and sim.write_tmmc and 'tm_FilePos' in chk):
+    sim.TM_FILE_out.truncate(int(chk['tm_FilePos']))
+
+  if (isWriter and sim.write_mixing and 'mx_FilePos' in chk):
+    sim.MX_FILE_out.truncate(int(chk['mx_FilePos']))
+
+  if (sim.write_mbar and 'mb_iSub' in chk):
+    sim.MBSamples.set_arrays(chk['mb_iSub'], chk['mb_coeffs'])
+    if (isWriter):
+      sim.MB_FILE_out.truncate(int(chk['mb_FilePos']))
+
+  return int(chk['NStepsRan'])
@@ -128,7 +128,7 @@ class data_lammps:
 				# we read the image flags as well
 				Imag = [int(i) for i in lineArgs[7:]]
 			else:
-				Imag = np.zeros(3,np.integer)
+				Imag = np.zeros(3,np.int64)
 
 
 			AtomIn   = atom(idx, iSpc, Type, charge, xyz, Imag)
@@ -185,6 +185,8 @@ class data_lammps:
 		if (self.NAngles > 0):
 			self.__write_Angles(DataFile)
 
+		DataFile.close()
+
 
 	def __write_generalInfo(self,DataFile):
 		DataFile.write("%8d atoms\n"  %self.NAtoms)
@@ -9,7 +9,7 @@ class domain:
 		self.edge = np.copy(edge)
 
 	def fold(self, xyz):
-		Img = np.zeros(0,np.integer) 
+		Img = np.zeros(0,np.int64) 
 		R   = np.copy(xyz)
 
 		R_gt_edge = np.array([r > e   for r,e in zip(R,self.edge)] )
@@ -0,0 +1,167 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+
+# -------------------------------------------------------------
+# On-disk cache of equilibrated starting states.
+#
+# An entry is a lammps restart file (positions, velocities and the
+# state of the thermostat) written at the end of the equilibration,
+# and a json file with what the run learned during the equilibration
+# (its length and the tuned segment length). Entries are named after
+# a fingerprint of everything the equilibrated state depends on: the
+# data file, the setup routine and the force field it includes, the
+# temperature, the equilibration settings, the charge the test
+# particles start with and the partition (walker/window) index.
+#
+# Entries are written under a temporary name and renamed once
+# complete, so that jobs sharing the cache never read a partial entry.
+# Whenever the cache grows beyond its maximum size the least recently
+# used entries are removed.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+def file_digest(FileName,digest):
+  """Feeds the content of a file into a hashlib digest"""
+  with open(FileName,"rb") as File:
+    for block in iter(lambda: File.read(1 << 20), b""):
+      digest.update(block)
+
+# -------------------------------------------------------------
+def setup_digest(setup,digest):
+  """
+  Feeds a setup routine into a hashlib digest: its source and the force
+  field file it includes (the default of its ffFile argument, if any)
+  """
+  try:
+    digest.update(inspect.getsource(setup).encode())
+  except (OSError, TypeError):
+    digest.update(("%s.%s" %(setup.__module__, setup.__qualname__)).encode())
+
+  try:
+    ffFile = inspect.signature(setup).parameters['ffFile'].default
+  except (KeyError, ValueError, TypeError):
+    ffFile = inspect.Parameter.empty
+
+  if (ffFile is not inspect.Parameter.empty):
+    digest.update(str(ffFile).encode())
+    if (os.path.isfile(ffFile)):
+      file_digest(ffFile, digest)
+
+# -------------------------------------------------------------
+class state_cache():
+  """
+  The directory of the cached equilibrated states and its maximum size
+  """
+  CacheDir  = ''   # directory of the cache
+  maxBytes  = 0    # max total size of the entries (bytes)
+
+  # ----------------------------------
+  def __init__(self,CacheDir,maxBytes):
+    """
+    CacheDir : directory of the cache. It is created if needed
+    maxBytes : max total size of the entries (bytes)
+    """
+    self.CacheDir = CacheDir
+    self.maxBytes = maxBytes
+    os.makedirs(CacheDir, exist_ok=True)
+
+  # ----------------------------------
+  def fingerprint(self,sim,setup,iPartition=0):
+    """
+    The key of the equilibrated state of the simulation sim set up by
+    the routine setup, for the partition iPartition
+    """
+    digest = hashlib.sha256()
+    file_digest(sim.DataFileName, digest)
+    setup_digest(setup, digest)
+
+    settings = {'Temp'        : sim.Temp,
+                'NSteps_equil': sim.NSteps_equil,
+                'chargeStart' : float(sim.EEHist.max),
+                'iPartition'  : iPartition}
+    if (sim.EquilMonitor != 0):
+      settings['auto_equil'] = [sim.EquilMonitor.NStepsChunk, sim.EquilMonitor.NStepsMin]
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+
+    return digest.hexdigest()
+
+  # ----------------------------------
+  def paths(self,key):
+    """The restart and metadata files of an entry"""
+    base = os.path.join(self.CacheDir, key)
+    return base + ".restart", base + ".json"
+
+  # ----------------------------------
+  def lookup(self,key):
+    """
+    Returns the restart file and the metadata of the entry key, or None
+    if it is not cached. The entry is marked as used
+    """
+    RestartFile, MetaFile = self.paths(key)
+    if (not os.path.isfile(RestartFile) or not os.path.isfile(MetaFile)):
+      return None
+
+    try:
+      with open(MetaFile,"r") as File:
+        meta = json.load(File)
+      os.utime(RestartFile)
+    except (OSError, ValueError):
+      return None # evicted or replaced meanwhile
+
+    return RestartFile, meta
+
+  # ----------------------------------
+  def store(self,key,lmp,meta,isWriter):
+    """
+    Stores the current state of lmp as the entry key. Has to be called
+    by all ranks of the lammps instance, while only isWriter=True
+    completes the entry and evicts the old ones
+    """
+    RestartFile, MetaFile = self.paths(key)
+    RestartTmp = "%s.%d.tmp" %(RestartFile, os.getpid())
+    lmp.command("write_restart %s" %RestartTmp)
+
+    if (not isWriter):
+      return
+
+    MetaTmp = "%s.%d.tmp" %(MetaFile, os.getpid())
+    with open(MetaTmp,"w") as File:
+      json.dump(dict(meta, key=key, stored=time.time()), File, indent=1)
+
+    os.replace(MetaTmp, MetaFile)
+    os.replace(RestartTmp, RestartFile)
+    self.evict(keep=key)
+
+  # ----------------------------------
+  def evict(self,keep=None):
+    """Removes the least recently used entries (but keep) until the cache fits in maxBytes"""
+    entries = []
+    for FileName in os.listdir(self.CacheDir):
+      if (not FileName.endswith(".restart")):
+        continue
+      key = FileName[:-len(".restart")]
+      try:
+        RestartFile, MetaFile = self.paths(key)
+        size = os.path.getsize(RestartFile)
+        if (os.path.isfile(MetaFile)):
+          size += os.path.getsize(MetaFile)
+        entries.append((os.path.getmtime(RestartFile), size, key))
+      except OSError:
+        pass # removed by another job meanwhile
+
+    total = sum(size for used, size, key in entries)
+    for used, size, key in sorted(entries):
+      if (total <= self.maxBytes):
+        break
+      if (key == keep):
+        continue
+      for FileName in self.paths(key):
+        try:
+          os.remove(FileName)
+        except OSError:
+          pass
+      total -= size
@@ -0,0 +1,1090 @@
+import numpy as np
+import sys
+import time
+
+from mpi4py         import MPI
+from sim_lmp        import run_lammps_sim, run_lammps_sim_every, set_lammps_dump, pe_probe, thermo_state
+from ee_energy      import quad_charge_model, elec_group_model
+from ee_random      import ee_rng
+from walkers        import walker_team
+from windows        import make_windows, stitch_dos, write_stitched_dos
+from hist_writer    import hist_writer
+from ee_timers      import phase_timers, counting_lammps, gather_timing, write_timing, timing_summary
+from checkpoint     import checkpoint_exists, write_checkpoint, read_checkpoint, restore_checkpoint
+from ee_mbar        import mbar_samples, mbar_estimate, write_mbar
+from simData        import simData
+
+
+# -------------------------------------------------------------
+class ExpandedEnsembleDriver():
+  """
+  Runs an expanded ensemble simulation: lammps explores the current
+  sub-ensemble with MD segments of NSteps_subEns steps and after each
+  segment the test particles attempt to jump by up to NJump sub-ensembles
+  with a biased MC criterion. The WL and TMMC histograms of sim are updated
+  and written along the way.
+
+  The driver is set up from a simData, so several simulations can be
+  run one after the other (or interleaved with step()) in the same
+  python process. A typical use is
+
+      driver = ExpandedEnsembleDriver(sim, make_test, setup_LJ_with_Ions)
+      driver.run()
+      driver.finish()
+
+  Hooks (add_hook) are called with the driver as their argument on
+  the events:
+    'segment'    : after the attempts (and weight update) of a segment
+    'checkpoint' : after a checkpoint was written
+    'finish'     : in finish(), before lammps and the files are closed
+  In in_run mode the 'segment' hooks are called from within the lammps
+  run and should not issue lammps commands.
+  """
+  NStepsRan   = 0      # production steps done so far
+  NRetries    = 0      # times the run was resumed from a checkpoint after a failure
+  isWriter    = False  # True for the rank that writes the output files
+  forcesStale = False  # True if the lammps forces do not match the charges after an attempt
+  NAdaptJump  = 50     # attempts between adaptations of the jump width
+  stopped     = False  # True once the run was stopped early (stop_when or request_stop)
+  stopRequested = False # True if a stop was requested (request_stop)
+  hookEvents  = ('segment', 'checkpoint', 'finish')
+
+  # ----------------------------------
+  def __init__(self,sim: simData,make_test,setup,world=None,resume=None,verbose=True):
+    """
+    sim       : the simulation info. The histograms should be in their
+                initial state
+    make_test : a callable (sim,lmp) returning the test_object (e.g. a
+                test_IonPair). It is called whenever lammps is started,
+                since the test particles live in the lammps instance
+    setup     : a callable (lmp,Temp,create_velocities=True) setting up
+                the force field and the integrator (e.g. setup_LJ_with_Ions)
+    world     : (OPTIONAL) the mpi communicator of the simulation. By
+                default MPI.COMM_WORLD
+    resume    : (OPTIONAL) continue from the last checkpoint. By default
+                sim.resume_bool. A new run is started if none is found
+    verbose   : (OPTIONAL) print the progress on rank 0
+    """
+    if (world is None):
+      world = MPI.COMM_WORLD
+
+    self.sim       = sim
+    self.make_test = make_test
+    self.setup     = setup
+    self.world     = world
+    self.irank     = world.Get_rank()
+    self.verbose   = verbose and (self.irank == 0)
+    self.EEHistAll = sim.EEHist            # the whole ee histogram (before splitting it in windows)
+    self.windows   = None
+
+    if (sim.NWindows > 1):
+      # each partition of ranks explores its own window of the ee coordinate
+      self.windows  = make_windows(self.EEHistAll.NBins, sim.NWindows, sim.NOverlap)
+      self.team     = walker_team(world, sim, sim.NWindows)
+      iFirst, iLast = self.windows[self.team.iWalker]
+      sim.set_window(iFirst, iLast, self.team.iWalker)
+      self.isWriter = self.team.isLeader   # every window writes its own histograms
+    else:
+      self.team     = walker_team(world, sim) # split the ranks in walkers (a single one by default)
+      self.isWriter = (self.irank == 0)
+
+    self.comm      = self.team.comm        # the communicator of the lammps instance of this walker
+
+    # checkpoints are written by every walker (or window) in its own files
+    self.chkPrefix = sim.chkPrefix
+    if (self.team.NWalkers > 1):
+      self.chkPrefix = "%s.%d" %(sim.chkPrefix, self.team.iWalker)
+    self.chkUsed   = (sim.NStepsChk > 0)
+
+    # a charge model predicts the energies of the attempts (simData resolves
+    # ee_energy auto to run0 or quadratic)
+    self.quad_used = (sim.ee_energy == 'quadratic' or sim.ee_energy == 'partial')
+
+    self.histWriter = hist_writer()        # the histograms are written from a background thread
+    self.timers     = phase_timers()       # wall clock time of the phases of the loop
+    self.lmpCalls   = {}                   # counts of the lammps calls
+    self.hooks      = {event: [] for event in self.hookEvents}
+    self.NStepsRan  = 0
+    self.NRetries   = 0
+    self.weightsOut = False                # True once the initial weights were updated and written
+    self.NJumpAttempts = 0                 # attempts since the jump width was last adapted
+    self.NJumpAccepted = 0                 # accepted attempts among them
+    self.stopped       = False
+    self.stopRequested = False
+    self.mbarF         = None              # the last MBAR free energies (initial guess of the next solve)
+    self.lastAttempt   = None              # direction and energy difference of the last attempt within range
+    self.cacheKey      = ''                # key of the equilibrated state in the cache (equil_cache)
+    self.wtsChecked    = []                # the TMMC weights at the last stop checks (stable)
+
+    if (resume is None):
+      resume = sim.resume_bool
+
+    resumed = False
+    if (resume):
+      resumed = checkpoint_exists(self.chkPrefix)
+      if (not resumed and self.verbose):
+        print(" > No checkpoint %s found, starting a new run" %self.chkPrefix)
+
+    with self.timers.phase('setup'):
+      self.init_simulation(resumed)
+
+    if (self.verbose):
+      print("----------------------------------------------------------")
+      print(" > Starting the Expanded Ensemble exploration ...")
+      print("\n")
+      print("    MD steps - Sub index - EE coord - PE (kcal/mol) - testPart idx")
+      print("\n")
+
+  # ----------------------------------
+  def init_simulation(self,resume):
+    """
+    Starts lammps and sets up the test particles and the helpers of the
+    sub-ensemble attempts. If resume is True the run continues from the
+    last checkpoint, otherwise the configuration of the data file is
+    equilibrated first.
+    """
+    sim = self.sim
+
+    # Initialize the simulation
+    if (self.team.NWalkers > 1):
+      self.lmp = counting_lammps(sim.init_lammps_Sim(self.comm, self.team.iWalker), self.lmpCalls)
+    else:
+      self.lmp = counting_lammps(sim.init_lammps_Sim(self.comm), self.lmpCalls)
+
+    # a state equilibrated by an earlier job with the same inputs
+    cached = None
+    if (not resume and sim.EquilCache != 0):
+      self.cacheKey = sim.EquilCache.fingerprint(sim, self.setup, self.team.iWalker)
+      if (self.team.isLeader):
+        cached = sim.EquilCache.lookup(self.cacheKey)
+      cached = self.comm.bcast(cached, root=0)
+      # the walkers either all start from the cache or all equilibrate (the tuning is collective)
+      if (self.world.allreduce(int(cached is not None),op=MPI.MIN) == 0):
+        cached = None
+
+    if (resume):
+      # the configuration, velocities and thermostat of the checkpoint
+      chk = read_checkpoint(self.chkPrefix)
+      sim.import_restart(self.lmp, str(chk['RestartFile']))
+      self.setup(self.lmp, sim.Temp, create_velocities=False)
+    elif (cached is not None):
+      # the configuration, velocities and thermostat of the cached state
+      CachedFile, meta = cached
+      sim.import_restart(self.lmp, CachedFile)
+      self.setup(self.lmp, sim.Temp, create_velocities=False)
+      sim.NSteps_equil = int(meta['NSteps_equil'])
+      if (self.verbose):
+        print(" > Equilibration skipped: starting from the cached state %s" %CachedFile)
+    else:
+      # Import the configuration as specified in the simData
+      sim.import_config(self.lmp)
+
+      self.setup(self.lmp, sim.Temp)
+
+      self.comm.Barrier()
+      if (sim.Tuner == 0 and sim.EquilMonitor == 0):
+        run_lammps_sim(self.lmp, sim.NSteps_equil) # run an initial equilibration run
+
+    self.testPart = self.make_test(sim, self.lmp)
+
+    # the random numbers of the attempts are either broadcasted by rank 0 (bcast)
+    # or drawn from the same stream on all ranks without communication (replicated)
+    self.eeRng = ee_rng(self.comm, sim.ISeed + self.team.iWalker, sim.ee_sync, sim.NCheckSync)
+
+    if (resume):
+      # histograms, weights, test particles and random numbers
+      self.NStepsRan  = restore_checkpoint(chk, self.lmp, sim, self.testPart, self.eeRng, self.isWriter, self.team)
+      self.weightsOut = True
+
+    # the energies of the attempted sub-ensembles are either computed with a
+    # false run (run0) or predicted by a model fitted once per configuration,
+    # either from full energy probes (quadratic) or from the electrostatic
+    # interactions of the test particles only (partial)
+    self.peProbe = pe_probe(self.lmp) # single point energies, without the run summary
+    if (sim.ee_energy == 'partial'):
+      self.peModel = elec_group_model(self.lmp, self.testPart)
+    else:
+      self.peModel = quad_charge_model()
+
+    self.forcesStale = False
+
+    if (not resume and cached is None and (sim.Tuner != 0 or sim.EquilMonitor != 0)):
+      self.equilibrate() # the equilibration run in chunks
+
+    if (sim.EquilCache != 0 and not resume):
+      if (cached is None):
+        self.cache_state()
+      elif (sim.Tuner != 0):
+        # the segment length tuned by the job that cached the state (of world rank 0)
+        NSteps_seg, tSetup = self.world.bcast((meta.get('NSteps_subEns'), meta.get('tSetup',0.0)), root=0)
+        if (NSteps_seg in sim.Tuner.candidates):
+          sim.Tuner.tSetup = tSetup
+          self.set_segment_length(NSteps_seg)
+
+    if (sim.Tuner != 0):
+      sim.Tuner.start_period(self.NStepsRan, self.timers.wall_time(), self.timers.totals.get('md',0.0))
+
+    if (sim.write_dump):
+      # set the dump file print info
+      if (self.team.NWalkers > 1):
+        set_lammps_dump(self.lmp, sim.NWStepDump, "%s.%d" %(sim.DumpFile, self.team.iWalker), resume)
+      else:
+        set_lammps_dump(self.lmp, sim.NWStepDump, sim.DumpFile, resume)
+
+  # ----------------------------------
+  def cache_state(self):
+    """
+    Stores the equilibrated state in the cache, together with the length
+    of the equilibration and the tuned segment length
+    """
+    sim  = self.sim
+    meta = {'NSteps_equil': sim.NSteps_equil,
+            'Temp'        : sim.Temp,
+            'DataFile'    : sim.DataFileName}
+    if (sim.Tuner != 0):
+      meta['NSteps_subEns'] = sim.NSteps_subEns
+      meta['tSetup']        = sim.Tuner.tSetup
+
+    sim.EquilCache.store(self.cacheKey, self.lmp, meta, self.team.isLeader)
+
+  # ----------------------------------
+  def equilibrate(self):
+    """
+    Runs the equilibration in chunks. With auto_equil the pe, the
+    temperature and the density are sampled after each chunk, and the
+    equilibration ends as soon as they are stationary (see ee_equil).
+    NSteps_equil is then the length actually run. With tune_segments the
+    energy difference of an attempt to the neighboring sub-ensemble is
+    probed after each chunk, and the segment length is chosen at the
+    end from the stationary part of the probes.
+    """
+    sim      = self.sim
+    lmp      = self.lmp
+    testPart = self.testPart
+    tuner    = sim.Tuner
+    monitor  = sim.EquilMonitor
+    if (monitor != 0):
+      NStepsChunk = monitor.NStepsChunk
+    else:
+      NStepsChunk = tuner.NStepsProbe
+
+    if (tuner != 0):
+      iSub   = self.sub_ensemble()
+      qNext  = sim.EEHist.coord(iSub-1 if (iSub > 0) else iSub+1)
+      charge = testPart.ee_coord()
+
+      # a probe costs about the setup of a lammps run
+      tStart       = time.perf_counter()
+      self.peProbe()
+      tuner.tSetup = time.perf_counter() - tStart
+
+    dE        = []
+    tMD       = 0.0
+    tAtt      = 0.0
+    NStepsRun = 0
+    equilibrated = False
+    while (NStepsRun + NStepsChunk <= sim.NSteps_equil and not equilibrated):
+      tStart     = time.perf_counter()
+      run_lammps_sim(lmp, NStepsChunk)
+      tMD       += time.perf_counter() - tStart
+      NStepsRun += NStepsChunk
+
+      if (tuner != 0):
+        tStart = time.perf_counter()
+        pe     = lmp.extract_compute("thermo_pe",0,0)
+        if (self.quad_used):
+          self.peModel.refit(lmp, testPart, pe, self.peProbe)
+          dE.append(self.peModel(qNext) - pe)
+        else:
+          testPart.set_lmp_charge(lmp, qNext)
+          dE.append(self.peProbe() - pe)
+          testPart.set_lmp_charge(lmp, charge)
+          self.peProbe()
+        tAtt  += time.perf_counter() - tStart
+
+      if (monitor != 0):
+        monitor.add(thermo_state(lmp))
+        # all the ranks of the walker end the equilibration together
+        equilibrated = self.comm.bcast(monitor.is_equilibrated(), root=0)
+
+    if (not equilibrated and sim.NSteps_equil > NStepsRun):
+      run_lammps_sim(lmp, sim.NSteps_equil - NStepsRun)
+      NStepsRun = sim.NSteps_equil
+
+    iStart = len(dE)//2
+    if (monitor != 0):
+      iStart = monitor.start()
+      if (self.verbose):
+        if (equilibrated):
+          print(" > Equilibrated after %d MD steps: %s" %(NStepsRun, monitor.report()))
+        else:
+          print(" > Equilibration: not stationary after the max of %d MD steps" %NStepsRun)
+      sim.NSteps_equil = NStepsRun
+
+    if (tuner != 0):
+      self.tune_segments(np.array(dE[iStart:]), tMD/len(dE), tAtt/len(dE))
+
+  # ----------------------------------
+  def tune_segments(self,dE,tChunk,tProbe):
+    """
+    Chooses the segment length from the energy differences dE probed
+    every NStepsProbe steps of the stationary part of the equilibration,
+    the mean wall time of a chunk (with the setup of its lammps run) and
+    of a probe. All ranks take the choice of world rank 0.
+    """
+    sim   = self.sim
+    tuner = sim.Tuner
+
+    # a separate lammps run per segment also pays for its setup
+    tSetup = tuner.tSetup
+    if (sim.ee_moves == 'in_run'):
+      tSetup = 0.0
+    tStep  = max(tChunk - tuner.tSetup, 1.e-12) / tuner.NStepsProbe
+    tFixed = tProbe + tSetup
+    tau    = tuner.tau_of_series(dE, tuner.NStepsProbe)
+
+    NSteps_seg = self.world.bcast(tuner.best_length(tau, tStep, tFixed), root=0)
+    if (self.verbose):
+      print(" > Segment tuning: dE correlation time %.1f steps, MD step %.3g s, attempt %.3g s" %(tau, tStep, tFixed))
+    self.set_segment_length(NSteps_seg)
+
+  # ----------------------------------
+  def set_segment_length(self,NSteps_seg):
+    """Changes the MD steps between the sub-ensemble attempts"""
+    sim = self.sim
+    if (NSteps_seg == sim.NSteps_subEns):
+      return
+
+    if (self.verbose):
+      print(" > Segment length: %d -> %d MD steps" %(sim.NSteps_subEns, NSteps_seg))
+    sim.NSteps_subEns = NSteps_seg
+    sim.Mixing.set_segment(NSteps_seg)
+
+  # ----------------------------------
+  def retune_if_due(self):
+    """
+    Retunes the segment length every NStepsRetune production steps from
+    the attempts and the timers of the last period. Has to be called by
+    all the ranks of the world communicator at the same step
+    """
+    tuner = self.sim.Tuner
+    if (tuner == 0 or tuner.NStepsRetune == 0 or self.NStepsRan == 0 or np.mod(self.NStepsRan,tuner.NStepsRetune) != 0):
+      return
+
+    NSteps_seg = tuner.retune(self.sim.NSteps_subEns, self.NStepsRan, self.timers.wall_time(), \
+                              self.timers.totals.get('md',0.0), self.sim.ee_moves == 'in_run')
+    NSteps_seg = self.world.bcast(NSteps_seg, root=0)
+    if (NSteps_seg is not None):
+      self.set_segment_length(NSteps_seg)
+
+  # ----------------------------------
+  def add_hook(self,event,func):
+    """Calls func(driver) on event ('segment', 'checkpoint' or 'finish')"""
+    if (event not in self.hooks):
+      sys.exit('ExpandedEnsembleDriver.add_hook : ERROR - Unknown event %s (use %s)' %(event, ", ".join(self.hookEvents)))
+
+    self.hooks[event].append(func)
+
+  # ----------------------------------
+  def call_hooks(self,event):
+    for func in self.hooks[event]:
+      func(self)
+
+  # ----------------------------------
+  def sub_ensemble(self):
+    """Index of the sub-ensemble the test particles are in"""
+    return self.sim.EEHist.idx_of(self.testPart.ee_coord())
+
+  # ----------------------------------
+  def weights(self):
+    """A copy of the weights used to roam the expanded ensemble"""
+    return np.copy(self.sim.wts)
+
+  # ----------------------------------
+  def dos(self):
+    """
+    A copy of the current estimate of the DOS: the TMMC weights once all
+    sub-ensembles have been logged, the WL weights otherwise. Without WL
+    it is the weights the run roams with
+    """
+    sim = self.sim
+    if (sim.use_tmmc_bool and sim.TMHist.allSubsLogged):
+      return np.copy(sim.TMHist.wts)
+    if (sim.WLHist != 0):
+      return np.copy(sim.WLHist.wts)
+
+    return np.copy(sim.wts)
+
+  # ----------------------------------
+  def state(self):
+    """A summary of the progress of the run as a dictionary"""
+    sim   = self.sim
+    state = {'NStepsRan': self.NStepsRan,
+             'iSub'     : self.sub_ensemble(),
+             'ee_coord' : self.testPart.ee_coord(),
+             'wts'      : self.weights(),
+             'use_wl'   : sim.use_wl_bool,
+             'NJump'    : sim.NJump,
+             'nodes'    : np.copy(sim.EEHist.nodes),
+             'NRetries' : self.NRetries,
+             'stopped'  : self.stopped}
+
+    state.update(sim.Mixing.summary())
+
+    if (sim.WLHist != 0):
+      state['wl_lnf']      = sim.WLHist.lnf
+      state['wl_isItDone'] = sim.WLHist.isItDone
+
+    if (sim.TMHist != 0):
+      state['tm_activated']     = sim.TMHist.activated
+      state['tm_allSubsLogged'] = sim.TMHist.allSubsLogged
+
+      errors = sim.TMHist.uncertainty()
+      if (errors is not None):
+        state['tm_dF']     = sim.TMHist.wts[-1] - sim.TMHist.wts[0]
+        state['tm_dF_err'] = errors[1]
+
+    return state
+
+  # ----------------------------------
+  def mixing_report(self):
+    """A one line summary of how well the sub-ensembles are mixed"""
+    mixing    = self.sim.Mixing
+    roundTrip = mixing.round_trip()
+    g         = mixing.inefficiency()
+    acc       = mixing.acceptance()
+
+    report = "mixing : %d round trips" %mixing.NTrips
+    if (roundTrip is not None):
+      report += " - mean round trip %.0f steps" %roundTrip
+    if (g is not None):
+      report += " - statistical inefficiency %.1f segments" %g
+    if (np.any(np.isfinite(acc))):
+      report += " - neighbor acceptance %.3f ... %.3f" %(np.nanmin(acc), np.nanmax(acc))
+
+    return report
+
+  # ----------------------------------
+  def sync_barrier(self):
+    """Explicit barriers are only used when the decisions are broadcasted"""
+    if (self.sim.ee_sync == 'bcast'):
+      with self.timers.phase('barrier'):
+        self.comm.Barrier()
+
+  # ----------------------------------
+  def output_and_update_weights(self):
+    """
+    Updates the weights using the correct roaming method and outputs
+    the histos as specified in the input
+    """
+    sim = self.sim
+
+    with self.timers.phase('weights'):
+      sim.update_roaming_weights(sim.ee_method)
+
+    self.timers.start('output')
+    NStepsRan = self.NStepsRan
+    timeStamp = "Simulation step: %8d" %(NStepsRan)
+
+    if (sim.use_wl_bool and sim.write_wl and np.mod(NStepsRan,sim.NWStepWL) == 0 and self.isWriter):
+      if (sim.format_wl == 'binary'):
+        self.histWriter.submit(sim.WLHist, NStepsRan, sim.WL_FILE_out, 'binary')
+      else:
+        self.histWriter.submit(sim.WLHist, timeStamp, sim.WL_FILE_out)
+
+    if (sim.use_tmmc_bool and sim.write_tmmc and np.mod(NStepsRan,sim.NWStepTM) == 0 and self.isWriter):
+      if (sim.format_tmmc == 'binary'):
+        self.histWriter.submit(sim.TMHist, NStepsRan, sim.TM_FILE_out, 'binary')
+      else:
+        self.histWriter.submit(sim.TMHist, timeStamp, sim.TM_FILE_out)
+
+    if (sim.write_mixing and NStepsRan > 0 and np.mod(NStepsRan,sim.NWStepMX) == 0 and self.isWriter):
+      self.histWriter.submit(sim.Mixing, timeStamp, sim.MX_FILE_out)
+    self.timers.stop('output')
+
+  # ----------------------------------
+  def attempt_subEns_change(self):
+    """
+    Attempts a sub-ensemble change of the test particles starting
+    from the configuration the last MD segment ended at. The WL
+    and TMMC histograms are updated accordingly.
+    """
+    sim      = self.sim
+    lmp      = self.lmp
+    testPart = self.testPart
+
+    self.forcesStale = False
+
+    pe_old   = lmp.extract_compute("thermo_pe",0,0) # old potential energy
+    iSub_old = self.sub_ensemble()                   # index of the old sub-ensemble
+
+    if (testPart.Type == 'Ion Pair'):
+      charge = testPart.ee_coord()
+      if (abs(charge - testPart.fullCharge) < testPart.Dcharge*0.1):
+        # fully charged and we can suffle the test particles
+        with self.timers.phase('shuffle'):
+          testPart.shuffle_testPart(lmp, self.comm, self.eeRng.draw(2))
+
+    if (self.quad_used):
+      # fit the energy of the current configuration as a function of the
+      # test charge. The charges are restored after probing.
+      NProbes = self.peProbe.NProbes
+      with self.timers.phase('fit'):
+        self.peModel.refit(lmp, testPart, pe_old, self.peProbe)
+      self.forcesStale = (self.peProbe.NProbes > NProbes)
+
+      # the energy of the configuration is known in all the sub-ensembles
+      if (sim.write_mbar):
+        sim.MBSamples.add(iSub_old, self.peModel.b, self.peModel.c)
+
+    if (self.verbose):
+      print("%10d %10d %10.2f %15.1f %16s" \
+        %(self.NStepsRan+sim.NSteps_equil, iSub_old, testPart.charge, pe_old, testPart.print_idx() ))
+
+    # several attempts can be made from the same configuration. The
+    # weights are updated between attempts as the histograms evolve
+    pe_cur   = pe_old
+    iSub_cur = iSub_old
+    for i_att in range(sim.NAttempts_subEns):
+      if (i_att > 0):
+        with self.timers.phase('weights'):
+          sim.update_roaming_weights(sim.ee_method)
+      pe_cur, iSub_cur = self.single_attempt(pe_cur, iSub_cur)
+
+      # the first attempt of each segment measures the decorrelation
+      if (i_att == 0 and sim.Tuner != 0 and self.lastAttempt is not None):
+        iDir, delta_pe = self.lastAttempt
+        sim.Tuner.log_attempt(self.NStepsRan, sim.NSteps_subEns, (iSub_old, iDir), delta_pe)
+      if (sim.GridFeedback != 0 and sim.GridFeedback.active()):
+        sim.GridFeedback.log_visit(iSub_cur)
+
+    sim.Mixing.log_segment(iSub_old, iSub_cur, self.NStepsRan)
+
+    self.adapt_jump()
+
+    # update the TMMC Histogram
+    if (sim.use_tmmc_bool and np.mod(self.NStepsRan,sim.NStepsUpdateTM) == 0):
+      with self.timers.phase('tmmc'):
+        sim.TMHist.update_TMMC_weights()
+
+    # merge the histograms of all walkers
+    if (sim.NWalkers > 1 and np.mod(self.NStepsRan,sim.NStepsMerge) == 0):
+      with self.timers.phase('merge'):
+        self.team.merge(sim)
+
+  # ----------------------------------
+  def adapt_jump(self):
+    """
+    Adapts the width of the proposed jumps to the acceptance of the last
+    NAdaptJump attempts. The width grows by one sub-ensemble (up to
+    NJumpMax) when more than accTarget of them were accepted and shrinks
+    by one when less than half of accTarget were
+    """
+    sim = self.sim
+    if (sim.NJumpMax == 1 or self.NJumpAttempts < self.NAdaptJump):
+      return
+
+    acceptance = self.NJumpAccepted / self.NJumpAttempts
+    if   (acceptance > sim.accTarget):
+      sim.NJump = min(sim.NJump+1, sim.NJumpMax)
+    elif (acceptance < 0.5*sim.accTarget):
+      sim.NJump = max(sim.NJump-1, 1)
+
+    self.NJumpAttempts = 0
+    self.NJumpAccepted = 0
+
+  # ----------------------------------
+  def adapt_grid_if_due(self):
+    """Moves the sub-ensembles every NStepsAdapt production steps, NAdapt times"""
+    feedback = self.sim.GridFeedback
+    if (feedback != 0 and feedback.active() and np.mod(self.NStepsRan,feedback.NStepsAdapt) == 0):
+      with self.timers.phase('grid'):
+        self.move_nodes()
+
+  # ----------------------------------
+  def move_nodes(self):
+    """
+    Moves the nodes of the ee histogram as the grid feedback suggests.
+    The weights are interpolated to the new nodes, while the statistics
+    tied to the old nodes (WL visits, TMMC collection matrix, MBAR 
+    samples) start over. The test particles move to the new position of
+    their sub-ensemble.
+    """
+    sim      = self.sim
+    EEHist   = sim.EEHist
+    oldNodes = np.copy(EEHist.nodes)
+    nodes    = sim.GridFeedback.new_nodes(oldNodes)
+    if (nodes is None):
+      return # not enough statistics yet
+
+    iSub = self.sub_ensemble()
+    EEHist.set_nodes(nodes)
+    sim.wts = np.interp(nodes, oldNodes, sim.wts)
+
+    if (sim.WLHist != 0):
+      sim.WLHist.wts[:] = np.interp(nodes, oldNodes, sim.WLHist.wts)
+      sim.WLHist.reset_visits()
+
+    if (sim.TMHist != 0):
+      sim.TMHist.wts[:] = np.interp(nodes, oldNodes, sim.TMHist.wts)
+      sim.TMHist.reset_collection()
+
+    sim.Mixing.reset_local()
+
+    if (sim.write_mbar):
+      sim.MBSamples.set_arrays(np.zeros(0,np.int32), np.zeros((0,2),np.double))
+      self.mbarF = None
+
+    self.testPart.Dcharge = EEHist.width_bin
+    self.testPart.move_to(self.lmp, EEHist.coord(iSub))
+    self.forcesStale = True
+
+    if (self.verbose):
+      print("Moved the sub-ensembles (%d of %d): %s" \
+        %(sim.GridFeedback.NDone, sim.GridFeedback.NAdapt, " ".join("%.3f" %node for node in nodes)))
+
+  # ----------------------------------
+  def single_attempt(self,pe_old,iSub_old):
+    """
+    Attempts a single sub-ensemble change from the current configuration,
+    with energy pe_old in sub-ensemble iSub_old. The jump is drawn
+    uniformly from +/-1 ... +/-NJump sub-ensembles, a symmetric proposal.
+    Returns the energy and sub-ensemble the attempt ended up in.
+    """
+    sim       = self.sim
+    lmp       = self.lmp
+    testPart  = self.testPart
+    wl_used   = sim.use_wl_bool
+    tmmc_used = sim.use_tmmc_bool
+    NSubs     = sim.EEHist.NBins
+
+    acceptTrans  = False
+    idx_test_dir = 0      # index that decides the direction
+    pe_new       = pe_old
+    iSub_new     = iSub_old
+
+    # all the random numbers of the attempt are shared in one go: the
+    # first decides the direction and the length of the jump and the
+    # second the acceptance
+    with self.timers.phase('rng'):
+      rand = self.eeRng.draw(2)
+    iJump = 1 + int(np.mod(2.0*rand[0],1.0) * sim.NJump)
+    if (rand[0] < 0.5):
+      idx_test_dir = +iJump
+    else:
+      idx_test_dir = -iJump
+
+    self.NJumpAttempts += 1
+    self.lastAttempt    = None
+
+    # If the attempted transition is going out of limits, reject it
+    if (iSub_old + idx_test_dir < 0 or iSub_old + idx_test_dir > NSubs-1):
+
+      if (wl_used):
+        sim.WLHist.penalize(iSub_old)
+
+      if (tmmc_used):
+        trans_prob = 0.0
+        sim.TMHist.update_collection_matrix(iSub_old, idx_test_dir, trans_prob)
+
+        if (sim.TMHist.activated):
+          sim.TMHist.incr_visits(iSub_old)
+    else:
+      # Make the temporary changes to the test particles
+      # Note that these changes have to be reverted if the
+      # attempted transition gets rejected
+      testPart.subEns_change(lmp,idx_test_dir)
+      iSub_new  = self.sub_ensemble()
+
+      # Get the energy from the model or by doing a false run
+      if (self.quad_used):
+        pe_new = self.peModel(testPart.ee_coord())
+      else:
+        self.sync_barrier()
+        with self.timers.phase('trial'):
+          pe_new = self.peProbe()
+
+      # compute the trans_probability
+      delta_pe    = (pe_new - pe_old)
+      self.lastAttempt = (idx_test_dir, delta_pe)
+      expDE       = np.exp(-sim.Beta * delta_pe)
+      trans_prob  = np.minimum(expDE,1.0)
+
+      if (tmmc_used):
+        # update the collection matrix of TMMC
+        sim.TMHist.update_collection_matrix(iSub_old, idx_test_dir, trans_prob)
+
+      # All processors reach the same decision since the energies
+      # and the random numbers are identical on all ranks
+      delta_w     = sim.wts[iSub_new] - sim.wts[iSub_old]
+      arg         = np.exp(-sim.Beta * delta_pe + delta_w)
+      acceptTrans = (arg > rand[1])
+
+      if (abs(idx_test_dir) == 1):
+        sim.Mixing.log_attempt(iSub_old, idx_test_dir, acceptTrans)
+        if (sim.GridFeedback != 0 and sim.GridFeedback.active()):
+          sim.GridFeedback.log_attempt(iSub_old, idx_test_dir, min(arg,1.0))
+
+      if (acceptTrans):
+        self.NJumpAccepted += 1
+
+        if (wl_used):
+          sim.WLHist.penalize(iSub_new)
+
+        # no force evaluation was made at the new charges by the model
+        if (self.quad_used):
+          self.forcesStale = True
+      else:
+        if (wl_used):
+          sim.WLHist.penalize(iSub_old)
+
+        # change back to the previous sub ens
+        testPart.subEns_change(lmp,-idx_test_dir)
+
+        # Need this false run to update the forces correctly. With a charge
+        # model no force evaluation was made at the trial charge
+        if (not self.quad_used):
+          self.sync_barrier()
+          with self.timers.phase('revert'):
+            self.peProbe()
+
+        # to be used to log visits for TMMC
+        iSub_new = iSub_old
+        pe_new   = pe_old
+
+      # increase the # of visits in the tmmc histo (only if roaming the ee with it)
+      if (tmmc_used and sim.TMHist.activated):
+        sim.TMHist.incr_visits(iSub_new)
+
+    self.eeRng.check_consistency([iSub_new])
+
+    return pe_new, iSub_new
+
+  # ----------------------------------
+  def segment_done(self):
+    """The attempts, weight update and output after an MD segment"""
+    self.NStepsRan += self.sim.NSteps_subEns
+    self.attempt_subEns_change()
+    self.adapt_grid_if_due()
+    self.output_and_update_weights()
+    self.write_mbar_if_due()
+    self.call_hooks('segment')
+    self.export_timing_if_due()
+
+  # ----------------------------------
+  def ee_move(self):
+    """
+    Callback invoked by lammps every NSteps_subEns steps when the
+    sub-ensemble moves are done within a single long run (in_run)
+    """
+    self.timers.stop('md') # the time since the last callback was spent in the MD
+
+    self.segment_done()
+
+    # lammps continues the run without a setup (pre no), from the forces of
+    # the last evaluation. After a trial or revert probe they match the
+    # charges the test particles ended up with, since a probe does the
+    # setup (run 0 post no). A charge model evaluates no forces, so they
+    # are evaluated here
+    if (self.forcesStale):
+      with self.timers.phase('revert'):
+        self.peProbe()
+
+    self.timers.start('md')
+
+  # ----------------------------------
+  def checkpoint_if_due(self):
+    """Writes a checkpoint every NStepsChk production steps"""
+    if (self.chkUsed and self.NStepsRan > 0 and np.mod(self.NStepsRan,self.sim.NStepsChk) == 0):
+      self.checkpoint()
+
+  # ----------------------------------
+  def checkpoint(self):
+    """
+    Writes a checkpoint of the current step. The archive is written by
+    the leader of every walker (or window), in the files of the walker
+    """
+    with self.timers.phase('checkpoint'):
+      self.histWriter.drain() # the checkpoint records the size of the output files
+      write_checkpoint(self.chkPrefix, self.lmp, self.sim, self.testPart, self.eeRng, \
+                       self.NStepsRan, self.team.isLeader, self.team)
+    self.call_hooks('checkpoint')
+
+  # ----------------------------------
+  def write_mbar_if_due(self):
+    """Writes the MBAR free energies every NWStepMB production steps"""
+    if (self.sim.write_mbar and np.mod(self.NStepsRan,self.sim.NWStepMB) == 0):
+      self.write_mbar_estimate()
+
+  # ----------------------------------
+  def write_mbar_estimate(self):
+    """
+    Solves the MBAR equations with the samples collected so far and
+    writes the free energies. The walkers sample the same sub-ensembles,
+    so their samples are pooled. Has to be called by all the ranks of
+    the world communicator.
+    """
+    sim     = self.sim
+    samples = sim.MBSamples
+
+    with self.timers.phase('mbar'):
+      if (self.windows is None and self.team.NWalkers > 1):
+        entry   = None
+        if (self.team.isLeader):
+          entry = samples.arrays()
+        entries = self.world.gather(entry, root=0)
+
+        if (self.irank == 0):
+          samples = mbar_samples(sim.MBSamples.coords, sim.Beta)
+          entries = [entry for entry in entries if (entry is not None)]
+          samples.set_arrays(np.concatenate([iSub   for (iSub, coeffs) in entries]),
+                             np.concatenate([coeffs for (iSub, coeffs) in entries]))
+
+      if (not self.isWriter or samples.NSamples == 0):
+        return
+
+      f, err, N_k = mbar_estimate(samples, self.mbarF)
+      self.mbarF  = f
+      write_mbar(samples.coords, f, err, N_k, "Simulation step: %8d" %(self.NStepsRan), sim.MB_FILE_out)
+
+  # ----------------------------------
+  def export_timing_if_due(self):
+    """
+    Writes the timers of all the ranks of the world (all walkers or
+    windows) every NStepsTiming production steps, from world rank 0
+    """
+    if (self.sim.NStepsTiming > 0 and np.mod(self.NStepsRan,self.sim.NStepsTiming) == 0):
+      entries = gather_timing(self.world, self.timers, self.lmpCalls, self.NStepsRan, self.team.iWalker)
+      if (self.irank == 0):
+        write_timing(self.sim.TimingFile, entries)
+
+  # ----------------------------------
+  def converged(self):
+    """
+    True if the stopping criterion of the input (stop_when) is met:
+      dF_err : the standard error of the TMMC free energy difference
+               between the last and the first sub-ensemble is <= stopTol
+      stable : WL is done and the TMMC weights changed by <= stopTol
+               over the last NChecksStop checks
+    Has to be called by all the ranks of the world communicator, since
+    all the walkers (or windows) stop together once all have converged.
+    """
+    sim    = self.sim
+    TMHist = sim.TMHist
+    met    = False
+
+    if   (sim.stopCriterion == 'dF_err' and TMHist.allSubsLogged):
+      errors = TMHist.uncertainty()
+      met    = (errors is not None and errors[1] <= sim.stopTol)
+    elif (sim.stopCriterion == 'stable' and TMHist.allSubsLogged):
+      self.wtsChecked = (self.wtsChecked + [np.copy(TMHist.wts)])[-(sim.NChecksStop+1):]
+      wl_done = (sim.WLHist == 0 or sim.WLHist.isItDone)
+      if (wl_done and len(self.wtsChecked) == sim.NChecksStop+1):
+        change = np.max(np.abs(np.array(self.wtsChecked) - self.wtsChecked[-1]))
+        met    = (change <= sim.stopTol)
+
+    return self.world.allreduce(int(met),op=MPI.MIN) == 1
+
+  # ----------------------------------
+  def stop_if_converged(self):
+    """Checks the stopping criterion every NStepsStop production steps"""
+    sim = self.sim
+    if (self.stopRequested):
+      self.stop()
+    elif (sim.NStepsStop > 0 and self.NStepsRan > 0 and np.mod(self.NStepsRan,sim.NStepsStop) == 0):
+      if (self.converged()):
+        if (self.verbose):
+          print(" > Stopping criterion (%s <= %g) met after %d production steps" %(sim.stopCriterion, sim.stopTol, self.NStepsRan))
+        self.stop()
+
+  # ----------------------------------
+  def request_stop(self):
+    """
+    Stops the run at the end of the current segment (or of the current
+    lammps run in in_run mode), e.g. from a hook. Has to be requested
+    on all the ranks of the world communicator.
+    """
+    self.stopRequested = True
+
+  # ----------------------------------
+  def stop(self):
+    """
+    Stops the run early. The histograms of the last step and a
+    checkpoint are written unless they were just written anyway
+    """
+    sim          = self.sim
+    NStepsRan    = self.NStepsRan
+    self.stopped = True
+
+    if (self.isWriter and sim.use_wl_bool and sim.write_wl and np.mod(NStepsRan,sim.NWStepWL) != 0):
+      if (sim.format_wl == 'binary'):
+        self.histWriter.submit(sim.WLHist, NStepsRan, sim.WL_FILE_out, 'binary')
+      else:
+        self.histWriter.submit(sim.WLHist, "Simulation step: %8d" %(NStepsRan), sim.WL_FILE_out)
+
+    if (self.isWriter and sim.use_tmmc_bool and sim.write_tmmc and np.mod(NStepsRan,sim.NWStepTM) != 0):
+      if (sim.format_tmmc == 'binary'):
+        self.histWriter.submit(sim.TMHist, NStepsRan, sim.TM_FILE_out, 'binary')
+      else:
+        self.histWriter.submit(sim.TMHist, "Simulation step: %8d" %(NStepsRan), sim.TM_FILE_out)
+
+    if (self.isWriter and sim.write_mixing and np.mod(NStepsRan,sim.NWStepMX) != 0):
+      self.histWriter.submit(sim.Mixing, "Simulation step: %8d" %(NStepsRan), sim.MX_FILE_out)
+
+    if (sim.write_mbar and np.mod(NStepsRan,sim.NWStepMB) != 0):
+      self.write_mbar_estimate()
+
+    if (self.chkUsed and np.mod(NStepsRan,sim.NStepsChk) != 0):
+      self.checkpoint()
+
+  # ----------------------------------
+  def initial_output(self):
+    """Updates and writes the initial weights (once per run)"""
+    if (not self.weightsOut):
+      self.output_and_update_weights()
+      self.weightsOut = True
+
+  # ----------------------------------
+  def step(self):
+    """
+    Runs a single MD segment of NSteps_subEns steps followed by the
+    sub-ensemble attempts, regardless of ee_moves. lammps failures are
+    not caught (see run())
+    """
+    self.initial_output()
+
+    self.sync_barrier()
+    with self.timers.phase('md'):
+      run_lammps_sim(self.lmp, self.sim.NSteps_subEns)
+
+    self.segment_done()
+    self.checkpoint_if_due()
+    self.retune_if_due()
+    self.stop_if_converged()
+
+  # ----------------------------------
+  def advance(self,NStepsEnd):
+    """Runs the production until NStepsEnd steps are done"""
+    sim      = self.sim
+
+    if (sim.ee_moves != 'in_run'):
+      while (self.NStepsRan < NStepsEnd and not self.stopped):
+        self.step()
+      return
+
+    # a single run where lammps calls back ee_move() between segments.
+    # With checkpoints it is split in blocks, since a restart file
+    # cannot be written from within a run
+    self.initial_output()
+
+    while (self.NStepsRan < NStepsEnd and not self.stopped):
+      NStepsBlock = NStepsEnd - self.NStepsRan
+      if (self.chkUsed):
+        NStepsBlock = min(NStepsBlock, sim.NStepsChk  - np.mod(self.NStepsRan,sim.NStepsChk))
+      if (sim.NStepsStop > 0):
+        NStepsBlock = min(NStepsBlock, sim.NStepsStop - np.mod(self.NStepsRan,sim.NStepsStop))
+      if (sim.Tuner != 0 and sim.Tuner.NStepsRetune > 0):
+        NStepsBlock = min(NStepsBlock, sim.Tuner.NStepsRetune - np.mod(self.NStepsRan,sim.Tuner.NStepsRetune))
+
+      # the segment length is read for every block, since the retuning
+      # between the blocks changes it
+      self.sync_barrier()
+      self.timers.start('md')
+      run_lammps_sim_every(self.lmp, NStepsBlock, sim.NSteps_subEns, self.ee_move)
+      self.timers.stop('md')
+      self.checkpoint_if_due()
+      self.retune_if_due()
+      self.stop_if_converged()
+
+  # ----------------------------------
+  def run(self,NSteps=None):
+    """
+    Runs NSteps production steps, by default the rest of NSteps_prod.
+    NSteps should be a multiple of NSteps_subEns. The run ends earlier
+    if the stopping criterion (stop_when) is met or a stop is requested.
+
+    If lammps fails (e.g. lost atoms) the run is resumed from the last
+    checkpoint, up to NRetriesChk times. Walkers and windows cannot
+    resume on their own, since the partitions of the world meet in
+    collective calls (merges, the stopping criterion, the retuning).
+    """
+    sim      = self.sim
+    NStepsSE = sim.NSteps_subEns
+
+    if (NSteps is None):
+      NSteps = int(sim.NSteps_prod / NStepsSE)*NStepsSE - self.NStepsRan
+    if (NSteps < 0 or np.mod(NSteps,NStepsSE) != 0):
+      sys.exit('ExpandedEnsembleDriver.run : ERROR - %d steps is not a multiple of the %d steps of a segment' %(NSteps,NStepsSE))
+
+    NStepsEnd = self.NStepsRan + NSteps
+    while (True):
+      try:
+        self.advance(NStepsEnd)
+        break
+      except Exception as err:
+        if (type(err).__name__ == 'MPIAbortException' or self.team.NWalkers > 1 or \
+            self.NRetries >= sim.NRetriesChk or not checkpoint_exists(self.chkPrefix)):
+          raise
+
+        self.NRetries += 1
+        if (self.verbose):
+          print(" > lammps failed (%s). Resuming from the last checkpoint (retry %d)" %(err, self.NRetries))
+
+        self.histWriter.drain()
+        self.lmp.close()
+        sim.FileMode = 'a'
+        self.init_simulation(True)
+
+  # ----------------------------------
+  def finish(self):
+    """
+    Stitches the DOS of the windows, reports the timers and closes
+    lammps and the output files. Has to be called by all the ranks
+    """
+    sim = self.sim
+
+    if (sim.NWindows > 1):
+      # collect the DOS of all windows and stitch them in a single profile
+      if (self.team.isLeader):
+        dos_windows = self.world.gather((self.team.iWalker, self.dos()), root=0)
+      else:
+        dos_windows = self.world.gather(None, root=0)
+
+      if (self.irank == 0):
+        dos_list = [None] * sim.NWindows
+        for entry in dos_windows:
+          if (entry is not None):
+            dos_list[entry[0]] = entry[1]
+
+        StitchedFile = open(sim.StitchedFile,"w")
+        write_stitched_dos(self.EEHistAll, stitch_dos(self.EEHistAll.NBins, self.windows, dos_list), StitchedFile)
+        StitchedFile.close()
+
+    if (self.verbose):
+      print(self.peProbe.report())
+      print(self.mixing_report())
+
+    # per rank timers of all the walkers (or windows)
+    entries = gather_timing(self.world, self.timers, self.lmpCalls, self.NStepsRan, self.team.iWalker)
+    if (self.irank == 0 and sim.NStepsTiming > 0):
+      write_timing(sim.TimingFile, entries)
+    if (self.verbose):
+      print(timing_summary(entries))
+
+    self.call_hooks('finish')
+
+    self.histWriter.close()
+
+    if (sim.write_wl):
+      sim.WL_FILE_out.close()
+
+    if (sim.write_tmmc):
+      sim.TM_FILE_out.close()
+
+    if (sim.write_mbar):
+      sim.MB_FILE_out.close()
+
+    if (sim.write_mixing):
+      sim.MX_FILE_out.close()
+
+    self.lmp.close()
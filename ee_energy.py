@@ -0,0 +1,257 @@
+import numpy as np
+import sys
+
+
+# -------------------------------------------------------------
+class quad_charge_model():
+  """
+  Keeping every other charge fixed, the potential energy of a
+  configuration is exactly quadratic in the ee coordinate (the
+  charge) of the test object:
+
+      E(q) = a + b*q + c*q^2
+
+  The energies of the same configuration at three distinct charges
+  determine a, b and c. The fitted model then predicts the energy of
+  every sub-ensemble without asking lammps for another force
+  evaluation. The model has to be reset every time the configuration
+  changes (i.e. after every MD segment).
+
+  The model is not free: the energy at the current charge comes with
+  the MD segment, but the fit probes two more charges, i.e. two extra
+  energy evaluations per segment (and a third one in_run, where the
+  forces are evaluated again at the final charges). It saves the trial
+  evaluation of every attempt and the revert of every rejected one, so
+  it pays off with several attempts per segment or when the energies of
+  all the sub-ensembles are needed (MBAR).
+  """
+  a         = 0.0   # constant term (everything not involving the test charge)
+  b         = 0.0   # linear term   (test charge with the rest of the system)
+  c         = 0.0   # quadratic term (test charge with itself)
+  charges   = []    # charges at which the energy of the current config is known
+  energies  = []    # the corresponding potential energies
+  isFitted  = False # True if a,b,c describe the current configuration
+  NFits     = 0     # number of fits performed so far
+
+  # ----------------------------------
+  def __init__(self):
+    """Initialize an empty model"""
+    self.NFits = 0
+    self.reset()
+
+  # ----------------------------------
+  def reset(self):
+    """
+    Forget the energies logged so far. Call this every time
+    the configuration changes
+    """
+    self.charges   = []
+    self.energies  = []
+    self.isFitted  = False
+
+  # ----------------------------------
+  def add_point(self,charge,pe):
+    """Log the energy pe of the current configuration at charge"""
+    self.charges.append(charge)
+    self.energies.append(pe)
+    self.isFitted = False
+
+  # ----------------------------------
+  def fit(self):
+    """
+    Computes a, b and c from the logged energies. At least three
+    distinct charges are needed. With more points a least squares
+    fit is performed instead
+    """
+    if (len(set(self.charges)) < 3):
+      sys.exit('quad_charge_model.fit : ERROR - At least three distinct charges are needed for a fit')
+
+    self.c, self.b, self.a = np.polyfit(self.charges, self.energies, 2)
+    self.isFitted          = True
+    self.NFits            += 1
+
+  # ----------------------------------
+  def __call__(self,charge):
+    """
+    Self-calling the class returns the predicted energy
+    of the current configuration at the requested charge
+    """
+    if (not self.isFitted):
+      sys.exit('quad_charge_model.__call__ : ERROR - The model has not been fitted to the current configuration')
+
+    return self.a + self.b*charge + self.c*charge*charge
+
+  # ----------------------------------
+  def probe_charges(self,charge,Dcharge,chargeMin,chargeMax):
+    """
+    Returns the two extra charges (besides the current one) at which
+    the energy should be probed to fit the model. Neighboring
+    sub-ensembles are preferred, since these are the ones that will
+    be attempted next. Half steps are used when the ee histogram
+    is too short
+    """
+    candidates = [charge + Dcharge,   charge - Dcharge,  \
+                  charge + 2*Dcharge, charge - 2*Dcharge,\
+                  charge + Dcharge/2, charge - Dcharge/2]
+
+    tol     = Dcharge*0.1
+    probes  = []
+    for q in candidates:
+      if (q < chargeMin - tol or q > chargeMax + tol):
+        continue
+      probes.append(min(max(q,chargeMin),chargeMax))
+      if (len(probes) == 2):
+        break
+
+    return probes
+
+  # ----------------------------------
+  def refit(self,lmp,testPart,pe,probe):
+    """
+    Fits the model to the current configuration with energy pe at the
+    current charge of the test object. The energy is probed at two more
+    charges and the charges are restored afterwards.
+
+    lmp      : an initialized lammps simulation
+    testPart : the test object
+    probe    : the pe_probe used for the energies (sim_lmp)
+    """
+    charge = testPart.ee_coord()
+    self.reset()
+    self.add_point(charge, pe)
+    for q_probe in self.probe_charges(charge, testPart.Dcharge, testPart.chargeMin, testPart.chargeMax):
+      testPart.set_lmp_charge(lmp, q_probe)
+      self.add_point(q_probe, probe())
+    testPart.set_lmp_charge(lmp, charge)
+    self.fit()
+
+
+# -------------------------------------------------------------
+class elec_group_model(quad_charge_model):
+  """
+  A quadratic charge-response model built from the electrostatic
+  interactions of the test atoms alone, instead of full force field
+  evaluations.
+
+  The energy computed by 'compute group/group' between a test group 
+  and the rest of the system is L + B*q, and between two test groups
+  L + C*q^2, where L is the charge independent (LJ) part. Evaluating 
+  each compute at two charges of the same configuration cancels L and
+  gives B and C. What is left, the kspace self and background terms of
+  the test atoms, only depends on the charges and the box. It is
+  calibrated against full energy probes once, and again whenever the
+  box volume changes.
+
+  Requires a pair style with a single() method (e.g. lj/cut/coul/long,
+  not the tip4p styles) and a kspace style that supports group/group
+  (ewald, pppm).
+  """
+  computes     = []    # pairs of compute ids (charge 1, charge 2) and the power of q they scale with
+  b_res        = 0.0   # linear    term not captured by the computes (from the calibration)
+  c_res        = 0.0   # quadratic term not captured by the computes (from the calibration)
+  isCalibrated = False # True if b_res and c_res are known for the current box
+  volume       = 0.0   # box volume at the time of the calibration
+  NCalib       = 0     # number of calibrations performed so far
+
+  # ----------------------------------
+  def __init__(self,lmp,testPart):
+    """
+    Defines the test groups and the group/group computes within lammps
+
+    lmp      : an initialized lammps simulation
+    testPart : the test object
+    """
+    quad_charge_model.__init__(self)
+
+    testGroups    = testPart.define_test_groups(lmp)
+    self.computes = []
+
+    # test atoms with the rest of the system scale with q
+    for group in testGroups:
+      self.add_computes(lmp, group, 'ee_rest', 1)
+
+    # test atoms with each other scale with q^2
+    for i in range(len(testGroups)):
+      for j in range(i+1,len(testGroups)):
+        self.add_computes(lmp, testGroups[i], testGroups[j], 2)
+
+    self.isCalibrated = False
+    self.NCalib       = 0
+
+  # ----------------------------------
+  def add_computes(self,lmp,group1,group2,power):
+    """
+    Two identical computes are needed since lammps evaluates
+    a compute only once per timestep
+    """
+    iCmp = len(self.computes)
+    ids  = ("ee_gg%d_1" %iCmp, "ee_gg%d_2" %iCmp)
+    for cmpId in ids:
+      lmp.command("compute %s %s group/group %s pair yes kspace yes" %(cmpId, group1, group2))
+
+    self.computes.append((ids[0], ids[1], power))
+
+  # ----------------------------------
+  def box_volume(self,lmp):
+    """Returns the volume of the simulation box"""
+    boxlo, boxhi, xy, yz, xz, periodicity, box_change = lmp.extract_box()
+    return np.prod(np.array(boxhi) - np.array(boxlo))
+
+  # ----------------------------------
+  def group_coeffs(self,lmp,testPart):
+    """
+    Returns the linear and quadratic coefficients of the electrostatic
+    interactions of the test atoms in the current configuration. The
+    charges of the test atoms are restored before returning.
+    """
+    charge = testPart.ee_coord()
+    q2     = charge - testPart.Dcharge
+    if (q2 < testPart.chargeMin - 0.1*testPart.Dcharge):
+      q2   = charge + testPart.Dcharge
+
+    E1 = [lmp.extract_compute(cmp1,0,0) for (cmp1, cmp2, power) in self.computes]
+    testPart.set_lmp_charge(lmp, q2)
+    E2 = [lmp.extract_compute(cmp2,0,0) for (cmp1, cmp2, power) in self.computes]
+    testPart.set_lmp_charge(lmp, charge)
+
+    coeffs = np.zeros(3,np.double)
+    for iCmp, (cmp1, cmp2, power) in enumerate(self.computes):
+      coeffs[power] += (E2[iCmp] - E1[iCmp]) / (q2**power - charge**power)
+
+    return coeffs[1], coeffs[2]
+
+  # ----------------------------------
+  def calibrate(self,lmp,testPart,pe,probe):
+    """
+    Fits the full model with energy probes and stores the part of
+    b and c that the computes do not capture
+    """
+    quad_charge_model.refit(self,lmp,testPart,pe,probe)
+
+    b_grp, c_grp      = self.group_coeffs(lmp,testPart)
+    self.b_res        = self.b - b_grp
+    self.c_res        = self.c - c_grp
+    self.volume       = self.box_volume(lmp)
+    self.isCalibrated = True
+    self.NCalib      += 1
+
+  # ----------------------------------
+  def refit(self,lmp,testPart,pe,probe):
+    """
+    Fits the model to the current configuration with energy pe at
+    the current charge of the test object
+    """
+    if (not self.isCalibrated or self.box_volume(lmp) != self.volume):
+      self.calibrate(lmp,testPart,pe,probe)
+      return
+
+    charge       = testPart.ee_coord()
+    b_grp, c_grp = self.group_coeffs(lmp,testPart)
+
+    self.b        = b_grp + self.b_res
+    self.c        = c_grp + self.c_res
+    self.a        = pe - self.b*charge - self.c*charge*charge
+    self.charges  = [charge]
+    self.energies = [pe]
+    self.isFitted = True
+    self.NFits   += 1
@@ -0,0 +1,108 @@
+import numpy as np
+
+from ee_mixing import statistical_inefficiency
+
+
+# -------------------------------------------------------------
+# Automatic detection of the end of the equilibration.
+#
+# The equilibration runs in chunks and the potential energy, the
+# temperature and the density are sampled after each of them. For a
+# series of N samples the stationary part is taken to start at the t0
+# that maximizes the effective number of samples after it,
+#
+#     Neff(t0) = (N - t0) / g(t0)
+#
+# with g(t0) the statistical inefficiency of the samples from t0 on
+# (Chodera, J. Chem. Theory Comput. 12, 1799 (2016)). The initial
+# transient inflates g and is discarded, while discarding stationary
+# samples only lowers N - t0. The equilibration is over once, for all
+# the observables, t0 falls in the first half of the series and the
+# samples from t0 on hold NMinEff effective samples.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+def equilibration_start(x,NMaxOrigins=100):
+  """
+  Returns the start t0 of the stationary part of the series x, the
+  statistical inefficiency g of the samples from t0 on and their
+  effective number Neff. At most NMaxOrigins evenly spaced origins are
+  tried. A constant tail counts as stationary with g = 1
+  """
+  N       = len(x)
+  stride  = max(1, (N-4) // NMaxOrigins)
+  best    = (0, 1.0, 0.0)
+  for t0 in range(0, N-3, stride):
+    g = statistical_inefficiency(x[t0:])
+    if (g is None):
+      g = 1.0
+    Neff = (N - t0) / g
+    if (Neff > best[2]):
+      best = (t0, g, Neff)
+
+  return best
+
+# -------------------------------------------------------------
+class equil_monitor():
+  """
+  The observables sampled after each chunk of the equilibration and
+  the test of their stationarity
+  """
+  names       = ('pe', 'temp', 'density')  # the observables, as returned by sim_lmp.thermo_state
+  NStepsChunk = 0     # MD steps between the samples
+  NStepsMin   = 0     # the equilibration lasts at least this many steps
+  NMinEff     = 10    # min effective samples in the stationary part
+  series      = 0     # the sampled observables (NSamples x 3)
+  NSamples    = 0     # number of samples taken
+  starts      = 0     # the last estimate of (t0, g, Neff) of each observable
+
+  # ----------------------------------
+  def __init__(self,NStepsChunk,NStepsMin,NAlloc=256):
+    """
+    NStepsChunk : MD steps between the samples
+    NStepsMin   : the equilibration lasts at least this many steps
+    NAlloc      : (OPTIONAL) initial number of samples the series hold.
+                  It doubles whenever it fills up
+    """
+    self.NStepsChunk = NStepsChunk
+    self.NStepsMin   = NStepsMin
+    self.series      = np.zeros((NAlloc,len(self.names)),np.double)
+    self.NSamples    = 0
+    self.starts      = []
+
+  # ----------------------------------
+  def add(self,values):
+    """Stores the observables sampled after a chunk"""
+    if (self.NSamples == len(self.series)):
+      self.series = np.concatenate((self.series, np.zeros_like(self.series)))
+
+    self.series[self.NSamples] = values
+    self.NSamples += 1
+
+  # ----------------------------------
+  def start(self):
+    """The first sample of the part of the series that is stationary for all the observables"""
+    return max([t0 for t0, g, Neff in self.starts], default=0)
+
+  # ----------------------------------
+  def is_equilibrated(self):
+    """
+    True once the steps run reach NStepsMin and all the observables are
+    stationary over the second half of the samples at least
+    """
+    N = self.NSamples
+    if (N*self.NStepsChunk < self.NStepsMin or N < 2*self.NMinEff):
+      return False
+
+    self.starts = [equilibration_start(self.series[:N,iObs]) for iObs in range(len(self.names))]
+    for t0, g, Neff in self.starts:
+      if (t0 > N//2 or Neff < self.NMinEff):
+        return False
+
+    return True
+
+  # ----------------------------------
+  def report(self):
+    """A line with the start of the stationary part and the inefficiency of each observable"""
+    return ", ".join(["%s from step %d (g %.1f)" %(name, t0*self.NStepsChunk, g) \
+                      for name, (t0, g, Neff) in zip(self.names, self.starts)])
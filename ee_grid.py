@@ -0,0 +1,138 @@
+import numpy as np
+import sys
+
+
+# -------------------------------------------------------------
+# Feedback optimization of the positions of the sub-ensembles.
+#
+# The nodes of the ee coordinate are moved so that a "length" is the
+# same between all neighboring nodes. Within a gap of width dq the
+# length is estimated from the statistics gathered over the last
+# period and the nodes are placed at equal increments of the length
+# accumulated from the first node (piecewise linear in between):
+#
+#   acceptance : length ~ sqrt(-ln acc), acc the mean acceptance of
+#                the moves across the gap. For close nodes -ln acc
+#                grows as dq^2, so equal lengths equalize acc.
+#   roundtrip  : length ~ sqrt(|df|), f the fraction of visits made
+#                by a walker that came from the first node rather
+#                than the last. This is the feedback of Trebst, Huse
+#                and Troyer, which places the nodes at a density
+#                eta ~ sqrt(eta_old * df/dq) to minimize the round
+#                trip time between the ends of the ee coordinate.
+#
+# The first and last nodes do not move.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+class grid_feedback():
+  """
+  The acceptance and round trip statistics of the sub-ensembles and
+  the feedback that moves the nodes of the ee histogram
+  """
+  method     = 'acceptance'  # acceptance or roundtrip
+  NStepsAdapt= 0             # the nodes are moved every this many production steps
+  NAdapt     = 0             # number of times the nodes are moved
+  NDone      = 0             # number of times the nodes were moved so far
+  NMinData   = 10            # min attempts across each gap (visits of each node) before moving the nodes
+  accSum     = 0.0           # sum of the acceptance probabilities of the attempts across each gap
+  NAtt       = 0             # attempts across each gap
+  label      = 0             # +1 if the walker came from the first node, -1 from the last, 0 neither yet
+  NUp        = 0             # visits of each node with label +1
+  NDown      = 0             # visits of each node with label -1
+
+  # ----------------------------------
+  def __init__(self,NSubs,method,NStepsAdapt,NAdapt):
+    """
+    NSubs       : number of nodes (sub-ensembles)
+    method      : acceptance or roundtrip (see above)
+    NStepsAdapt : the nodes are moved every this many production steps
+    NAdapt      : number of times the nodes are moved. The grid is
+                  fixed afterwards
+    """
+    if (method != 'acceptance' and method != 'roundtrip'):
+      sys.exit('grid_feedback.__init__ : ERROR - Unknown feedback %s (use acceptance or roundtrip)' %method)
+
+    self.method      = method
+    self.NStepsAdapt = NStepsAdapt
+    self.NAdapt      = NAdapt
+    self.NDone       = 0
+    self.label       = 0
+    self.accSum      = np.zeros(NSubs-1,np.double)
+    self.NAtt        = np.zeros(NSubs-1,np.int64)
+    self.NUp         = np.zeros(NSubs,np.int64)
+    self.NDown       = np.zeros(NSubs,np.int64)
+
+  # ----------------------------------
+  def active(self):
+    """True while the nodes are still being moved"""
+    return (self.NDone < self.NAdapt)
+
+  # ----------------------------------
+  def reset(self):
+    """Drops the statistics (done after the nodes are moved)"""
+    self.accSum[:] = 0.0
+    self.NAtt  [:] = 0
+    self.NUp   [:] = 0
+    self.NDown [:] = 0
+
+  # ----------------------------------
+  def log_attempt(self,i_sub,iDir,accProb):
+    """Logs an attempt from i_sub to a neighbor (iDir = +/-1) accepted with probability accProb"""
+    iGap               = min(i_sub, i_sub+iDir)
+    self.accSum[iGap] += accProb
+    self.NAtt  [iGap] += 1
+
+  # ----------------------------------
+  def log_visit(self,i_sub):
+    """Logs a visit of i_sub and labels the walker when it reaches an end"""
+    if   (i_sub == 0):
+      self.label = +1
+    elif (i_sub == len(self.NUp)-1):
+      self.label = -1
+
+    if   (self.label == +1):
+      self.NUp  [i_sub] += 1
+    elif (self.label == -1):
+      self.NDown[i_sub] += 1
+
+  # ----------------------------------
+  def gap_lengths(self):
+    """
+    Returns the length of each gap estimated from the statistics, or
+    None if some gap (node) has not been sampled enough yet
+    """
+    if (self.method == 'acceptance'):
+      if (np.any(self.NAtt < self.NMinData)):
+        return None
+      acc     = np.clip(self.accSum / self.NAtt, 1.e-12, 1.0)
+      lengths = np.sqrt(-np.log(acc))
+    else:
+      NLabeled = self.NUp + self.NDown
+      if (np.any(NLabeled < self.NMinData) or np.sum(self.NUp) == 0 or np.sum(self.NDown) == 0):
+        return None
+      f       = self.NUp / NLabeled
+      lengths = np.sqrt(np.abs(np.diff(f)))
+
+    # gaps that look free keep a small length, so nodes never merge
+    return np.maximum(lengths, 0.01*np.mean(lengths) + 1.e-12)
+
+  # ----------------------------------
+  def new_nodes(self,nodes):
+    """
+    Returns the nodes moved to equal lengths, or None if there are not
+    enough statistics yet. The statistics are kept in the latter case.
+    """
+    lengths = self.gap_lengths()
+    if (lengths is None):
+      return None
+
+    cumLength = np.concatenate(([0.0], np.cumsum(lengths)))
+    targets   = np.linspace(0.0, cumLength[-1], len(nodes))
+    moved     = np.interp(targets, cumLength, nodes)
+    moved[0]  = nodes[0]
+    moved[-1] = nodes[-1]
+
+    self.NDone += 1
+    self.reset()
+    return moved
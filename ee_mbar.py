@@ -0,0 +1,208 @@
+import numpy as np
+import sys
+
+
+# -------------------------------------------------------------
+# Multistate Bennett acceptance ratio (MBAR) estimates of the free
+# energies of the sub-ensembles.
+#
+# With a charge model (ee_energy quadratic/partial) the energy of every
+# sampled configuration is known in every sub-ensemble, E(q) = a + b*q
+# + c*q^2. The constant a cancels in MBAR, so each sample is stored as
+# the sub-ensemble it was sampled in and its b and c. The reduced
+# energies u[k,n] = Beta*(b[n]*q[k] + c[n]*q[k]^2) are rebuilt when the
+# free energies are solved for.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+class mbar_samples():
+  """
+  The configurations sampled at the end of the MD segments, stored as
+  the sub-ensemble they were sampled in and the coefficients of their
+  energy as a function of the ee coordinate
+  """
+  coords   = 0.0   # ee coordinate of each sub-ensemble
+  Beta     = 0.0   # thermodynamic beta (1/kT) of the energies
+  NSamples = 0     # number of samples stored
+  iSub     = 0     # sub-ensemble each sample was drawn in
+  coeffs   = 0.0   # linear and quadratic energy coefficients (b,c) of each sample
+
+  # ----------------------------------
+  def __init__(self,coords,Beta,NAlloc=1024):
+    """
+    coords : the ee coordinate of each sub-ensemble
+    Beta   : thermodynamic beta (1/kT) in the energy units of the samples
+    NAlloc : (OPTIONAL) number of samples the arrays initially hold. They
+             double in size whenever they fill up
+    """
+    self.coords   = np.asarray(coords,np.double)
+    self.Beta     = Beta
+    self.NSamples = 0
+    self.iSub     = np.zeros(NAlloc,np.int32)
+    self.coeffs   = np.zeros((NAlloc,2),np.double)
+
+  # ----------------------------------
+  def add(self,iSub,b,c):
+    """Stores a configuration sampled in sub-ensemble iSub with energy a + b*q + c*q^2"""
+    if (self.NSamples == len(self.iSub)):
+      self.iSub   = np.concatenate((self.iSub,   np.zeros_like(self.iSub  )))
+      self.coeffs = np.concatenate((self.coeffs, np.zeros_like(self.coeffs)))
+
+    self.iSub  [self.NSamples] = iSub
+    self.coeffs[self.NSamples] = (b, c)
+    self.NSamples += 1
+
+  # ----------------------------------
+  def arrays(self):
+    """Returns the sub-ensembles and the coefficients of the stored samples"""
+    return self.iSub[:self.NSamples], self.coeffs[:self.NSamples]
+
+  # ----------------------------------
+  def set_arrays(self,iSub,coeffs):
+    """Replaces the stored samples (e.g. from a checkpoint)"""
+    self.NSamples = 0
+    self.iSub     = np.zeros(max(len(iSub),1024),np.int32)
+    self.coeffs   = np.zeros((len(self.iSub),2),np.double)
+    self.iSub  [:len(iSub)] = iSub
+    self.coeffs[:len(iSub)] = coeffs
+    self.NSamples = len(iSub)
+
+
+# -------------------------------------------------------------
+def reduced_energies(coords,Beta,iSub,coeffs):
+  """
+  Returns the reduced energies u[k,n] of the samples n in the
+  sub-ensembles k and the number of samples drawn in each sub-ensemble
+  """
+  q   = np.asarray(coords,np.double)[:,None]
+  u   = Beta * (coeffs[:,0][None,:]*q + coeffs[:,1][None,:]*q*q)
+  N_k = np.bincount(iSub, minlength=len(coords))
+
+  return u, N_k
+
+# -------------------------------------------------------------
+def logsumexp(x,axis):
+  """log(sum(exp(x))) over axis without overflow"""
+  xMax = np.max(x,axis=axis,keepdims=True)
+  return np.squeeze(xMax,axis=axis) + np.log(np.sum(np.exp(x - xMax),axis=axis))
+
+# -------------------------------------------------------------
+def mbar_weights(u,N_k,f):
+  """
+  Returns the normalized MBAR weights W[n,k] of the samples in the
+  sub-ensembles. Sub-ensembles without samples do not enter the mixture
+  """
+  sampled = (N_k > 0)
+  logMix  = logsumexp(np.log(N_k[sampled])[:,None] + f[sampled][:,None] - u[sampled], axis=0)
+  return np.exp(f[None,:] - u.T - logMix[:,None])
+
+# -------------------------------------------------------------
+def mbar_solve(u,N_k,f_init=None,tol=1.e-10,NIterMax=500):
+  """
+  Solves the MBAR equations for the reduced free energies f[k] of the
+  sub-ensembles (f[0] = 0). A few self-consistent iterations are
+  followed by Newton-Raphson steps, which fall back to self-consistent
+  iterations if they do not reduce the gradient.
+
+  u      : reduced energies u[k,n] of the samples in the sub-ensembles
+  N_k    : number of samples drawn in each sub-ensemble
+  f_init : (OPTIONAL) initial guess, e.g. the estimate of a previous call
+  """
+  NSubs   = len(N_k)
+  sampled = (N_k > 0)
+  if (np.sum(N_k) == 0):
+    sys.exit('mbar_solve : ERROR - No samples to solve for')
+
+  f = np.zeros(NSubs,np.double)
+  if (f_init is not None):
+    f = np.array(f_init,np.double)
+
+  def self_consistent(f):
+    logMix = logsumexp(np.log(N_k[sampled])[:,None] + f[sampled][:,None] - u[sampled], axis=0)
+    f_new  = -logsumexp(-u - logMix[None,:], axis=1)
+    return f_new - f_new[0]
+
+  def gradient(f):
+    W = mbar_weights(u,N_k,f)
+    return W, N_k * (1.0 - np.sum(W,axis=0))
+
+  for iIter in range(10):
+    f = self_consistent(f)
+
+  # Newton steps over the sampled sub-ensembles, but the first of them
+  iFree = np.nonzero(sampled)[0][1:]
+
+  W, grad = gradient(f)
+  for iIter in range(NIterMax):
+    if (len(iFree) == 0 or np.max(np.abs(grad[iFree])) < tol*np.sum(N_k)):
+      break
+
+    # Hessian of the MBAR objective
+    NW   = W * N_k[None,:]
+    hess = NW.T @ NW - np.diag(np.sum(NW,axis=0))
+    try:
+      f_new         = np.copy(f)
+      f_new[iFree] -= np.linalg.solve(hess[np.ix_(iFree,iFree)], grad[iFree])
+    except np.linalg.LinAlgError:
+      f_new = self_consistent(f)
+
+    W_new, grad_new = gradient(f_new)
+    if (not np.all(np.isfinite(grad_new)) or np.max(np.abs(grad_new)) > np.max(np.abs(grad))):
+      f_new = self_consistent(f)
+      W_new, grad_new = gradient(f_new)
+
+    f, W, grad = f_new, W_new, grad_new
+
+  # a last pass gives the sub-ensembles without samples
+  f = self_consistent(f)
+  return f - f[0]
+
+# -------------------------------------------------------------
+def mbar_covariance(u,N_k,f):
+  """
+  Returns the asymptotic covariance matrix Theta of the reduced free
+  energies, Theta = W^T (I - W N W^T)^+ W, evaluated through the thin
+  SVD of the weight matrix W = U S V^T as
+
+      Theta = V S (I - S V^T N V S)^+ S V^T
+
+  which only involves NSubs x NSubs matrices. The samples are assumed
+  to be uncorrelated.
+  """
+  W       = mbar_weights(u,N_k,f)
+  U, S, Vt = np.linalg.svd(W, full_matrices=False)
+  SVt     = S[:,None] * Vt
+  inner   = np.eye(len(S)) - SVt @ np.diag(N_k.astype(np.double)) @ SVt.T
+
+  return SVt.T @ np.linalg.pinv(inner) @ SVt
+
+# -------------------------------------------------------------
+def mbar_estimate(samples: mbar_samples,f_init=None):
+  """
+  Returns the reduced free energies of the sub-ensembles relative to
+  the first one, their standard errors and the number of samples of
+  each sub-ensemble
+  """
+  iSub, coeffs = samples.arrays()
+  u, N_k       = reduced_energies(samples.coords, samples.Beta, iSub, coeffs)
+
+  f     = mbar_solve(u, N_k, f_init)
+  theta = mbar_covariance(u, N_k, f)
+  var   = np.diag(theta) + theta[0,0] - 2.0*theta[:,0]
+  err   = np.sqrt(np.maximum(var,0.0))
+
+  return f, err, N_k
+
+# -------------------------------------------------------------
+def write_mbar(coords,f,err,N_k,tag,file):
+  """Writes the MBAR free energies of the sub-ensembles in a file"""
+  file.write("# %s\n" %tag)
+  file.write("# MBAR from %d samples - dF(last-first) = %.4f +/- %.4f kT\n" %(np.sum(N_k), f[-1] - f[0], err[-1]))
+  file.write("#\n")
+  file.write("#   subEnsCoord      NSamples        F (kT)      err(F)\n")
+  file.write("#\n")
+  for i_sub in range(len(coords)):
+    file.write('%12.3f %14d %16.5f %12.5f\n' %(coords[i_sub], N_k[i_sub], f[i_sub], err[i_sub]))
+
+  file.write("\n")
+  file.flush()
@@ -0,0 +1,224 @@
+import numpy as np
+
+
+# -------------------------------------------------------------
+# Diagnostics of how well the walker mixes over the sub-ensembles.
+#
+# The sub-ensemble index is logged after the attempts of every MD
+# segment. From this trajectory the driver reports
+#
+#   round trips  : the MD steps between a visit of the first
+#                  sub-ensemble and the next one that follows a
+#                  visit of the last. They set how fast the free
+#                  energy estimates converge.
+#   acceptance   : of the moves to the neighboring sub-ensembles
+#   diffusivity  : D = <dq^2> / (2 dt) of the ee coordinate over one
+#                  segment, for each sub-ensemble the segment started in
+#   inefficiency : g = 1 + 2 sum_t (1 - t/N) C(t) of the index series,
+#                  the number of segments per independent sample
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+class mixing_diagnostics():
+  """
+  The trajectory of the sub-ensemble index and the mixing diagnostics
+  derived from it
+  """
+  nodes      = 0.0   # ee coordinate of each sub-ensemble (shared with the ee histo)
+  NSteps_seg = 0     # MD steps per segment (time between the logged indices)
+  series     = 0     # sub-ensemble index after each segment
+  NLogged    = 0     # number of indices logged
+  NAtt       = 0     # attempts to the left/right neighbor of each sub-ensemble (NSubs x 2)
+  NAcc       = 0     # accepted attempts to the left/right neighbor (NSubs x 2)
+  sumDq2     = 0.0   # sum of the squared displacements of the ee coordinate over a segment
+  NDq        = 0     # number of segments started in each sub-ensemble
+  lastEnd    = -1    # last end visited: -1 none yet, 0 first, 1 last
+  tripStart  = -1    # step the current round trip started at (-1 none yet)
+  NTrips     = 0     # round trips completed
+  tripSteps  = 0     # MD steps of all the completed round trips
+
+  # ----------------------------------
+  def __init__(self,nodes,NSteps_seg,NAlloc=1024):
+    """
+    nodes      : the ee coordinate of each sub-ensemble
+    NSteps_seg : MD steps between the logged indices
+    NAlloc     : (OPTIONAL) initial length of the index series. It
+                 doubles whenever it fills up
+    """
+    NSubs           = len(nodes)
+    self.nodes      = nodes
+    self.NSteps_seg = NSteps_seg
+    self.series     = np.zeros(NAlloc,np.int32)
+    self.NLogged    = 0
+    self.NAtt       = np.zeros((NSubs,2),np.int64)
+    self.NAcc       = np.zeros((NSubs,2),np.int64)
+    self.sumDq2     = np.zeros(NSubs,np.double)
+    self.NDq        = np.zeros(NSubs,np.int64)
+    self.lastEnd    = -1
+    self.tripStart  = -1
+    self.NTrips     = 0
+    self.tripSteps  = 0
+
+  # ----------------------------------
+  def log_attempt(self,i_sub,iDir,accepted):
+    """Logs an attempt from i_sub to a neighbor (iDir = +/-1)"""
+    iSide = int(iDir > 0)
+    self.NAtt[i_sub,iSide] += 1
+    if (accepted):
+      self.NAcc[i_sub,iSide] += 1
+
+  # ----------------------------------
+  def log_segment(self,iSub_start,iSub_end,NStepsRan):
+    """
+    Logs the sub-ensemble a segment started in and the one its attempts
+    ended in, at production step NStepsRan
+    """
+    dq                       = self.nodes[iSub_end] - self.nodes[iSub_start]
+    self.sumDq2[iSub_start] += dq*dq
+    self.NDq   [iSub_start] += 1
+
+    if (self.NLogged == len(self.series)):
+      self.series = np.concatenate((self.series, np.zeros_like(self.series)))
+    self.series[self.NLogged] = iSub_end
+    self.NLogged += 1
+
+    if   (iSub_end == 0):
+      if (self.lastEnd == 1 and self.tripStart >= 0):
+        self.NTrips    += 1
+        self.tripSteps += NStepsRan - self.tripStart
+      if (self.lastEnd != 0):
+        self.tripStart  = NStepsRan
+      self.lastEnd      = 0
+    elif (iSub_end == len(self.nodes)-1):
+      self.lastEnd      = 1
+
+  # ----------------------------------
+  def reset_local(self):
+    """Drops the statistics tied to the positions of the sub-ensembles (after they are moved)"""
+    self.NAtt  [:,:] = 0
+    self.NAcc  [:,:] = 0
+    self.sumDq2[:]   = 0.0
+    self.NDq   [:]   = 0
+
+  # ----------------------------------
+  def set_segment(self,NSteps_seg):
+    """Changes the MD steps between the logged indices. The local statistics start over"""
+    self.NSteps_seg = NSteps_seg
+    self.reset_local()
+
+  # ----------------------------------
+  def round_trip(self):
+    """The mean round trip time in MD steps, or None before the first round trip"""
+    if (self.NTrips == 0):
+      return None
+    return self.tripSteps / self.NTrips
+
+  # ----------------------------------
+  def acceptance(self):
+    """The acceptance of the moves to the left/right neighbor of each sub-ensemble (nan if never attempted)"""
+    acc = np.full(self.NAtt.shape, np.nan)
+    np.divide(self.NAcc, self.NAtt, out=acc, where=(self.NAtt > 0))
+    return acc
+
+  # ----------------------------------
+  def diffusivity(self):
+    """The local diffusivity of the ee coordinate (coord^2 per MD step, nan if never started in)"""
+    D = np.full(len(self.NDq), np.nan)
+    np.divide(self.sumDq2, 2.0*self.NSteps_seg*self.NDq, out=D, where=(self.NDq > 0))
+    return D
+
+  # ----------------------------------
+  def inefficiency(self):
+    """The statistical inefficiency of the index series in segments (see statistical_inefficiency)"""
+    return statistical_inefficiency(self.series[:self.NLogged])
+
+  # ----------------------------------
+  def summary(self):
+    """The global diagnostics as a dictionary"""
+    return {'NTrips'      : self.NTrips,
+            'round_trip'  : self.round_trip(),
+            'inefficiency': self.inefficiency()}
+
+  # ----------------------------------
+  def arrays(self):
+    """Returns the state of the diagnostics as arrays (e.g. for a checkpoint)"""
+    return {'series' : self.series[:self.NLogged],
+            'NAtt'   : self.NAtt,
+            'NAcc'   : self.NAcc,
+            'sumDq2' : self.sumDq2,
+            'NDq'    : self.NDq,
+            'trips'  : np.array([self.lastEnd, self.tripStart, self.NTrips, self.tripSteps], np.int64)}
+
+  # ----------------------------------
+  def set_arrays(self,state):
+    """Restores the state returned by arrays()"""
+    series          = state['series']
+    self.series     = np.zeros(max(len(series),1024),np.int32)
+    self.series[:len(series)] = series
+    self.NLogged    = len(series)
+    self.NAtt[:,:]  = state['NAtt']
+    self.NAcc[:,:]  = state['NAcc']
+    self.sumDq2[:]  = state['sumDq2']
+    self.NDq[:]     = state['NDq']
+    self.lastEnd, self.tripStart, self.NTrips, self.tripSteps = [int(n) for n in state['trips']]
+
+  # ----------------------------------
+  def write(self,tag,file):
+    """Writes the mixing diagnostics in a file"""
+    roundTrip = self.round_trip()
+    g         = self.inefficiency()
+    acc       = self.acceptance()
+    D         = self.diffusivity()
+
+    TripString = "no round trip yet"
+    if (roundTrip is not None):
+      TripString = "mean round trip %.0f steps (%d round trips)" %(roundTrip, self.NTrips)
+
+    IneffString = "not available yet"
+    if (g is not None):
+      IneffString = "%.2f segments (%.0f steps) over %d segments" %(g, g*self.NSteps_seg, self.NLogged)
+
+    file.write("# %s\n" %tag)
+    file.write("# %s\n" %TripString)
+    file.write("# statistical inefficiency of the sub-ensemble index: %s\n" %IneffString)
+    file.write("#\n")
+    file.write("#   subEnsCoord    acc(left)   acc(right)   D(coord^2/step)     segments\n")
+    file.write("#\n")
+    for i_sub in range(len(self.nodes)):
+      file.write('%12.3f %12.4f %12.4f %17.4e %12d\n' \
+               %(self.nodes[i_sub], acc[i_sub,0], acc[i_sub,1], D[i_sub], self.NDq[i_sub]))
+
+    file.write("\n")
+    file.flush()
+
+
+# -------------------------------------------------------------
+def statistical_inefficiency(x):
+  """
+  Returns the statistical inefficiency g = 1 + 2 sum_t (1 - t/N) C(t)
+  of the series x, i.e. the number of its points per independent
+  sample, or None if it is too short or constant. The autocorrelation
+  C(t) is summed until it first drops to zero
+  """
+  N = len(x)
+  if (N < 4):
+    return None
+
+  x = np.asarray(x,np.double)
+  if (np.all(x == x[0])):
+    return None
+  x = x - np.mean(x)
+
+  # autocorrelation through a zero-padded FFT
+  NFFT = 1 << int(np.ceil(np.log2(2*N)))
+  Fx   = np.fft.rfft(x, NFFT)
+  C    = np.fft.irfft(Fx*np.conj(Fx), NFFT)[:N] / np.arange(N,0,-1)
+  C   /= C[0]
+
+  g = 1.0
+  for t in range(1,N):
+    if (C[t] <= 0.0):
+      break
+    g += 2.0 * C[t] * (1.0 - t/N)
+
+  return g
@@ -0,0 +1,82 @@
+import numpy as np
+import sys
+
+from mpi4py import MPI
+
+
+# -------------------------------------------------------------
+class ee_rng():
+  """
+  Provides the random numbers of the sub-ensemble attempts to all
+  the mpi ranks, so that every rank takes identical decisions.
+
+  Two modes are supported:
+    bcast      - rank 0 draws the numbers and broadcasts them in a
+                 single packed message per call
+    replicated - every rank draws the same numbers from a counter
+                 based (Philox) stream keyed with the same seed.
+                 Nothing is communicated.
+
+  In the replicated mode the decisions of all the ranks can be
+  cross-checked with check_consistency(), which packs the state
+  to be compared in a single message.
+  """
+  mode     = 'bcast'   # bcast or replicated
+  NDrawn   = 0         # number of random numbers drawn so far
+  NCheck   = 0         # check consistency every this many calls of check_consistency (0 = never)
+  NCalls   = 0         # number of calls of check_consistency
+
+  # ----------------------------------
+  def __init__(self,comm,ISeed,mode='bcast',NCheck=0):
+    """
+    comm   : the mpi communicator
+    ISeed  : the seed of the stream (same on all ranks)
+    mode   : bcast or replicated
+    NCheck : (OPTIONAL) cross-check the ranks every this many calls
+             of check_consistency
+    """
+    if (not mode == 'bcast') and (not mode == 'replicated'):
+      sys.exit('ee_rng.__init__ : ERROR - Unknown synchronization mode %s' %mode)
+
+    self.comm   = comm
+    self.mode   = mode
+    self.NCheck = NCheck
+    self.NDrawn = 0
+    self.NCalls = 0
+    self.gen    = np.random.Generator(np.random.Philox(key=ISeed))
+
+  # ----------------------------------
+  def draw(self,NRand):
+    """Returns NRand uniform random numbers in [0,1), identical on all ranks"""
+    self.NDrawn += NRand
+
+    if (self.mode == 'replicated'):
+      return self.gen.random(NRand)
+
+    rand = np.zeros(NRand,np.double)
+    if (self.comm.Get_rank() == 0):
+      rand[:] = self.gen.random(NRand)
+    self.comm.Bcast(rand,root=0)
+
+    return rand
+
+  # ----------------------------------
+  def check_consistency(self,state):
+    """
+    Every NCheck calls compares 'state' (a list of numbers, e.g. the
+    current sub-ensemble index) across all the ranks with a single
+    message and exits if the ranks have diverged
+    """
+    self.NCalls += 1
+    if (self.NCheck <= 0 or np.mod(self.NCalls,self.NCheck) != 0):
+      return
+
+    vals    = np.array(list(state) + [self.NDrawn], np.double)
+    packed  = np.concatenate((vals, -vals))
+    reduced = np.zeros_like(packed)
+    self.comm.Allreduce(packed,reduced,op=MPI.MIN)
+
+    # min(x) == max(x) only if x is the same on all ranks
+    NVals = len(vals)
+    if (np.any(reduced[:NVals] != -reduced[NVals:])):
+      sys.exit('ee_rng.check_consistency : ERROR - The mpi ranks have diverged')
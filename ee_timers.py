@@ -0,0 +1,161 @@
+import json
+import numpy as np
+import sys
+import time
+
+from contextlib import contextmanager
+
+
+# -------------------------------------------------------------
+class phase_timers():
+  """
+  Wall clock timers for the phases of the expanded ensemble loop
+  (MD segments, energy probes, barriers, output ...). Each phase
+  accumulates its total time and the number of times it was timed.
+  Phases may be nested, in which case the totals are inclusive.
+
+  The overhead is a perf_counter() call at each start and stop, so
+  the timers can be left on in production.
+  """
+  totals  = {}   # total time (s) spent in each phase
+  counts  = {}   # number of times each phase was timed
+  started = {}   # start time of the phases currently running
+
+  # ----------------------------------
+  def __init__(self):
+    self.totals  = {}
+    self.counts  = {}
+    self.started = {}
+    self.tInit   = time.perf_counter()
+
+  # ----------------------------------
+  def start(self,name):
+    """Starts timing phase name"""
+    self.started[name] = time.perf_counter()
+
+  # ----------------------------------
+  def stop(self,name):
+    """Stops timing phase name and adds the elapsed time to its total"""
+    if (name not in self.started):
+      sys.exit('phase_timers.stop : ERROR - Phase %s was not started' %name)
+
+    elapsed           = time.perf_counter() - self.started.pop(name)
+    self.totals[name] = self.totals.get(name,0.0) + elapsed
+    self.counts[name] = self.counts.get(name,0)   + 1
+
+  # ----------------------------------
+  @contextmanager
+  def phase(self,name):
+    """Times the enclosed block as phase name ('with timers.phase(name):')"""
+    self.start(name)
+    try:
+      yield
+    finally:
+      self.stop(name)
+
+  # ----------------------------------
+  def wall_time(self):
+    """Time (s) since the timers were created"""
+    return time.perf_counter() - self.tInit
+
+
+# -------------------------------------------------------------
+class counting_lammps():
+  """
+  A proxy of a lammps instance that counts the calls of every method
+  of the lammps python API (command, set_variable, extract_compute ...)
+  and forwards them to the wrapped instance.
+  """
+  NCalls = {}   # number of calls of each method
+
+  # ----------------------------------
+  def __init__(self,lmp,NCalls=None):
+    """
+    lmp    : the lammps instance to wrap
+    NCalls : (OPTIONAL) a dictionary of counts to continue from, e.g.
+             shared with the proxy of a previous lammps instance
+    """
+    self.lmp    = lmp
+    self.NCalls = NCalls
+    if (NCalls is None):
+      self.NCalls = {}
+
+  # ----------------------------------
+  def __getattr__(self,name):
+    """Only called for names not found in the proxy, i.e. the lammps API"""
+    if (name == 'lmp'):
+      raise AttributeError(name) # not initialized yet (e.g. while copying)
+
+    attr = getattr(self.lmp,name)
+    if (not callable(attr)):
+      return attr
+
+    def counted(*args,**kwargs):
+      self.NCalls[name] = self.NCalls.get(name,0) + 1
+      return attr(*args,**kwargs)
+
+    setattr(self,name,counted) # later calls skip __getattr__
+    return counted
+
+
+# -------------------------------------------------------------
+def gather_timing(comm,timers: phase_timers,NCalls,NStepsRan,iWalker=0):
+  """
+  Gathers the timers and the lammps call counts of all the ranks of
+  comm on rank 0. Has to be called by all the ranks of comm. Returns
+  the list of per rank entries on rank 0 and None on the rest.
+  iWalker is the partition (walker or window) the rank belongs to.
+  """
+  entry = {'rank'     : comm.Get_rank(),
+           'walker'   : int(iWalker),
+           'NStepsRan': int(NStepsRan),
+           'wall'     : timers.wall_time(),
+           'totals'   : dict(timers.totals),
+           'counts'   : dict(timers.counts),
+           'NCalls'   : dict(NCalls)}
+
+  return comm.gather(entry, root=0)
+
+# -------------------------------------------------------------
+def write_timing(FileName,entries):
+  """
+  Writes the gathered timing entries in a json file, or in a csv
+  file (one row per rank and phase or lammps call) if FileName
+  ends with .csv. The file is overwritten with every export.
+  """
+  if (not FileName.endswith('.csv')):
+    with open(FileName,"w") as TimingFile:
+      json.dump(entries, TimingFile, indent=1)
+    return
+
+  with open(FileName,"w") as TimingFile:
+    TimingFile.write("rank,walker,NStepsRan,kind,name,total_s,count\n")
+    for entry in entries:
+      for name in sorted(entry['totals']):
+        TimingFile.write("%d,%d,%d,phase,%s,%.6f,%d\n" \
+          %(entry['rank'], entry['walker'], entry['NStepsRan'], name, entry['totals'][name], entry['counts'][name]))
+      for name in sorted(entry['NCalls']):
+        TimingFile.write("%d,%d,%d,lammps,%s,,%d\n" \
+          %(entry['rank'], entry['walker'], entry['NStepsRan'], name, entry['NCalls'][name]))
+
+# -------------------------------------------------------------
+def timing_summary(entries):
+  """
+  Returns a table with the min/mean/max time over the ranks for each
+  phase and the lammps call counts of rank 0. A large spread in the
+  wait phases (barriers, broadcasts) points to load imbalance.
+  """
+  wall   = np.mean([entry['wall'] for entry in entries])
+  names  = sorted(set(name for entry in entries for name in entry['totals']))
+  lines  = ["Timing summary - %d ranks - wall time %.2f s" %(len(entries), wall),
+            "%-16s %12s %12s %12s %8s %12s" %("phase", "min (s)", "mean (s)", "max (s)", "% wall", "calls")]
+
+  for name in names:
+    totals = np.array([entry['totals'].get(name,0.0) for entry in entries])
+    lines.append("%-16s %12.3f %12.3f %12.3f %8.1f %12d" \
+      %(name, np.min(totals), np.mean(totals), np.max(totals), 100.0*np.mean(totals)/wall, entries[0]['counts'].get(name,0)))
+
+  NCalls = entries[0]['NCalls']
+  lines.append("lammps calls (rank 0): " + ", ".join("%s %d" %(name, NCalls[name]) for name in sorted(NCalls)))
+
+  return "\n".join(lines)
@@ -0,0 +1,173 @@
+import numpy as np
+
+from ee_mixing import statistical_inefficiency
+
+
+# -------------------------------------------------------------
+# Automatic choice of the MD segment length between attempts.
+#
+# An attempt every n MD steps costs c(n) = n*tStep + tFixed of wall
+# time, with tFixed the cost of the attempt (and of the setup of a
+# separate lammps run per segment). Consecutive attempts see
+# correlated configurations. With an exponential decorrelation of
+# the energy difference dE of the attempts, rho(n) = exp(-n/tau), the
+# statistical inefficiency of attempts n steps apart is
+#
+#     g(n) = (1 + rho(n)) / (1 - rho(n))
+#
+# and the segment length maximizes the independent attempts per
+# wall second, 1 / (g(n) * c(n)). Only divisors of the intervals the
+# run is organized in (checkpoints, output, merges ...) are
+# considered, so all of them stay multiples of the segment length.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+def divisors(N):
+  """The divisors of N in increasing order"""
+  small = [n for n in range(1, int(np.sqrt(N))+1) if (N % n == 0)]
+  return sorted(set(small + [N // n for n in small]))
+
+# -------------------------------------------------------------
+class segment_tuner():
+  """
+  Measures the decorrelation of the energy difference of the attempts
+  and the costs of the MD and of the attempts, and picks the MD segment
+  length accordingly
+  """
+  NStepsProbe  = 0     # MD steps between the probes of the equilibration
+  NStepsRetune = 0     # retune every this many production steps (0 = never)
+  candidates   = []    # the segment lengths to choose from
+  tSetup       = 0.0   # wall time (s) of the setup of a lammps run
+  NMinPairs    = 20    # min pairs of consecutive attempts to retune
+  lastKey      = None  # sub-ensemble and direction of the last logged attempt
+  lastStep     = -1    # production step of the last logged attempt
+  lastDE       = 0.0   # energy difference of the last logged attempt
+  pairs        = {}    # consecutive energy differences of the attempts, by sub-ensemble and direction
+  wallStart    = 0.0   # wall time at the start of the retune period
+  mdStart      = 0.0   # MD wall time at the start of the retune period
+  stepStart    = 0     # production step at the start of the retune period
+
+  # ----------------------------------
+  def __init__(self,NStepsProbe,NStepsRetune,NStepsBase):
+    """
+    NStepsProbe  : MD steps between the probes of the equilibration
+    NStepsRetune : retune every this many production steps (0 = never)
+    NStepsBase   : the segment length has to divide this many steps
+    """
+    self.NStepsProbe  = NStepsProbe
+    self.NStepsRetune = NStepsRetune
+    self.candidates   = divisors(NStepsBase)
+    self.tSetup       = 0.0
+    self.reset()
+
+  # ----------------------------------
+  def reset(self):
+    """Drops the attempts logged so far"""
+    self.lastKey  = None
+    self.lastStep = -1
+    self.lastDE   = 0.0
+    self.pairs    = {}
+
+  # ----------------------------------
+  def best_length(self,tau,tStep,tFixed):
+    """
+    The candidate segment length with the most independent attempts
+    per wall second, given the correlation time tau (MD steps) of the
+    energy differences, the wall time of an MD step and the fixed
+    wall time of each segment
+    """
+    n   = np.array(self.candidates,np.double)
+    rho = np.exp(-n / max(tau,1.e-12))
+    g   = (1.0 + rho) / np.maximum(1.0 - rho, 1.e-300)
+    return int(n[np.argmax(1.0 / (g * (n*tStep + tFixed)))])
+
+  # ----------------------------------
+  def tau_of_series(self,dE,dt):
+    """
+    The correlation time (MD steps) of the energy differences dE probed
+    every dt steps, assuming an exponential decorrelation
+    """
+    g = statistical_inefficiency(dE)
+    if (g is None or g <= 1.0):
+      return 0.5*dt # no correlation is resolved at the probed interval
+
+    rho = (g - 1.0) / (g + 1.0)
+    return -dt / np.log(rho)
+
+  # ----------------------------------
+  def log_attempt(self,NStepsRan,NSteps_seg,key,dE):
+    """
+    Logs the energy difference dE of the first attempt of the segment
+    that ended at production step NStepsRan. Attempts of consecutive
+    segments from the same sub-ensemble in the same direction (key)
+    are paired to measure their correlation.
+    """
+    if (key == self.lastKey and NStepsRan - self.lastStep == NSteps_seg):
+      self.pairs.setdefault(key,[]).append((self.lastDE, dE))
+
+    self.lastKey  = key
+    self.lastStep = NStepsRan
+    self.lastDE   = dE
+
+  # ----------------------------------
+  def lag_correlation(self):
+    """
+    The correlation of the energy differences of consecutive segments,
+    centered on the means of their sub-ensemble and direction, or None
+    if too few pairs were logged
+    """
+    NPairs = sum(len(pairs)-1 for pairs in self.pairs.values())
+    if (NPairs < self.NMinPairs):
+      return None
+
+    cov = 0.0
+    var = 0.0
+    for pairs in self.pairs.values():
+      pairs  = np.array(pairs)
+      dev    = pairs - np.mean(pairs,axis=0)
+      cov   += np.sum(dev[:,0]*dev[:,1])
+      var   += np.sqrt(np.sum(dev[:,0]**2)*np.sum(dev[:,1]**2))
+
+    if (var == 0.0):
+      return None
+    return cov / var
+
+  # ----------------------------------
+  def retune(self,NSteps_seg,NStepsRan,wall,mdWall,in_run):
+    """
+    Returns the segment length for the rest of the run from the attempts
+    logged since the last retune, or None if too few were logged.
+
+    NSteps_seg : the current segment length
+    wall       : wall time (s) since the start of the run
+    mdWall     : wall time (s) spent in the MD since the start of the run
+    in_run     : True if the segments are done within a single lammps run
+    """
+    rho = self.lag_correlation()
+    NSegments = (NStepsRan - self.stepStart) / NSteps_seg
+    if (rho is None or NSegments <= 0):
+      return None
+
+    # the MD of a segment includes the setup of its lammps run
+    tSeg   = (wall   - self.wallStart) / NSegments
+    tMD    = (mdWall - self.mdStart  ) / NSegments
+    tSetup = 0.0
+    if (not in_run):
+      tSetup = min(self.tSetup, tMD)
+    tStep  = max(tMD - tSetup, 1.e-12) / NSteps_seg
+    tFixed = max(tSeg - tMD, 0.0) + tSetup
+
+    tau = 0.5*NSteps_seg # no correlation is resolved between the segments
+    if (rho > np.exp(-2.0)):
+      tau = -NSteps_seg / np.log(min(rho, 0.999))
+
+    self.start_period(NStepsRan, wall, mdWall)
+    return self.best_length(tau, tStep, tFixed)
+
+  # ----------------------------------
+  def start_period(self,NStepsRan,wall,mdWall):
+    """Starts a new retune period at production step NStepsRan"""
+    self.stepStart = NStepsRan
+    self.wallStart = wall
+    self.mdStart   = mdWall
+    self.reset()
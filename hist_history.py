@@ -0,0 +1,99 @@
+import json
+import numpy as np
+import os
+import sys
+
+
+# -------------------------------------------------------------
+# Binary history of the WL/TMMC histograms.
+#
+# Every write appends one fixed size record (a numpy structured
+# array element) to a raw binary file. The layout of the records and
+# the ee coordinates are stored once in a json sidecar (FileName.json),
+# so the history can be memory mapped afterwards without parsing.
+# -------------------------------------------------------------
+
+# -------------------------------------------------------------
+def sidecar_name(FileName):
+  """Returns the name of the json file describing the records of FileName"""
+  return FileName + ".json"
+
+# -------------------------------------------------------------
+def write_record(hist,record,file):
+  """
+  Appends a record to a binary history file opened in binary mode.
+  The sidecar is written with the first record of the file.
+
+  hist   : the histogram the record comes from (for the ee coordinates)
+  record : a numpy structured array of shape (1,)
+  """
+  if (file.tell() == 0 or not os.path.isfile(sidecar_name(file.name))):
+    layout = {'descr'    : np.lib.format.dtype_to_descr(record.dtype),
+              'kind'     : type(hist).__name__,
+              'min'      : hist.min,
+              'width_bin': hist.width_bin,
+              'NSubs'    : hist.NSubs,
+              'coords'   : [float(coord) for coord in hist.nodes]}
+    with open(sidecar_name(file.name),"w") as SideFile:
+      json.dump(layout, SideFile)
+
+  file.write(record.tobytes())
+  file.flush()
+
+# -------------------------------------------------------------
+def read_layout(FileName):
+  """Returns the layout of the records of a binary history file"""
+  if (not os.path.isfile(sidecar_name(FileName))):
+    sys.exit('read_layout : ERROR - Cant find the sidecar of %s' %FileName)
+
+  with open(sidecar_name(FileName),"r") as SideFile:
+    layout = json.load(SideFile)
+
+  # json turns the (name, format, shape) tuples of the descr into lists
+  descr = []
+  for field in layout['descr']:
+    if (len(field) == 3):
+      descr.append((field[0], field[1], tuple(field[2])))
+    else:
+      descr.append((field[0], field[1]))
+
+  layout['dtype'] = np.lib.format.descr_to_dtype(descr)
+  return layout
+
+# -------------------------------------------------------------
+def read_history(FileName):
+  """
+  Memory maps a binary history file. Returns the records as a
+  structured array, e.g. history['wts'] is the time series of the
+  weights (NRecords x NSubs) and history[-1] the last snapshot.
+  An incomplete last record (e.g. of a killed run) is ignored.
+  """
+  dtype    = read_layout(FileName)['dtype']
+  NRecords = os.path.getsize(FileName) // dtype.itemsize
+
+  if (NRecords == 0):
+    return np.zeros(0,dtype)
+
+  return np.memmap(FileName, dtype=dtype, mode='r', shape=(NRecords,))
+
+# -------------------------------------------------------------
+def read_snapshot(FileName,iRecord=-1):
+  """Returns record iRecord (by default the last one) of a binary history file"""
+  history = read_history(FileName)
+  if (len(history) == 0):
+    sys.exit('read_snapshot : ERROR - %s holds no records' %FileName)
+
+  return np.array(history[iRecord])
+
+# -------------------------------------------------------------
+def ee_coords(FileName):
+  """
+  Returns the ee coordinate of each sub-ensemble of a binary history
+  file, as of its first record. Records of a grid that moves during
+  the run hold their own coordinates (history['coords'])
+  """
+  layout = read_layout(FileName)
+  if ('coords' in layout):
+    return np.array(layout['coords'])
+
+  return layout['min'] + np.arange(layout['NSubs'])*layout['width_bin']
@@ -0,0 +1,85 @@
+import copy
+import queue
+import sys
+import threading
+
+
+# -------------------------------------------------------------
+class hist_writer():
+  """
+  Writes the WL and TMMC histograms from a background thread, so that
+  the rank that writes the output does not stall the expanded ensemble
+  loop on formatting and on the latency of the file system.
+
+  submit() takes a snapshot (deep copy) of the histogram and queues it.
+  The histogram can therefore keep changing while the snapshot is being
+  written. The queue is bounded: if the writer falls NQueueMax snapshots
+  behind, submit() waits for it to catch up.
+  """
+  NQueueMax = 8      # max number of snapshots waiting to be written
+  NWritten  = 0      # number of snapshots written so far
+  error     = None   # exception raised in the writer thread (if any)
+
+  # ----------------------------------
+  def __init__(self,NQueueMax=8):
+    """
+    NQueueMax : (OPTIONAL) max number of snapshots waiting to be written
+    """
+    if (NQueueMax < 1):
+      sys.exit('hist_writer.__init__ : ERROR - The queue should hold at least one snapshot')
+
+    self.NQueueMax = NQueueMax
+    self.NWritten  = 0
+    self.error     = None
+    self.queue     = queue.Queue(maxsize=NQueueMax)
+    self.thread    = threading.Thread(target=self.work, name="hist_writer", daemon=True)
+    self.thread.start()
+
+  # ----------------------------------
+  def work(self):
+    """The loop of the writer thread. A None entry stops it"""
+    while (True):
+      entry = self.queue.get()
+      try:
+        if (entry is None):
+          return
+        if (self.error is None):
+          snapshot, tag, file, fileFormat = entry
+          if (fileFormat == 'binary'):
+            snapshot.write_record(tag, file)
+          else:
+            snapshot.write(tag, file)
+          self.NWritten += 1
+      except Exception as err:
+        self.error = err  # reported to the main thread by check()
+      finally:
+        self.queue.task_done()
+
+  # ----------------------------------
+  def check(self):
+    """Raises the error of the writer thread in the calling thread"""
+    if (self.error is not None):
+      raise self.error
+
+  # ----------------------------------
+  def submit(self,hist,tag,file,fileFormat='text'):
+    """
+    Queues a snapshot of hist to be written in file, either as a text
+    block with hist.write(tag,file) or as a binary record with
+    hist.write_record(tag,file), where tag is the step
+    """
+    self.check()
+    self.queue.put((copy.deepcopy(hist), tag, file, fileFormat))
+
+  # ----------------------------------
+  def drain(self):
+    """Waits until all the queued snapshots have been written"""
+    self.queue.join()
+    self.check()
+
+  # ----------------------------------
+  def close(self):
+    """Writes the queued snapshots and stops the writer thread"""
+    self.queue.put(None)
+    self.thread.join()
+    self.check()
@@ -26,21 +26,50 @@ class input_data:
 	init_dos_parsed     = False
 	write_wl_parsed     = False
 	write_tmmc_parsed   = False
+	write_mbar_parsed   = False
+	write_mixing_parsed = False
 	write_dump_parsed   = False
 	roam_ee_with_parsed = False
+	ee_energy_parsed    = False
+	ee_moves_parsed     = False
+	ee_attempts_parsed  = False
+	ee_sync_parsed      = False
+	ee_jump_parsed      = False
+	walkers_parsed      = False
+	ee_windows_parsed   = False
+	checkpoint_parsed   = False
+	timing_parsed       = False
+	stop_when_parsed    = False
+	ee_grid_parsed      = False
+	ee_grid_feedback_parsed = False
+	tune_segments_parsed = False
+	auto_equil_parsed   = False
+	equil_cache_parsed  = False
 
 	# info that can be read from the input file 
 	# (in comment the corresponding keyword of the input)
 	boundary_min        = 0.0    # ee_histo
 	boundary_max        = 0.0    # ee_histo
 	desired_inc         = 0.0    # ee_histo
+	ee_nodes            = None   # ee_grid
+	grid_feedback       = ''     # ee_grid_feedback
+	NStepsAdaptGrid     = 0      # ee_grid_feedback
+	NAdaptGrid          = 0      # ee_grid_feedback
+	NStepsProbe         = 0      # tune_segments
+	NStepsRetune        = 0      # tune_segments
+	NStepsEquilChunk    = 0      # auto_equil
+	NStepsEquilMin      = 0      # auto_equil
+	CacheDir            = ''     # equil_cache
+	CacheMaxMB          = 0.0    # equil_cache
 	lnf                 = 0.0    # use_wl
 	lnf_scaler          = 0.0    # use_wl 
 	ratio_crit          = 0.0    # use_wl    
 	lnf_crit            = 0.0    # use_wl  
+	wl_schedule         = 'geometric' # use_wl
 	use_wl_bool         = False  # use_wl
 	use_tmmc_bool       = False  # use_tmmc
 	NStepsUpdateTM      = 0      # use_tmmc
+	NBlocksTM           = 16     # use_tmmc
 	iseed               = 0      # iseed
 	DataFile            = ''     # read_data
 	NSteps_equil        = 0      # sim_steps    
@@ -56,11 +85,39 @@ class input_data:
 	Temp                = 298.15 # set_temp
 	outFile_wl          = ''     # write_Wl
 	wstep_wl            = 0      # write_Wl
+	format_wl           = 'text' # write_Wl
 	outFile_tmmc        = ''     # write_tmmc
 	wstep_tmmc          = 0      # write_tmmc
+	format_tmmc         = 'text' # write_tmmc
+	outFile_mbar        = ''     # write_mbar
+	wstep_mbar          = 0      # write_mbar
+	outFile_mixing      = ''     # write_mixing
+	wstep_mixing        = 0      # write_mixing
 	outFile_dump        = ''     # write_dump
 	wstep_dump          = 0      # write_dump
 	ee_method           = ''     # roam_ee_with
+	ee_energy_method    = 'run0' # ee_energy
+	ee_moves            = 'segments' # ee_moves
+	NAttempts_subEns    = 1      # ee_attempts
+	NJumpMax            = 1      # ee_jump
+	accTarget           = 0.3    # ee_jump
+	ee_sync             = 'bcast'# ee_sync
+	NCheckSync          = 0      # ee_sync
+	NWalkers            = 1      # walkers
+	NStepsMerge         = 0      # walkers
+	NWindows            = 1      # ee_windows
+	NOverlap            = 0      # ee_windows
+	outFile_stitched    = ''     # ee_windows
+	NStepsChk           = 0      # checkpoint
+	chkPrefix           = ''     # checkpoint
+	NRetriesChk         = 0      # checkpoint
+	resume_bool         = False  # checkpoint
+	NStepsTiming        = 0      # timing
+	outFile_timing      = ''     # timing
+	stopCriterion       = ''     # stop_when
+	stopTol             = 0.0    # stop_when
+	NStepsStop          = 0      # stop_when
+	NChecksStop         = 1      # stop_when
 
 	NoErrorMessage      = 'No error' # no error flag
 
@@ -122,12 +179,63 @@ class input_data:
 				elif(lineArgs[0] == 'write_tmmc'  ):
 					errorMessage           = self.write_tmmc(lineArgs)
 					self.write_tmmc_parsed = True
+				elif(lineArgs[0] == 'write_mbar'  ):
+					errorMessage           = self.write_mbar(lineArgs)
+					self.write_mbar_parsed = True
+				elif(lineArgs[0] == 'write_mixing'):
+					errorMessage           = self.write_mixing(lineArgs)
+					self.write_mixing_parsed = True
 				elif(lineArgs[0] == 'write_dump'  ):
 					errorMessage           = self.write_dump(lineArgs)
 					self.write_dump_parsed = True
 				elif(lineArgs[0] == 'roam_ee_with'):
 					errorMessage             = self.roam_ee_with(lineArgs)
 					self.roam_ee_with_parsed = True
+				elif(lineArgs[0] == 'ee_energy'):
+					errorMessage             = self.ee_energy(lineArgs)
+					self.ee_energy_parsed    = True
+				elif(lineArgs[0] == 'ee_moves'):
+					errorMessage             = self.read_ee_moves(lineArgs)
+					self.ee_moves_parsed     = True
+				elif(lineArgs[0] == 'ee_attempts'):
+					errorMessage             = self.ee_attempts(lineArgs)
+					self.ee_attempts_parsed  = True
+				elif(lineArgs[0] == 'ee_jump'):
+					errorMessage             = self.ee_jump(lineArgs)
+					self.ee_jump_parsed      = True
+				elif(lineArgs[0] == 'ee_sync'):
+					errorMessage             = self.read_ee_sync(lineArgs)
+					self.ee_sync_parsed      = True
+				elif(lineArgs[0] == 'walkers'):
+					errorMessage             = self.walkers(lineArgs)
+					self.walkers_parsed      = True
+				elif(lineArgs[0] == 'ee_windows'):
+					errorMessage             = self.ee_windows(lineArgs)
+					self.ee_windows_parsed   = True
+				elif(lineArgs[0] == 'checkpoint'):
+					errorMessage             = self.checkpoint(lineArgs)
+					self.checkpoint_parsed   = True
+				elif(lineArgs[0] == 'timing'):
+					errorMessage             = self.timing(lineArgs)
+					self.timing_parsed       = True
+				elif(lineArgs[0] == 'stop_when'):
+					errorMessage             = self.stop_when(lineArgs)
+					self.stop_when_parsed    = True
+				elif(lineArgs[0] == 'ee_grid'):
+					errorMessage             = self.ee_grid(lineArgs)
+					self.ee_grid_parsed      = True
+				elif(lineArgs[0] == 'ee_grid_feedback'):
+					errorMessage             = self.ee_grid_feedback(lineArgs)
+					self.ee_grid_feedback_parsed = True
+				elif(lineArgs[0] == 'tune_segments'):
+					errorMessage             = self.tune_segments(lineArgs)
+					self.tune_segments_parsed = True
+				elif(lineArgs[0] == 'auto_equil'):
+					errorMessage             = self.auto_equil(lineArgs)
+					self.auto_equil_parsed   = True
+				elif(lineArgs[0] == 'equil_cache'):
+					errorMessage             = self.equil_cache(lineArgs)
+					self.equil_cache_parsed  = True
 				else:
 					print('input_data.__init__ : ERROR - Unrecognised input file entry at line %d\n' %NLinesRead)
 					print('                      %s is not recognised\n' %lineArgs[0]    )
@@ -140,6 +248,13 @@ class input_data:
 
 					sys.exit()
 
+		# the quadratic model probes the energy at two more charges every
+		# segment, and saves the energy evaluation of each attempt
+		if (self.ee_energy_method == 'quadratic' and self.NAttempts_subEns == 1 and not self.write_mbar_parsed):
+			print('input_data.__init__ : WARNING - ee_energy quadratic costs two extra energy probes per segment')
+			print('                      and saves one per attempt. With a single attempt and no write_mbar it is')
+			print('                      slower than run0 (ee_energy auto picks the cheaper of the two)')
+
   # ----------------------------------
 	def ee_histo(self,lineArgs):
 		if (len(lineArgs) != 4):
@@ -158,14 +273,19 @@ class input_data:
 			return 'use_wl: Cant find an EE histogram. Define one using ee_histo' # error
 
 		if  (lineArgs[1] == 'yes'):
-			if (len(lineArgs) != 6):
-				return 'use_wl: Argument mismatch. Specify(after yes): lnf, lnf_scaler, ratio_crit, lnf_crit' # error
+			if (len(lineArgs) != 6 and len(lineArgs) != 7):
+				return 'use_wl: Argument mismatch. Specify(after yes): lnf, lnf_scaler, ratio_crit, lnf_crit, [geometric/1/t]' # error
 
 			self.use_wl_bool = True
 			self.lnf         = float(lineArgs[2])
 			self.lnf_scaler  = float(lineArgs[3])  
 			self.ratio_crit  = float(lineArgs[4])  
 			self.lnf_crit    = float(lineArgs[5]) 
+
+			if (len(lineArgs) == 7):
+				self.wl_schedule = lineArgs[6]
+				if (self.wl_schedule != 'geometric' and self.wl_schedule != '1/t'):
+					return 'use_wl: Unknown lnf schedule %s. Choose geometric or 1/t' %self.wl_schedule # error
 		elif(lineArgs[1] == 'no' ):
 			self.use_wl_bool = False
 
@@ -180,11 +300,16 @@ class input_data:
 		
 		self.use_tmmc = False
 		if (lineArgs[1] == 'yes'):
-			if   (len(lineArgs) != 3):
-				return 'use_tmmc: Argument mismatch. Please choose yes/no' # error
+			if   (len(lineArgs) != 3 and len(lineArgs) != 4):
+				return 'use_tmmc: Argument mismatch. Specify(after yes): NStepsUpdateTM, (OPTIONAL) NBlocks' # error
 			self.use_tmmc_bool  = True
 			self.NStepsUpdateTM = int(lineArgs[2])
 
+			if (len(lineArgs) == 4):
+				self.NBlocksTM  = int(lineArgs[3])
+				if (self.NBlocksTM < 2 or self.NBlocksTM % 2 != 0):
+					return 'use_tmmc: The number of blocks should be even and at least 2' # error
+
 		return self.NoErrorMessage
 
 
@@ -249,7 +374,7 @@ class input_data:
 		elif (not self.ee_histo_parsed):
 			return 'init_dos: Cant find an EE histogram. Define one using ee_histo' # error
 
-		EEHisto_aux    = Histogram(self.boundary_min, self.boundary_max, self.desired_inc)
+		EEHisto_aux    = Histogram(self.boundary_min, self.boundary_max, self.desired_inc, self.ee_nodes)
 		NSubs          = EEHisto_aux.NBins
 		self.dos_init  = np.zeros(NSubs, np.double)
 		dos_init_check = np.zeros(NSubs, dtype=bool)
@@ -284,27 +409,61 @@ class input_data:
 
 	# ----------------------------------
 	def write_wl(self,lineArgs):
-		if   (len(lineArgs) != 3):
-			return 'write_wl: Argument mismatch. Specify: write_step(fs), fileName' # error
+		if   (len(lineArgs) != 3 and len(lineArgs) != 4):
+			return 'write_wl: Argument mismatch. Specify: write_step(fs), fileName, (OPTIONAL) text/binary' # error
 		elif (not self.use_wl_parsed):
 			return 'write_wl: Cant find a WL histogram. Define one using use_wl' # error
 
 		self.wstep_wl   = int(lineArgs[1])
 		self.outFile_wl =     lineArgs[2]
 
+		if (len(lineArgs) == 4):
+			if (not lineArgs[3] == 'text') and (not lineArgs[3] == 'binary'):
+				return 'write_wl: Supported formats text/binary'
+			self.format_wl = lineArgs[3]
+
 		return self.NoErrorMessage
 
 
 	# ----------------------------------
 	def write_tmmc(self,lineArgs):
-		if   (len(lineArgs) != 3):
-			return 'write_tmmc: Argument mismatch. Specify: write_step(fs), fileName' # error
+		if   (len(lineArgs) != 3 and len(lineArgs) != 4):
+			return 'write_tmmc: Argument mismatch. Specify: write_step(fs), fileName, (OPTIONAL) text/binary' # error
 		elif (not self.use_tmmc_parsed):
 			return 'write_tmmc: Cant find a TMMC histogram. Define one using use_tmmc' # error
 
 		self.wstep_tmmc   = int(lineArgs[1])
 		self.outFile_tmmc =     lineArgs[2]
 
+		if (len(lineArgs) == 4):
+			if (not lineArgs[3] == 'text') and (not lineArgs[3] == 'binary'):
+				return 'write_tmmc: Supported formats text/binary'
+			self.format_tmmc = lineArgs[3]
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def write_mbar(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'write_mbar: Argument mismatch. Specify: write_step(fs), fileName' # error
+		elif (int(lineArgs[1]) < 1):
+			return 'write_mbar: The write step should be positive' # error
+
+		self.wstep_mbar   = int(lineArgs[1])
+		self.outFile_mbar =     lineArgs[2]
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def write_mixing(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'write_mixing: Argument mismatch. Specify: write_step(fs), fileName' # error
+		elif (int(lineArgs[1]) < 1):
+			return 'write_mixing: The write step should be positive' # error
+
+		self.wstep_mixing   = int(lineArgs[1])
+		self.outFile_mixing =     lineArgs[2]
+
 		return self.NoErrorMessage
 
 	# ----------------------------------
@@ -354,3 +513,281 @@ class input_data:
 
 
 				
+
+	# ----------------------------------
+	def ee_energy(self,lineArgs):
+		if   (len(lineArgs) != 2):
+			return 'ee_energy: Argument mismatch. Specify how the energy of the attempted sub-ensemble is computed' # error
+
+		ee_energy_method = str(lineArgs[1])
+
+		if (not ee_energy_method in ['run0', 'quadratic', 'partial', 'auto']):
+			return 'ee_energy: Supported options run0/quadratic/partial/auto'
+
+		self.ee_energy_method = ee_energy_method
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def read_ee_moves(self,lineArgs):
+		if   (len(lineArgs) != 2):
+			return 'ee_moves: Argument mismatch. Specify when the sub-ensemble moves are done' # error
+
+		ee_moves = str(lineArgs[1])
+
+		if (not ee_moves == 'segments') and (not ee_moves == 'in_run'):
+			return 'ee_moves: Supported options segments/in_run'
+
+		self.ee_moves = ee_moves
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def ee_attempts(self,lineArgs):
+		if   (len(lineArgs) != 2):
+			return 'ee_attempts: Argument mismatch. Specify the number of sub-ensemble attempts per MD segment' # error
+		elif (int(lineArgs[1]) < 1):
+			return 'ee_attempts: At least one attempt per MD segment is needed' # error
+
+		self.NAttempts_subEns = int(lineArgs[1])
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def ee_jump(self,lineArgs):
+		if   (len(lineArgs) != 2 and len(lineArgs) != 3):
+			return 'ee_jump: Argument mismatch. Specify: max sub-ensemble jump, (OPTIONAL) target acceptance' # error
+		elif (int(lineArgs[1]) < 1):
+			return 'ee_jump: The max jump should be at least one sub-ensemble' # error
+
+		self.NJumpMax = int(lineArgs[1])
+
+		if (len(lineArgs) == 3):
+			self.accTarget = float(lineArgs[2])
+			if (self.accTarget <= 0.0 or self.accTarget >= 1.0):
+				return 'ee_jump: The target acceptance should be between 0 and 1' # error
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def read_ee_sync(self,lineArgs):
+		if   (len(lineArgs) != 2 and len(lineArgs) != 3):
+			return 'ee_sync: Argument mismatch. Specify: bcast/replicated, (OPTIONAL) NCheck' # error
+
+		ee_sync = str(lineArgs[1])
+
+		if (not ee_sync == 'bcast') and (not ee_sync == 'replicated'):
+			return 'ee_sync: Supported options bcast/replicated'
+
+		self.ee_sync = ee_sync
+		if (len(lineArgs) == 3):
+			self.NCheckSync = int(lineArgs[2])
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def walkers(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'walkers: Argument mismatch. Specify: NWalkers, NStepsMerge' # error
+		elif (self.ee_windows_parsed):
+			return 'walkers: Cannot be combined with ee_windows' # error
+		elif (self.ee_grid_feedback_parsed):
+			return 'walkers: Cannot be combined with ee_grid_feedback' # error
+		elif (int(lineArgs[1]) < 1 or int(lineArgs[2]) < 1):
+			return 'walkers: NWalkers and NStepsMerge should be positive' # error
+
+		self.NWalkers    = int(lineArgs[1])
+		self.NStepsMerge = int(lineArgs[2])
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def ee_windows(self,lineArgs):
+		if   (len(lineArgs) != 4):
+			return 'ee_windows: Argument mismatch. Specify: NWindows, NOverlap, outputFile' # error
+		elif (not self.ee_histo_parsed):
+			return 'ee_windows: Cant find an EE histogram. Define one using ee_histo' # error
+		elif (self.walkers_parsed):
+			return 'ee_windows: Cannot be combined with walkers' # error
+		elif (self.ee_grid_feedback_parsed):
+			return 'ee_windows: Cannot be combined with ee_grid_feedback' # error
+		elif (int(lineArgs[1]) < 1 or int(lineArgs[2]) < 1):
+			return 'ee_windows: NWindows and NOverlap should be positive' # error
+
+		self.NWindows         = int(lineArgs[1])
+		self.NOverlap         = int(lineArgs[2])
+		self.outFile_stitched =     lineArgs[3]
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def checkpoint(self,lineArgs):
+		if   (len(lineArgs) != 4 and len(lineArgs) != 5):
+			return 'checkpoint: Argument mismatch. Specify: NStepsChk, prefix, NRetries, (OPTIONAL) resume' # error
+		elif (not self.sim_steps_parsed):
+			return 'checkpoint: Define the simulation steps (sim_steps) before the checkpoints' # error
+		elif (int(lineArgs[1]) < 1 or np.mod(int(lineArgs[1]),self.NSteps_subEns) != 0):
+			return 'checkpoint: NStepsChk should be a positive multiple of the sub-ensemble steps' # error
+		elif (int(lineArgs[3]) < 0):
+			return 'checkpoint: NRetries cannot be negative' # error
+
+		self.NStepsChk   = int(lineArgs[1])
+		self.chkPrefix   =     lineArgs[2]
+		self.NRetriesChk = int(lineArgs[3])
+
+		if (len(lineArgs) == 5):
+			if (not lineArgs[4] == 'resume'):
+				return 'checkpoint: The only supported option is resume'
+			self.resume_bool = True
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def timing(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'timing: Argument mismatch. Specify: write_step, fileName (.json or .csv)' # error
+		elif (int(lineArgs[1]) < 1):
+			return 'timing: The write step should be positive' # error
+
+		self.NStepsTiming   = int(lineArgs[1])
+		self.outFile_timing =     lineArgs[2]
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def stop_when(self,lineArgs):
+		if   (len(lineArgs) < 4):
+			return 'stop_when: Argument mismatch. Specify: dF_err tol NStepsCheck, or stable tol NStepsCheck NChecks' # error
+		elif (not self.sim_steps_parsed):
+			return 'stop_when: Define the simulation steps (sim_steps) before the stopping criterion' # error
+		elif (not self.use_tmmc_bool):
+			return 'stop_when: The stopping criteria need the TMMC weights. Use use_tmmc yes before stop_when' # error
+		elif (int(lineArgs[3]) < 1 or np.mod(int(lineArgs[3]),self.NSteps_subEns) != 0):
+			return 'stop_when: NStepsCheck should be a positive multiple of the sub-ensemble steps' # error
+
+		if   (lineArgs[1] == 'dF_err'):
+			if (len(lineArgs) != 4):
+				return 'stop_when: Argument mismatch. Specify: dF_err tol NStepsCheck' # error
+		elif (lineArgs[1] == 'stable'):
+			if (len(lineArgs) != 5):
+				return 'stop_when: Argument mismatch. Specify: stable tol NStepsCheck NChecks' # error
+			elif (int(lineArgs[4]) < 1):
+				return 'stop_when: The weights should be stable over at least one check' # error
+			self.NChecksStop = int(lineArgs[4])
+		else:
+			return 'stop_when: Unknown criterion %s. Choose dF_err or stable' %lineArgs[1] # error
+
+		self.stopCriterion = lineArgs[1]
+		self.stopTol       = float(lineArgs[2])
+		self.NStepsStop    = int(lineArgs[3])
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def ee_grid(self,lineArgs):
+		if   (len(lineArgs) < 2):
+			return 'ee_grid: Argument mismatch. Specify: uniform, power exponent, or nodes q0 q1 ... qN' # error
+		elif (not self.ee_histo_parsed):
+			return 'ee_grid: Cant find an EE histogram. Define one using ee_histo' # error
+		elif (self.init_dos_parsed):
+			return 'ee_grid: Define the grid before init_dos' # error
+
+		qMin  = self.boundary_min
+		qMax  = self.boundary_max
+		if   (lineArgs[1] == 'uniform'):
+			if (len(lineArgs) != 2):
+				return 'ee_grid: Argument mismatch. uniform takes no arguments' # error
+			self.ee_nodes = None
+		elif (lineArgs[1] == 'power'):
+			# the nodes of ee_histo, at min + (max-min)*x^exponent. An exponent 
+			# below 1 puts the nodes closer together towards the max
+			if (len(lineArgs) != 3):
+				return 'ee_grid: Argument mismatch. Specify: power exponent' # error
+			elif (float(lineArgs[2]) <= 0.0):
+				return 'ee_grid: The exponent should be positive' # error
+			NSubs         = Histogram(qMin, qMax, self.desired_inc).NBins
+			self.ee_nodes = qMin + (qMax - qMin) * np.linspace(0.0,1.0,NSubs)**float(lineArgs[2])
+		elif (lineArgs[1] == 'nodes'):
+			nodes = np.array([float(arg) for arg in lineArgs[2:]])
+			if   (len(nodes) < 2 or np.any(np.diff(nodes) <= 0.0)):
+				return 'ee_grid: Specify at least two increasing nodes' # error
+			elif (abs(nodes[0] - qMin) > 1.e-8 or abs(nodes[-1] - qMax) > 1.e-8):
+				return 'ee_grid: The nodes should start at the min and end at the max of ee_histo' # error
+			self.ee_nodes = nodes
+		else:
+			return 'ee_grid: Unknown grid %s. Choose uniform, power or nodes' %lineArgs[1] # error
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def ee_grid_feedback(self,lineArgs):
+		if   (len(lineArgs) != 4):
+			return 'ee_grid_feedback: Argument mismatch. Specify: acceptance/roundtrip, NStepsAdapt, NAdapt' # error
+		elif (not self.sim_steps_parsed):
+			return 'ee_grid_feedback: Define the simulation steps (sim_steps) before the grid feedback' # error
+		elif (lineArgs[1] != 'acceptance' and lineArgs[1] != 'roundtrip'):
+			return 'ee_grid_feedback: Unknown feedback %s. Choose acceptance or roundtrip' %lineArgs[1] # error
+		elif (int(lineArgs[2]) < 1 or np.mod(int(lineArgs[2]),self.NSteps_subEns) != 0):
+			return 'ee_grid_feedback: NStepsAdapt should be a positive multiple of the sub-ensemble steps' # error
+		elif (int(lineArgs[3]) < 1):
+			return 'ee_grid_feedback: The nodes should be moved at least once' # error
+		elif (self.walkers_parsed or self.ee_windows_parsed):
+			return 'ee_grid_feedback: Cannot be combined with walkers or ee_windows' # error
+
+		self.grid_feedback   = lineArgs[1]
+		self.NStepsAdaptGrid = int(lineArgs[2])
+		self.NAdaptGrid      = int(lineArgs[3])
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def tune_segments(self,lineArgs):
+		if   (len(lineArgs) != 2 and len(lineArgs) != 3):
+			return 'tune_segments: Argument mismatch. Specify: NStepsProbe, (OPTIONAL) NStepsRetune' # error
+		elif (not self.sim_steps_parsed):
+			return 'tune_segments: Define the simulation steps (sim_steps) before tuning them' # error
+		elif (int(lineArgs[1]) < 1 or self.NSteps_equil < 10*int(lineArgs[1])):
+			return 'tune_segments: The equilibration should last at least 10 probes of NStepsProbe (positive) steps' # error
+
+		elif (self.auto_equil_parsed and int(lineArgs[1]) != self.NStepsEquilChunk):
+			return 'tune_segments: The equilibration is probed once per chunk. NStepsProbe should match the auto_equil chunk' # error
+
+		self.NStepsProbe = int(lineArgs[1])
+
+		if (len(lineArgs) == 3):
+			self.NStepsRetune = int(lineArgs[2])
+			if (self.NStepsRetune < 1 or np.mod(self.NStepsRetune,self.NSteps_subEns) != 0):
+				return 'tune_segments: NStepsRetune should be a positive multiple of the sub-ensemble steps' # error
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def auto_equil(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'auto_equil: Argument mismatch. Specify: NStepsChunk, NStepsMin (the max is the equilibration of sim_steps)' # error
+		elif (not self.sim_steps_parsed):
+			return 'auto_equil: Define the simulation steps (sim_steps) before the automatic equilibration' # error
+
+		self.NStepsEquilChunk = int(lineArgs[1])
+		self.NStepsEquilMin   = int(lineArgs[2])
+
+		if   (self.NStepsEquilChunk < 1 or self.NSteps_equil < 20*self.NStepsEquilChunk):
+			return 'auto_equil: The max equilibration (sim_steps) should last at least 20 chunks of NStepsChunk (positive) steps' # error
+		elif (self.NStepsEquilMin < 0 or self.NStepsEquilMin > self.NSteps_equil):
+			return 'auto_equil: NStepsMin should be between 0 and the max equilibration (sim_steps)' # error
+		elif (self.tune_segments_parsed and self.NStepsProbe != self.NStepsEquilChunk):
+			return 'auto_equil: The equilibration is probed once per chunk. NStepsChunk should match the NStepsProbe of tune_segments' # error
+
+		return self.NoErrorMessage
+
+	# ----------------------------------
+	def equil_cache(self,lineArgs):
+		if   (len(lineArgs) != 3):
+			return 'equil_cache: Argument mismatch. Specify: directory, max size (MB)' # error
+		elif (float(lineArgs[2]) <= 0.0):
+			return 'equil_cache: The max size of the cache should be positive' # error
+
+		self.CacheDir   =       lineArgs[1]
+		self.CacheMaxMB = float(lineArgs[2])
+
+		return self.NoErrorMessage
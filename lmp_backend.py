@@ -0,0 +1,21 @@
+import os
+import sys
+
+
+# -------------------------------------------------------------
+# Selects the lammps backend of the package. By default the lammps
+# python module is used. Setting the environment variable
+#
+#     EE_LAMMPS_BACKEND=mock
+#
+# replaces it with the NumPy stand-in of mock_lammps, which runs
+# without a compiled lammps (tests, profiling, benchmarks).
+# -------------------------------------------------------------
+backend = os.environ.get('EE_LAMMPS_BACKEND', 'lammps')
+
+if   (backend == 'mock'):
+  from mock_lammps import mock_lammps as lammps
+elif (backend == 'lammps'):
+  from lammps      import lammps
+else:
+  sys.exit('lmp_backend : ERROR - Unknown lammps backend %s (use lammps or mock)' %backend)
@@ -0,0 +1,489 @@
+import numpy as np
+import os
+import pickle
+import re
+import shlex
+import sys
+import time
+
+
+# -------------------------------------------------------------
+class mock_lammps():
+  """
+  An in-process stand-in for the lammps python object, implementing
+  the subset of its API that this package uses (command, set_variable,
+  extract_variable, extract_compute, extract_global, extract_box,
+  get_natoms, close).
+
+  The system is modelled with a plain NumPy Coulomb + LJ potential
+  (cutoff, minimum image, no kspace and no intramolecular terms).
+  Instead of MD, every timestep of a run is a Metropolis rigid
+  translation of a random molecule. The energy is updated incrementally
+  after moves and charge changes, so energy probes cost O(NAtoms). As
+  in lammps, thermo_pe is the energy of the last run, a run without
+  setup (pre no) evaluates nothing before its first timestep, and a
+  compute is evaluated at most once per timestep. NStaleForces counts
+  the runs that started without setup from the forces of other charges.
+
+  Every API call can be delayed by 'latency' seconds and every timestep
+  by 'stepLatency' seconds (or the environment variables
+  EE_MOCK_LATENCY, EE_MOCK_STEP_LATENCY) to emulate the cost of a real
+  lammps instance.
+
+  Supported commands: variable (string/equal, count() and density in
+  equal), include, read_data (atom_style full), read_restart,
+  write_restart, pair_style (the last number is the cutoff), pair_coeff,
+  group (type/id/subtract/clear), set atom, compute group/group, fix nvt
+  (the temperature, also returned by the thermo_temp compute), run (with
+  pre/post/every and 'python f invoke'), python (exists/here/invoke). Anything else (units, thermo, neighbor, velocity, dump ...)
+  is accepted and ignored.
+  """
+  KCoul     = 332.06371  # kcal/mol A / e^2 (real units)
+  rMin      = 0.5        # distances are capped from below at rMin (A)
+  dispMax   = 0.3        # max displacement of a molecule move (A)
+  NChunk    = 64         # atoms per block of the vectorized energies
+
+  # ----------------------------------
+  def __init__(self,cmdargs=None,comm=None,latency=None,stepLatency=None):
+    """
+    cmdargs     : ignored, accepted for compatibility with lammps()
+    comm        : the mpi communicator. Every rank holds the full system
+    latency     : (OPTIONAL) delay (s) of every API call
+    stepLatency : (OPTIONAL) delay (s) of every timestep of a run
+    """
+    if (latency is None):
+      latency     = float(os.environ.get('EE_MOCK_LATENCY', 0.0))
+    if (stepLatency is None):
+      stepLatency = float(os.environ.get('EE_MOCK_STEP_LATENCY', 0.0))
+
+    self.comm        = comm
+    self.latency     = latency
+    self.stepLatency = stepLatency
+    self.variables   = {}
+    self.groups      = {}
+    self.computes    = {}
+    self.cmpCache    = {}
+    self.pairCoeffs  = {}
+    self.pyGlobals   = {}
+    self.rc          = 10.0
+    self.Temp        = 300.0
+    self.ntimestep   = 0
+    self.NAtoms      = 0
+    self.pe          = 0.0
+    self.peValid     = False
+    self.setupDone   = False
+    self.NStaleForces = 0
+    self.paramsValid = False
+    self.rng         = None
+    self.boxlo       = np.zeros(3,np.double)
+    self.boxhi       = np.ones(3,np.double)
+    self.set_atoms(np.zeros((0,3)), np.zeros(0), np.zeros(0,np.int64), np.zeros(0,np.int64))
+
+  # ----------------------------------
+  def delay(self,seconds):
+    if (seconds > 0.0):
+      time.sleep(seconds)
+
+  # ----------------------------------
+  def set_atoms(self,x,q,Type,mol):
+    """Replaces the atoms of the system (0-based types)"""
+    self.x       = np.array(x,np.double)
+    self.q       = np.array(q,np.double)
+    self.qEval   = np.copy(self.q)     # charges the energy pe corresponds to
+    self.Type    = np.array(Type,np.int64)
+    self.mol     = np.array(mol,np.int64)
+    self.NAtoms  = len(self.q)
+    self.groups  = {'all': np.ones(self.NAtoms,bool)}
+    self.peValid     = False
+    self.paramsValid = False
+    self.setupDone   = False
+
+  # ----------------------------------
+  # the lammps python API
+  # ----------------------------------
+  def command(self,cmd):
+    """Executes a single lammps command"""
+    self.delay(self.latency)
+
+    cmd  = self.expand(cmd.partition('#')[0]).strip()
+    if (len(cmd) == 0):
+      return
+    args = shlex.split(cmd)
+    name = args[0]
+
+    if   (name == 'variable'):
+      self.cmd_variable(args)
+    elif (name == 'include'):
+      self.cmd_include(args)
+    elif (name == 'read_data'):
+      self.read_data(args[1])
+    elif (name == 'read_restart'):
+      self.read_restart(args[1])
+    elif (name == 'write_restart'):
+      self.write_restart(args[1])
+    elif (name == 'pair_style'):
+      numbers = [float(a) for a in args[2:] if re.match(r'^[0-9.eE+-]+$',a)]
+      if (len(numbers) > 0):
+        self.rc = numbers[-1]
+      self.peValid     = False
+      self.paramsValid = False
+    elif (name == 'pair_coeff'):
+      self.pairCoeffs[(int(args[1])-1, int(args[2])-1)] = (float(args[3]), float(args[4]))
+      self.peValid     = False
+      self.paramsValid = False
+    elif (name == 'group'):
+      self.cmd_group(args)
+    elif (name == 'set'):
+      self.cmd_set(args)
+    elif (name == 'compute'):
+      if (args[3] == 'group/group'):
+        self.computes[args[1]] = (args[2], args[4])
+    elif (name == 'fix'):
+      if ('temp' in args):
+        self.Temp = float(args[args.index('temp')+1])
+    elif (name == 'run'):
+      self.cmd_run(args)
+    elif (name == 'python'):
+      self.cmd_python(args)
+
+  # ----------------------------------
+  def set_variable(self,name,value):
+    self.delay(self.latency)
+    style = 'string'
+    if (name in self.variables):
+      style = self.variables[name][0]
+    self.variables[name] = (style, str(value))
+    return 0
+
+  # ----------------------------------
+  def extract_variable(self,name,group=None,vartype=0):
+    self.delay(self.latency)
+    if (name not in self.variables):
+      return None
+
+    style, value = self.variables[name]
+    if (style == 'equal'):
+      return self.evaluate(value)
+    return value
+
+  # ----------------------------------
+  def extract_compute(self,cmpId,style=0,vartype=0):
+    self.delay(self.latency)
+    if (cmpId == 'thermo_pe'):
+      return self.pe
+    if (cmpId == 'thermo_temp'):
+      return self.Temp
+
+    if (cmpId not in self.computes):
+      sys.exit('mock_lammps.extract_compute : ERROR - Unknown compute %s' %cmpId)
+
+    # like lammps, a compute is only evaluated once per timestep
+    cached = self.cmpCache.get(cmpId)
+    if (cached is None or cached[0] != self.ntimestep):
+      group1, group2 = self.computes[cmpId]
+      value   = self.pair_energy(np.nonzero(self.groups[group1])[0], self.groups[group2], self.q)
+      cached  = (self.ntimestep, value)
+      self.cmpCache[cmpId] = cached
+
+    return cached[1]
+
+  # ----------------------------------
+  def extract_global(self,name):
+    self.delay(self.latency)
+    if (name == 'ntimestep'):
+      return self.ntimestep
+    if (name == 'natoms'):
+      return self.NAtoms
+    sys.exit('mock_lammps.extract_global : ERROR - Unsupported global %s' %name)
+
+  # ----------------------------------
+  def extract_box(self):
+    self.delay(self.latency)
+    return list(self.boxlo), list(self.boxhi), 0.0, 0.0, 0.0, [1,1,1], 0
+
+  # ----------------------------------
+  def get_natoms(self):
+    self.delay(self.latency)
+    return self.NAtoms
+
+  # ----------------------------------
+  def close(self):
+    pass
+
+  # ----------------------------------
+  # commands
+  # ----------------------------------
+  def expand(self,cmd):
+    """Substitutes the ${name} references, like lammps does when parsing"""
+    def value(match):
+      name = match.group(1)
+      if (name not in self.variables):
+        sys.exit('mock_lammps.expand : ERROR - Unknown variable %s' %name)
+      style, val = self.variables[name]
+      if (style == 'equal'):
+        return repr(self.evaluate(val))
+      return val
+
+    return re.sub(r'\$\{(\w+)\}', value, cmd)
+
+  # ----------------------------------
+  def evaluate(self,expr):
+    """Evaluates an equal style variable (a number, count(group) or density)"""
+    match = re.match(r'^count\((\w+)\)$', expr.strip())
+    if (match):
+      return float(np.count_nonzero(self.groups[match.group(1)]))
+    if (expr.strip() == 'density'):
+      # g/cm^3 (real units), masses are not read: every atom weighs 1 g/mol
+      return self.NAtoms * 1.66054 / np.prod(self.boxhi - self.boxlo)
+    return float(expr)
+
+  # ----------------------------------
+  def cmd_variable(self,args):
+    self.variables[args[1]] = (args[2], " ".join(args[3:]))
+
+  # ----------------------------------
+  def cmd_include(self,args):
+    if (not os.path.isfile(args[1])):
+      sys.exit('mock_lammps.cmd_include : ERROR - Cannot open file %s' %args[1])
+    with open(args[1],"r") as IncFile:
+      for line in IncFile:
+        self.command(line)
+
+  # ----------------------------------
+  def cmd_group(self,args):
+    name, style = args[1], args[2]
+    if   (style == 'clear'):
+      self.groups[name] = np.zeros(self.NAtoms,bool)
+      return
+    elif (style == 'type'):
+      mask = np.isin(self.Type, [int(a)-1 for a in args[3:]])
+    elif (style == 'id'):
+      mask = np.zeros(self.NAtoms,bool)
+      mask[[int(a)-1 for a in args[3:]]] = True
+    elif (style == 'subtract'):
+      mask = np.copy(self.groups[args[3]])
+      for other in args[4:]:
+        mask &= ~self.groups[other]
+    else:
+      sys.exit('mock_lammps.cmd_group : ERROR - Unsupported group style %s' %style)
+
+    # like lammps, atoms are added to an existing group
+    if (name in self.groups):
+      mask |= self.groups[name]
+    self.groups[name] = mask
+
+  # ----------------------------------
+  def cmd_set(self,args):
+    if (args[1] != 'atom' or args[3] != 'charge'):
+      sys.exit('mock_lammps.cmd_set : ERROR - Only set atom ID charge Q is supported')
+    self.q[int(args[2])-1] = float(args[4])
+
+  # ----------------------------------
+  def cmd_python(self,args):
+    # lammps runs the code of python ... here in the __main__ namespace.
+    # The mock keeps it apart, and falls back to __main__ for exists
+    if (args[2] == 'here'):
+      exec(args[3], self.pyGlobals)
+
+    func = self.pyGlobals.get(args[1], getattr(sys.modules['__main__'], args[1], None))
+    if (func is None):
+      sys.exit('mock_lammps.cmd_python : ERROR - Python function %s not found' %args[1])
+    if (args[2] == 'invoke'):
+      func()
+
+  # ----------------------------------
+  def cmd_run(self,args):
+    NSteps  = int(args[1])
+    NEvery  = NSteps
+    invoke  = None
+    pre     = True
+    if ('pre' in args):
+      pre    = (args[args.index('pre')+1] == 'yes')
+    if ('every' in args):
+      iEvery = args.index('every')
+      NEvery = int(args[iEvery+1])
+      invoke = args[iEvery+2]
+
+    NDone = 0
+    while (True):
+      NChunk = min(NEvery, NSteps - NDone)
+
+      # like lammps, the setup evaluates the energy (and forces). It is
+      # skipped with pre no, except for the very first run and the first
+      # chunk of a run with every, and thermo_pe keeps its last value
+      if (pre or not self.setupDone or (invoke is not None and NDone == 0) or not self.peValid):
+        self.update_energy()
+        self.setupDone = True
+      elif (NChunk > 0):
+        # the first timestep starts from the forces of the last evaluation
+        if (np.any(self.q != self.qEval)):
+          self.NStaleForces += 1
+        self.update_energy()
+
+      for iStep in range(NChunk):
+        self.mc_step()
+      NDone += NChunk
+
+      if (invoke is not None and NChunk > 0):
+        self.command(invoke)
+      if (NDone >= NSteps):
+        break
+
+  # ----------------------------------
+  # restart files
+  # ----------------------------------
+  def read_data(self,FileName):
+    """Reads a lammps data file of atom_style full (header, Atoms)"""
+    with open(FileName,"r") as DataFile:
+      lines = [line.partition('#')[0].split() for line in DataFile]
+
+    NAtoms = 0
+    iAtoms = -1
+    for iLine, words in enumerate(lines):
+      if (len(words) == 2 and words[1] == 'atoms'):
+        NAtoms = int(words[0])
+      elif (len(words) == 4 and words[2][1:] == 'lo'):
+        iDim = 'xyz'.index(words[2][0])
+        self.boxlo[iDim] = float(words[0])
+        self.boxhi[iDim] = float(words[1])
+      elif (len(words) == 1 and words[0] == 'Atoms'):
+        iAtoms = iLine
+        break
+
+    if (iAtoms < 0):
+      sys.exit('mock_lammps.read_data : ERROR - No Atoms section in %s' %FileName)
+
+    rows  = [words for words in lines[iAtoms+1:] if len(words) > 0][:NAtoms]
+    atoms = np.array([[float(w) for w in words[:7]] for words in rows])
+    order = np.argsort(atoms[:,0])
+    atoms = atoms[order]
+
+    self.set_atoms(atoms[:,4:7], atoms[:,3], atoms[:,2].astype(np.int64)-1, atoms[:,1].astype(np.int64))
+    self.ntimestep = 0
+
+  # ----------------------------------
+  def write_restart(self,FileName):
+    rngState = self.rng.bit_generator.state if (self.rng is not None) else None
+    with open(FileName,"wb") as RestartFile:
+      np.savez(RestartFile, x=self.x, q=self.q, Type=self.Type, mol=self.mol,
+               boxlo=self.boxlo, boxhi=self.boxhi, ntimestep=self.ntimestep, Temp=self.Temp,
+               rng=np.frombuffer(pickle.dumps(rngState), np.uint8))
+
+  # ----------------------------------
+  def read_restart(self,FileName):
+    with np.load(FileName) as restart:
+      self.boxlo[:] = restart['boxlo']
+      self.boxhi[:] = restart['boxhi']
+      self.set_atoms(restart['x'], restart['q'], restart['Type'], restart['mol'])
+      self.ntimestep = int(restart['ntimestep'])
+      self.Temp      = float(restart['Temp'])
+      rngState       = pickle.loads(restart['rng'].tobytes())
+
+    if (rngState is not None):
+      self.rng = np.random.Generator(np.random.Philox())
+      self.rng.bit_generator.state = rngState
+
+  # ----------------------------------
+  # the model
+  # ----------------------------------
+  def lj_params(self):
+    """Returns the eps and sigma matrices (geometric mixing if not given)"""
+    NTypes = int(np.max(self.Type))+1 if (self.NAtoms > 0) else 0
+    for (i, j) in self.pairCoeffs:
+      NTypes = max(NTypes, i+1, j+1)
+
+    eps = np.zeros((NTypes,NTypes))
+    sig = np.zeros((NTypes,NTypes))
+    for i in range(NTypes):
+      eps[i,i], sig[i,i] = self.pairCoeffs.get((i,i), (0.0, 0.0))
+    for i in range(NTypes):
+      for j in range(NTypes):
+        if (i != j):
+          coeffs = self.pairCoeffs.get((min(i,j),max(i,j)))
+          if (coeffs is None):
+            coeffs = (np.sqrt(eps[i,i]*eps[j,j]), np.sqrt(sig[i,i]*sig[j,j]))
+          eps[i,j], sig[i,j] = coeffs
+
+    return eps, sig
+
+  # ----------------------------------
+  def pair_energy(self,idxA,maskB,q,coulomb_only=False):
+    """
+    Energy of the atoms idxA with the atoms in maskB (pairs within the
+    same molecule excluded) for the charges q. Pairs of atoms that are
+    both in idxA and maskB are counted twice.
+    """
+    if (not self.paramsValid):
+      self.eps, self.sig = self.lj_params()
+      self.paramsValid   = True
+
+    idxB  = np.nonzero(maskB)[0]
+    L     = self.boxhi - self.boxlo
+    rc2   = self.rc*self.rc
+    E     = 0.0
+    for i0 in range(0,len(idxA),self.NChunk):
+      idx   = idxA[i0:i0+self.NChunk]
+      d     = self.x[idxB][None,:,:] - self.x[idx][:,None,:]
+      d    -= L*np.rint(d/L)
+      r2    = np.sum(d*d,axis=2)
+      valid = (r2 < rc2) & (self.mol[idx][:,None] != self.mol[idxB][None,:])
+      r2    = np.maximum(r2, self.rMin*self.rMin)
+
+      Epair = self.KCoul * q[idx][:,None]*q[idxB][None,:] / np.sqrt(r2)
+      if (not coulomb_only):
+        s2     = self.sig[self.Type[idx]][:,self.Type[idxB]]**2 / r2
+        s6     = s2*s2*s2
+        Epair += 4.0*self.eps[self.Type[idx]][:,self.Type[idxB]]*(s6*s6 - s6)
+
+      E    += np.sum(Epair[valid])
+
+    return E
+
+  # ----------------------------------
+  def update_energy(self):
+    """
+    Brings the energy pe up to date with the current charges. Only the
+    atoms whose charge changed since the last evaluation are visited,
+    one at a time, so each update is exact.
+    """
+    if (not self.peValid):
+      self.qEval   = np.copy(self.q)
+      self.pe      = 0.5*self.pair_energy(np.arange(self.NAtoms), self.groups['all'], self.q)
+      self.peValid = True
+      return
+
+    for i in np.nonzero(self.q != self.qEval)[0]:
+      qUnit       = np.copy(self.qEval)
+      qUnit[i]    = 1.0
+      phi         = self.pair_energy(np.array([i]), self.groups['all'], qUnit, coulomb_only=True)
+      self.pe    += (self.q[i] - self.qEval[i])*phi
+      self.qEval[i] = self.q[i]
+
+  # ----------------------------------
+  def mc_step(self):
+    """A timestep: a Metropolis rigid translation of a random molecule"""
+    self.delay(self.stepLatency)
+    self.ntimestep += 1
+    if (self.NAtoms == 0):
+      return
+
+    if (self.rng is None):
+      seed     = int(float(self.variables.get('seed',('string','12345'))[1]))
+      self.rng = np.random.Generator(np.random.Philox(key=seed))
+
+    rand   = self.rng.random(5)
+    iMol   = self.mol[int(rand[0]*self.NAtoms)]
+    inMol  = (self.mol == iMol)
+    idxMol = np.nonzero(inMol)[0]
+
+    E_old  = self.pair_energy(idxMol, ~inMol, self.q)
+    x_old  = np.copy(self.x[idxMol])
+    L      = self.boxhi - self.boxlo
+    self.x[idxMol] = self.boxlo + np.mod(x_old + self.dispMax*(2.0*rand[1:4]-1.0) - self.boxlo, L)
+    E_new  = self.pair_energy(idxMol, ~inMol, self.q)
+
+    Beta   = 1.0 / (self.Temp * 8.314 / 4184.0)
+    if (rand[4] < np.exp(min(0.0, -Beta*(E_new - E_old)))):
+      self.pe += E_new - E_old
+    else:
+      self.x[idxMol] = x_old
@@ -29,8 +29,14 @@ class Mol_System:
 	Box         = domain(np.zeros(3,np.double))
 
 	def __init__(self, Box: domain):
-		self.Box = deepcopy(Box)
-		pass
+		self.Box    = deepcopy(Box)
+
+		# the lists are per system, not shared through the class
+		self.NSpcOf = []
+		self.At     = []
+		self.Bnd    = []
+		self.Ang    = []
+		self.Spc    = []
 
 	def insert_spc(self,Spc):
 		"""
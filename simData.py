@@ -4,9 +4,16 @@ from Hist    import Histogram
 from input   import input_data
 from typing  import Dict       # used to enforce the parent class typing
 from sim_lmp import start_lammps
-from lammps  import lammps
+from lmp_backend import lammps
 from tmmc    import TMMC_histogram
 from WL      import WL_histogram
+from ee_mbar import mbar_samples
+from ee_grid import grid_feedback
+from ee_mixing import mixing_diagnostics
+from ee_tuning import segment_tuner
+from ee_equil import equil_monitor
+from ee_cache import state_cache
+from math    import gcd
 
 import numpy as np
 
@@ -21,6 +28,7 @@ class simData():
 	Temp           = 298.0 # Simulation temperature in K
 	Beta           = 0.0   # Thermodynamic beta (1/kT)
 	EEHist         = 0     # Exp Ens histogram
+	GridFeedback   = 0     # moves the sub-ensembles of the Exp Ens histogram during the first steps (ee_grid_feedback)
 	WLHist         = 0     # Wang-Landau histogram
 	TMHist         = 0     # Transition Matrix Monte Carlo histogram
 	NStepsUpdateTM = 0     # Update the TM every this many steps
@@ -28,16 +36,58 @@ class simData():
 	WL_FILE_out    = ''    # file path and name to the WL output
 	write_tmmc     = False # output the TMMC histogram if true
 	TM_FILE_out    = ''    # file path and name to the TMMC output
+	write_mbar     = False # store the energies of the samples in all sub-ensembles and output the MBAR free energies if true
+	MB_FILE_out    = ''    # file path and name to the MBAR output
+	NWStepMB       = 0     # mbar write step
+	MBSamples      = 0     # the samples of the MBAR estimator
+	Mixing         = 0     # round trips, acceptance, diffusivity and inefficiency of the sub-ensemble index
+	write_mixing   = False # output the mixing diagnostics if true
+	MX_FILE_out    = ''    # file path and name to the mixing diagnostics output
+	NWStepMX       = 0     # mixing diagnostics write step
+	Tuner          = 0     # picks NSteps_subEns from the decorrelation of the attempts and the costs (tune_segments)
+	EquilMonitor   = 0     # ends the equilibration once pe, temperature and density are stationary (auto_equil)
+	EquilCache     = 0     # the cache of the equilibrated starting states (equil_cache)
+	format_wl      = 'text'# format of the WL output   (text/binary)
+	format_tmmc    = 'text'# format of the TMMC output (text/binary)
 	ISeed          = 0     # seed to be used for lammps initialization
 	NSteps_equil   = 0     # equilibration run length in timesteps
 	NSteps_prod    = 0     # production run length in timesteps
 	NSteps_subEns  = 0     # simulation length in timesteps for simulation runs between sub-change attempts
+	NAttempts_subEns = 1   # number of sub-ensemble change attempts after each simulation run
+	NJumpMax       = 1     # largest sub-ensemble jump proposed (bandwidth of the TMMC matrices)
+	NJump          = 1     # largest sub-ensemble jump currently proposed (adapts to the acceptance)
+	accTarget      = 0.3   # target acceptance of the sub-ensemble jumps
 	use_wl_bool    = False # True if wl is used
 	use_tmmc_bool  = False # True if tmmc is used 
 	DataFileName   = ''    # The data file name and path. Contains the init config and topology
 	NWStepWL       = 0     # wl write step
 	NWStepTM       = 0     # tmmc write step
+	write_dump     = False # write a lammps dump of the trajectory if true
+	NWStepDump     = 0     # dump write step
+	DumpFile       = ''    # file path and name of the dump
+	ee_method      = ''    # method used to roam the expanded ensemble (wl/tmmc/wl_and_tmmc)
 	wts            = 0.0   # weights used to roam the expanded ensemble
+	ee_energy      = 'run0'# how the energy of attempted sub-ensembles is computed (run0/quadratic/partial, auto is resolved)
+	ee_moves       = 'segments' # sub-ensemble moves between separate runs (segments) or within a single run (in_run)
+	ee_sync        = 'bcast'    # random decisions broadcasted by rank 0 (bcast) or drawn identically on all ranks (replicated)
+	NCheckSync     = 0     # cross-check the ranks every this many attempts (replicated ee_sync, 0 = never)
+	NWalkers       = 1     # number of independent walkers (lammps instances) sharing the histograms
+	NStepsMerge    = 0     # merge the histograms of the walkers every this many steps
+	NWindows       = 1     # number of overlapping windows the ee coordinate is split in
+	NOverlap       = 0     # number of sub-ensembles shared by neighboring windows
+	StitchedFile   = ''    # file path and name of the stitched DOS of the windows
+	fullCoord      = 0.0   # ee coordinate of the fully coupled test object (max of the ee histo)
+	NStepsChk      = 0     # write a checkpoint every this many production steps (0 = never)
+	chkPrefix      = ''    # file path and name prefix of the checkpoint files
+	NRetriesChk    = 0     # times to resume automatically from the last checkpoint if lammps fails
+	resume_bool    = False # continue from the checkpoint instead of starting a new run
+	FileMode       = 'w'   # mode the output files are opened with ('a' when resuming)
+	NStepsTiming   = 0     # export the timers of the loop every this many steps (0 = only summarize at the end)
+	TimingFile     = ''    # file path and name of the timers (json or csv)
+	stopCriterion  = ''    # end the production early: dF_err (error of the TMMC dF) or stable (WL done, TMMC weights stable)
+	stopTol        = 0.0   # tolerance of the stopping criterion (kT)
+	NStepsStop     = 0     # check the stopping criterion every this many steps (0 = never)
+	NChecksStop    = 1     # checks the TMMC weights should be stable over (stable)
 
 	simInit_bool   = False # True if lammps has been initialized
 	sysLoaded_bool = False # True if a configuration and topology has been read
@@ -61,7 +111,29 @@ class simData():
 		# General EE histogram info
 		if (not inData.ee_histo_parsed):
 			sys.exit('simulation.__init__ : ERROR - Exp Ens histogram data not found')
-		self.EEHist  = Histogram(inData.boundary_min, inData.boundary_max, inData.desired_inc)
+		self.EEHist  = Histogram(inData.boundary_min, inData.boundary_max, inData.desired_inc, inData.ee_nodes)
+		self.fullCoord = self.EEHist.max
+
+		if (inData.ee_grid_feedback_parsed):
+			self.GridFeedback = grid_feedback(self.EEHist.NBins, inData.grid_feedback, inData.NStepsAdaptGrid, inData.NAdaptGrid)
+
+		if (inData.timing_parsed):
+			self.NStepsTiming = inData.NStepsTiming
+			self.TimingFile   = inData.outFile_timing
+
+		if (inData.stop_when_parsed):
+			self.stopCriterion = inData.stopCriterion
+			self.stopTol       = inData.stopTol
+			self.NStepsStop    = inData.NStepsStop
+			self.NChecksStop   = inData.NChecksStop
+
+		if (inData.checkpoint_parsed):
+			self.NStepsChk   = inData.NStepsChk
+			self.chkPrefix   = inData.chkPrefix
+			self.NRetriesChk = inData.NRetriesChk
+			self.resume_bool = inData.resume_bool
+			if (self.resume_bool):
+				self.FileMode = 'a' # continue the output of the interrupted run
 
 		if (inData.init_dos_parsed):
 			wts_init = inData.dos_init
@@ -77,24 +149,47 @@ class simData():
 			lnf_scaler    = inData.lnf_scaler
 			ratio_crit    = inData.ratio_crit
 			lnf_crit      = inData.lnf_crit
-			self.WLHist   = WL_histogram(self.EEHist,lnf_init,lnf_scaler,ratio_crit,lnf_crit)
+			self.WLHist   = WL_histogram(self.EEHist,lnf_init,lnf_scaler,ratio_crit,lnf_crit,inData.wl_schedule)
 			self.use_wl_bool = True
 		
+		self.NJumpMax  = inData.NJumpMax
+		self.accTarget = inData.accTarget
+
 		if (inData.use_tmmc_bool):
-			self.TMHist         = TMMC_histogram(self.EEHist)
+			self.TMHist         = TMMC_histogram(self.EEHist,self.NJumpMax,inData.NBlocksTM)
 			self.use_tmmc_bool  = True
 			self.NStepsUpdateTM = inData.NStepsUpdateTM
 		
 		if (inData.write_wl_parsed):
 			self.write_wl     = True
-			self.WL_FILE_out  = open(inData.outFile_wl,"w") # File to write DOS from WL
+			self.format_wl    = inData.format_wl
+			self.WL_FILE_out  = open(inData.outFile_wl,self.file_mode(self.format_wl)) # File to write DOS from WL
 			self.NWStepWL     = inData.wstep_wl
 	
 		if (inData.write_tmmc_parsed):
 			self.write_tmmc    = True
-			self.TM_FILE_out   = open(inData.outFile_tmmc,"w") # File to write DOS from TMMC
+			self.format_tmmc   = inData.format_tmmc
+			self.TM_FILE_out   = open(inData.outFile_tmmc,self.file_mode(self.format_tmmc)) # File to write DOS from TMMC
 			self.NWStepTM      = inData.wstep_tmmc
 
+		if (inData.write_mbar_parsed):
+			if (inData.ee_energy_method == 'run0'):
+				sys.exit('simulation.__init__ : ERROR - write_mbar needs the energies of a charge model (ee_energy quadratic/partial/auto)')
+			self.write_mbar   = True
+			self.MB_FILE_out  = open(inData.outFile_mbar,self.FileMode) # File to write the free energies from MBAR
+			self.NWStepMB     = inData.wstep_mbar
+			self.MBSamples    = mbar_samples(self.EEHist.nodes, self.Beta)
+
+		if (inData.write_mixing_parsed):
+			self.write_mixing = True
+			self.MX_FILE_out  = open(inData.outFile_mixing,self.FileMode) # File to write the mixing diagnostics
+			self.NWStepMX     = inData.wstep_mixing
+
+		if (inData.write_dump_parsed):
+			self.write_dump   = True
+			self.NWStepDump   = inData.wstep_dump
+			self.DumpFile     = inData.outFile_dump
+
 		if (not inData.iseed_parsed):
 			self.ISeed = random.randint(1000,1000000) # get a random seed between 1000 and 1000000
 		else:
@@ -105,12 +200,47 @@ class simData():
 		self.NSteps_equil   = inData.NSteps_equil 
 		self.NSteps_prod    = inData.NSteps_prod
 		self.NSteps_subEns  = inData.NSteps_subEns 
+		self.NAttempts_subEns = inData.NAttempts_subEns
+		self.Mixing         = mixing_diagnostics(self.EEHist.nodes, self.NSteps_subEns)
 
 		if (inData.read_data_parsed):
 			self.DataFileName = inData.DataFile
 		else:
 			sys.exit('simulation.__init__ : ERROR - Use read_data in the input to import a configuration and topology')
 
+		# auto uses the quadratic model where it pays off: with several
+		# attempts per segment or for the samples of MBAR
+		self.ee_energy = inData.ee_energy_method
+		if (self.ee_energy == 'auto'):
+			self.ee_energy = 'run0'
+			if (self.NAttempts_subEns > 1 or self.write_mbar):
+				self.ee_energy = 'quadratic'
+		self.ee_moves  = inData.ee_moves
+		self.ee_sync   = inData.ee_sync
+		self.NCheckSync = inData.NCheckSync
+
+		if (inData.walkers_parsed):
+			self.NWalkers    = inData.NWalkers
+			self.NStepsMerge = inData.NStepsMerge
+
+		if (inData.ee_windows_parsed):
+			self.NWindows     = inData.NWindows
+			self.NOverlap     = inData.NOverlap
+			self.StitchedFile = inData.outFile_stitched
+
+		if (inData.auto_equil_parsed):
+			# NSteps_equil is the max and becomes the length actually run
+			self.EquilMonitor = equil_monitor(inData.NStepsEquilChunk, inData.NStepsEquilMin)
+
+		if (inData.equil_cache_parsed):
+			self.EquilCache = state_cache(inData.CacheDir, int(inData.CacheMaxMB*1.e6))
+
+		if (inData.tune_segments_parsed):
+			# the production is cut to a multiple of the initial segment length
+			self.NSteps_prod = int(self.NSteps_prod/self.NSteps_subEns)*self.NSteps_subEns
+			self.Tuner       = segment_tuner(inData.NStepsProbe, inData.NStepsRetune, self.tunable_base(inData.NStepsRetune))
+
+		self.ee_method = inData.ee_method
 		self.wts = np.zeros(self.EEHist.NBins,np.double)
 		if  (inData.ee_method == 'wl' or inData.ee_method == 'wl_and_tmmc'):
 			self.update_roaming_weights('wl')
@@ -126,12 +256,64 @@ class simData():
 
 	# ----------------------------------------------
 	# ----------------------------------------------
-	def init_lammps_Sim(self):
+	def tunable_base(self,NStepsRetune=0):
+		"""
+		Returns the number of steps the segment length has to divide: the
+		greatest common divisor of the production length and of all the
+		intervals (checkpoints, output, merges ...) that are multiples of
+		the segment length given in the input
+		"""
+		intervals = [self.NSteps_prod, self.NStepsChk, self.NStepsStop, self.NStepsMerge, self.NStepsTiming, NStepsRetune]
+		if (self.use_tmmc_bool):
+			intervals.append(self.NStepsUpdateTM)
+		if (self.write_wl):
+			intervals.append(self.NWStepWL)
+		if (self.write_tmmc):
+			intervals.append(self.NWStepTM)
+		if (self.write_mbar):
+			intervals.append(self.NWStepMB)
+		if (self.write_mixing):
+			intervals.append(self.NWStepMX)
+		if (self.GridFeedback != 0):
+			intervals.append(self.GridFeedback.NStepsAdapt)
+
+		NStepsBase = 0
+		for NSteps in intervals:
+			if (NSteps > 0 and np.mod(NSteps,self.NSteps_subEns) == 0):
+				NStepsBase = gcd(NStepsBase, NSteps)
+
+		if (NStepsBase == 0):
+			NStepsBase = self.NSteps_subEns
+		return NStepsBase
+
+	# ----------------------------------------------
+	# ----------------------------------------------
+	def file_mode(self,fileFormat):
+		"""
+		Returns the mode to open an output file with, 
+		given its format (text/binary)
+		"""
+		if (fileFormat == 'binary'):
+			return self.FileMode + 'b'
+		return self.FileMode
+
+	# ----------------------------------------------
+	# ----------------------------------------------
+	def init_lammps_Sim(self,comm=None,iWalker=None):
 		"""
 		Initializes a lammps simulation using the data 
 		stored in the class
+
+		OPTIONAL args : comm, the mpi communicator of lammps and
+		iWalker, the index of the partition (walker or window) 
+		when the ranks are split in several lammps instances.
+		Each partition gets its own seed and log file
 		"""
-		lmp          = start_lammps(self.ISeed)
+		LogAppend    = (self.FileMode == 'a')
+		if (iWalker is not None):
+			lmp      = start_lammps(self.ISeed + iWalker, comm, "log.lammps.ee.%d" %iWalker, LogAppend)
+		else:
+			lmp      = start_lammps(self.ISeed, comm, LogAppend=LogAppend)
 		simInit_bool = True
 		return lmp 
 
@@ -151,6 +333,76 @@ class simData():
 		self.NAtoms         = int(lmp.extract_variable("NAtoms","group",0))
 		self.sysLoaded_bool = True
 
+	# -----------------------------------------------
+	# -----------------------------------------------
+	def import_restart(self,lmp,RestartFile):
+		"""
+		Reads a lammps restart file (e.g. of a checkpoint)
+		instead of the data file and initializes the 
+		associated class variables.
+		"""
+		lmp.command("variable RestartFileName string restart.run")
+		flag = lmp.set_variable("RestartFileName",RestartFile)
+		lmp.command("read_restart ${RestartFileName} ")
+
+		lmp.command("variable NAtoms   equal count(all)")
+
+		self.NAtoms         = int(lmp.extract_variable("NAtoms","group",0))
+		self.sysLoaded_bool = True
+
+
+	# ----------------------------------------------
+	# ----------------------------------------------
+	def set_window(self,iFirst,iLast,iWindow):
+		"""
+		Restricts the expanded ensemble to the sub-ensembles 
+		iFirst...iLast. The histograms are re-initialized on 
+		the window, keeping the initial weights of its 
+		sub-ensembles. The histograms of window iWindow are
+		written in files with the index of the window appended.
+		"""
+		width       = self.EEHist.width_bin
+		wts_init    = np.copy(self.EEHist.binValue[iFirst:iLast+1])
+		win_min     = self.EEHist.nodes[iFirst]
+		win_max     = self.EEHist.nodes[iLast]
+		win_nodes   = None
+		if (not self.EEHist.uniform):
+			win_nodes = np.copy(self.EEHist.nodes[iFirst:iLast+1])
+
+		self.EEHist = Histogram(win_min, win_max, width, win_nodes)
+		self.EEHist.binValue = wts_init
+
+		if (self.use_wl_bool):
+			WLHist      = self.WLHist
+			self.WLHist = WL_histogram(self.EEHist,WLHist.lnf,WLHist.lnf_scaler,WLHist.ratio_crit,WLHist.lnf_crit,WLHist.schedule)
+
+		if (self.use_tmmc_bool):
+			self.TMHist = TMMC_histogram(self.EEHist,self.NJumpMax,self.TMHist.NBlocksMax)
+
+		self.wts    = np.copy(wts_init)
+
+		if (self.write_wl):
+			FileName         = self.WL_FILE_out.name
+			self.WL_FILE_out.close()
+			self.WL_FILE_out = open("%s.%d" %(FileName,iWindow),self.file_mode(self.format_wl))
+
+		if (self.write_tmmc):
+			FileName         = self.TM_FILE_out.name
+			self.TM_FILE_out.close()
+			self.TM_FILE_out = open("%s.%d" %(FileName,iWindow),self.file_mode(self.format_tmmc))
+
+		self.Mixing = mixing_diagnostics(self.EEHist.nodes, self.NSteps_subEns)
+
+		if (self.write_mixing):
+			FileName         = self.MX_FILE_out.name
+			self.MX_FILE_out.close()
+			self.MX_FILE_out = open("%s.%d" %(FileName,iWindow),self.FileMode)
+
+		if (self.write_mbar):
+			self.MBSamples   = mbar_samples(self.EEHist.nodes, self.Beta)
+			FileName         = self.MB_FILE_out.name
+			self.MB_FILE_out.close()
+			self.MB_FILE_out = open("%s.%d" %(FileName,iWindow),self.FileMode)
 
 	# ----------------------------------------------
 	# ----------------------------------------------
@@ -1,17 +1,30 @@
-from lammps import lammps
+from lmp_backend import lammps
 
 import sys
 import numpy as np
 	
-def start_lammps(ISeed):
+def start_lammps(ISeed,comm=None,LogFileName="log.lammps.ee",LogAppend=False):
 	"""
 	Initialize a lammps simulation. 
 
 	Returns a lammps simulation object that can be 
 	passed to other routines.
+
+	comm        - the mpi communicator lammps runs on     (OPTIONAL)
+	LogFileName - the name of the lammps log file         (OPTIONAL)
+	LogAppend   - append to the log instead of overwriting (OPTIONAL)
 	"""
-	lmp = lammps(cmdargs=["-screen","none"])
-	lmp.command("log            log.lammps.ee")
+	if (comm is None):
+		lmp = lammps(cmdargs=["-screen","none"])
+	else:
+		lmp = lammps(cmdargs=["-screen","none"],comm=comm)
+
+	lmp.command("variable LogFileName string log.lammps.ee")
+	flag = lmp.set_variable("LogFileName",LogFileName)
+	if (LogAppend):
+		lmp.command("log            ${LogFileName} append")
+	else:
+		lmp.command("log            ${LogFileName}")
 	lmp.command("units          real")
 	lmp.command("atom_style     full")
 
@@ -23,20 +36,24 @@ def start_lammps(ISeed):
 # ----------------------------------------------------------------
 
 # ----------------------------------------------------------------
-def setup_tip4p_with_Ions(lmp, Temp):
+def setup_tip4p_with_Ions(lmp, Temp, create_velocities=True, ffFile="tip4p05.ff"):
 	"""
 	Initialize a simulation of tip4p/05 water with ions in lammps
 
-	Temp : simulation temperature in K
+	Temp              : simulation temperature in K
+	create_velocities : (OPTIONAL) if False the velocities are kept, 
+	                    e.g. when continuing from a restart file
+	ffFile            : (OPTIONAL) the forcefield file to include
 	"""
 
 	# translate the arguments to lammps variables
 	lmp.command("variable Text equal  298.0")
 	flag = lmp.set_variable("Text" ,Temp)
 
-	lmp.command("include        tip4p05.ff               ")  # the forcefield goes here
+	lmp.command("include        %s" %ffFile)  # the forcefield goes here
 
-	lmp.command("velocity       all create ${Text} 1234  ")
+	if (create_velocities):
+		lmp.command("velocity       all create ${Text} ${seed}")
 
 	lmp.command("neighbor       2.0 bin                  ")
 	lmp.command("neigh_modify   every 1 delay 0 check yes")
@@ -55,20 +72,24 @@ def setup_tip4p_with_Ions(lmp, Temp):
 # ----------------------------------------------------------------
 
 # ----------------------------------------------------------------
-def setup_LJ_with_Ions(lmp, Temp):
+def setup_LJ_with_Ions(lmp, Temp, create_velocities=True, ffFile="CGLJ.ff"):
 	"""
 	Initialize a simulation of LJ water with ions in lammps
 
-	Temp : simulation temperature in K
+	Temp              : simulation temperature in K
+	create_velocities : (OPTIONAL) if False the velocities are kept, 
+	                    e.g. when continuing from a restart file
+	ffFile            : (OPTIONAL) the forcefield file to include
 	"""
 
 	# translate the arguments to lammps variables
 	lmp.command("variable Text equal  300.0")
 	flag = lmp.set_variable("Text" ,Temp)
 
-	lmp.command("include        CGLJ.ff               ")  # the forcefield goes here
+	lmp.command("include        %s" %ffFile)  # the forcefield goes here
 
-	lmp.command("velocity       all create ${Text} 1234  ")
+	if (create_velocities):
+		lmp.command("velocity       all create ${Text} ${seed}")
 	
 	lmp.command("thermo_style   custom step temp press epair evdwl ecoul elong")
 	lmp.command("thermo_modify  flush yes")
@@ -90,7 +111,98 @@ def run_lammps_sim(lmp,NStepsRun):
 	lmp.command("run ${NStepsRun}")
 
 #------------------------------------------------------------
-def set_lammps_dump(lmp,NStepDump=200,DumpFileName="expEns.lammpstrj"):
+# The python functions lammps calls back during a run. lammps only
+# invokes functions that were defined through its python command, and
+# looks them up by name in the __main__ namespace. A forwarding function
+# is defined there for each run (python ... here), which calls the
+# callback registered under its name in this module.
+#------------------------------------------------------------
+lammps_callbacks = {}
+
+def invoke_callback(pyFuncName):
+	"""Calls the callback registered under pyFuncName (from lammps)"""
+	lammps_callbacks[pyFuncName]()
+
+#------------------------------------------------------------
+def run_lammps_sim_every(lmp,NStepsRun,NStepsEvery,callback):
+	"""
+	Run a simulation with length 'NStepsRun' in number of timesteps
+	as a single lammps run. Every 'NStepsEvery' timesteps the python
+	function 'callback' is called back without arguments.
+
+	The setup (neighbor build, kspace init, fix setup) is only done 
+	before the first segment and the run summary is only printed after
+	the last one (pre no / post no). The callback should therefore not
+	change anything but charges and lammps variables. The next segment
+	starts from the forces of the last evaluation, so after changing
+	charges the callback has to evaluate them again (e.g. run 0 post no).
+	"""
+	pyFuncName = "ee_callback_%x" %id(lmp)
+	lammps_callbacks[pyFuncName] = callback
+
+	lmp.command("variable NStepsRun   string 100")
+	lmp.command("variable NStepsEvery string 100")
+	flag = lmp.set_variable("NStepsRun"  ,NStepsRun)
+	flag = lmp.set_variable("NStepsEvery",NStepsEvery)
+
+	try:
+		lmp.command("python %s here \"def %s(): import sim_lmp; sim_lmp.invoke_callback('%s')\"" \
+		            %(pyFuncName, pyFuncName, pyFuncName))
+		lmp.command("run ${NStepsRun} pre no post no every ${NStepsEvery} \"python %s invoke\"" %pyFuncName)
+	finally:
+		del lammps_callbacks[pyFuncName]
+
+#------------------------------------------------------------
+def thermo_state(lmp):
+	"""
+	Returns the potential energy, the temperature and the density of
+	the configuration at the end of the last run
+	"""
+	lmp.command("variable ee_density equal density")
+	pe   = lmp.extract_compute("thermo_pe",0,0)
+	temp = lmp.extract_compute("thermo_temp",0,0)
+	dens = lmp.extract_variable("ee_density",None,0)
+
+	return pe, temp, dens
+
+#------------------------------------------------------------
+class pe_probe():
+	"""
+	Computes the potential energy of the current configuration with a
+	false run (zero timesteps). Only the post run summary is skipped
+	(run 0 post no).
+
+	The setup cannot be skipped (pre no): a run of zero timesteps without
+	setup evaluates no forces and energies, and thermo_pe would still be
+	the energy of the charges of the previous run. Every probe follows a
+	change of the test charges, so every probe does the setup.
+	"""
+	NProbes = 0     # number of probes done
+
+	# ----------------------------------
+	def __init__(self,lmp):
+		"""Initialize a probe for the lammps simulation lmp"""
+		self.lmp     = lmp
+		self.NProbes = 0
+
+	# ----------------------------------
+	def __call__(self):
+		"""Returns the potential energy of the current configuration"""
+		self.lmp.command("run 0 post no")
+		self.NProbes += 1
+
+		return self.lmp.extract_compute("thermo_pe",0,0)
+
+	# ----------------------------------
+	def report(self):
+		"""Returns a string with the number of probes done"""
+		if (self.NProbes == 0):
+			return "pe_probe : No energy probes were done"
+
+		return "pe_probe : %d energy probes (setup, no run summary)" %self.NProbes
+
+#------------------------------------------------------------
+def set_lammps_dump(lmp,NStepDump=200,DumpFileName="expEns.lammpstrj",append=False):
 	"""
 	Forces a lammps simulation to output dump configurations
 	
@@ -98,6 +210,7 @@ def set_lammps_dump(lmp,NStepDump=200,DumpFileName="expEns.lammpstrj"):
 	lmp          -  the lammps instance
 	NStepDump    -  write a config every this many steps (OPTIONAL)
 	DumpFileName -  The name of the dump file            (OPTIONAL)
+	append       -  append to an existing dump file      (OPTIONAL)
 	"""
 	lmp.command("variable DumpFileName  string dump.atom")
 	lmp.command("variable NStepDump     string 200      ")
@@ -106,5 +219,7 @@ def set_lammps_dump(lmp,NStepDump=200,DumpFileName="expEns.lammpstrj"):
 	flag = lmp.set_variable("NStepDump",   NStepDump)
 
 	lmp.command("dump trj all atom ${NStepDump} ${DumpFileName}")
+	if (append):
+		lmp.command("dump_modify trj append yes")
 
 
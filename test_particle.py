@@ -1,5 +1,5 @@
 from typing  import Dict       # used to enforce the parent class typing
-from lammps  import lammps
+from lmp_backend import lammps
 from simData import simData
 from input   import input_data
 from mpi4py  import MPI
@@ -25,6 +25,12 @@ class test_object():
 		sys.exit('test_object.subEns_change : ERROR - Illegal call. ee_coord() is undefined within the class')
 	def print_idx(self):
 		sys.exit('test_object.print_idx : ERROR - Illegal call. print_idx() is undefined within the class')
+	def set_lmp_charge(self):
+		sys.exit('test_object.set_lmp_charge : ERROR - Illegal call. set_lmp_charge() is undefined within the class')
+	def move_to(self):
+		sys.exit('test_object.move_to : ERROR - Illegal call. move_to() is undefined within the class')
+	def define_test_groups(self):
+		sys.exit('test_object.define_test_groups : ERROR - Illegal call. define_test_groups() is undefined within the class')
 
 
 
@@ -40,7 +46,8 @@ class test_IonPair(test_object):
 
 	idxCat     = -1     # global index of the test cation
 	idxAn      = -1     # global index of the test anion
-	Dcharge    =  0.0   # charge parturbation between sub-ensembles
+	Dcharge    =  0.0   # smallest charge parturbation between sub-ensembles
+	EEHist     =  0     # the ee histo. Its nodes are the charges of the sub-ensembles
 	charge     =  0.0   # currect charge of the test particles
 	NIonPairs  =  0     # number of ion pairs (when charge is full some other ions are chosen instead of the current pair)
 	chargeMin  =  0.0   # is the minimum charge of the ee simulation
@@ -48,6 +55,7 @@ class test_IonPair(test_object):
 	fullCharge =  1.0   # set by default to be 1.0
 	idxCat1    =  0     # the index of the first Cation (of the test part type)
 	idxAn1     =  0     # the index of the first Anion  (of the test part type)
+	testGroups = []     # names of the lammps groups of the test atoms (see define_test_groups)
 	Type       = 'Ion Pair' 
 
 	# ----------------------------------------------------------
@@ -105,11 +113,18 @@ class test_IonPair(test_object):
 		flag1          = lmp.set_variable("idx_testCat", self.idxCat)
 		flag2          = lmp.set_variable("idx_testAn" , self.idxAn )
 
+		self.EEHist    = sim.EEHist
 		self.Dcharge   = sim.EEHist.width_bin # inherited from the ee histo
-		self.charge    = sim.EEHist.max       # start with full charge
+		self.charge    = sim.EEHist.max       # start with the max charge of the ee histo
 		self.chargeMin = sim.EEHist.min
 		self.chargeMax = sim.EEHist.max
-		self.fullCharge = sim.EEHist.max
+		self.fullCharge = sim.fullCoord
+		self.testGroups = []
+
+		# when the ee histo is a window that ends before full charge
+		# the charges of the configuration have to be scaled down
+		if (abs(self.charge - self.fullCharge) > self.Dcharge*0.1):
+			self.set_lmp_charge(lmp,self.charge)
 	
 		# set a string flag that denotes the type the test particle
 		self.Type     = 'Ion Pair' 
@@ -128,15 +143,36 @@ class test_IonPair(test_object):
 		"""
 		Changes the sub Ens to the specified direction iDir
 		lmp  : is an initialized lammps simulation
-		iDir : is the direction of the change
-		       -1 decreases the sub index
+		iDir : is the direction of the change, in sub-ensembles
+		       <0 decreases the sub index
 		        0 is a remain move
-		       +1 increases the sub index
+		       >0 increases the sub index
+		"""
+		iSub         = self.EEHist.idx_of(self.charge)
+		self.charge  = self.EEHist.coord(iSub + iDir)
+
+		self.set_lmp_charge(lmp,self.charge)
+
+	#-----------------------------------------------
+	def move_to(self,lmp,charge):
+		"""
+		Moves the test ion pair to the ee coordinate 'charge',
+		e.g. when the nodes of the ee histo are moved
+		"""
+		self.charge  = charge
+
+		self.set_lmp_charge(lmp,self.charge)
+
+	#-----------------------------------------------
+	def set_lmp_charge(self,lmp,charge):
+		"""
+		Sets the charges of the test ion pair within lammps to
+		the ee coordinate 'charge'. The state of the test object
+		is not changed, so this can be used to probe other
+		sub-ensembles. Use it with self.charge to restore.
 		"""
-		delta_q      = iDir * self.Dcharge
-		q_testCat    = self.charge + delta_q
-		q_testAn     = - q_testCat
-		self.charge  = + q_testCat
+		q_testCat    = + charge
+		q_testAn     = - charge
 
 		if (q_testCat == 0.0):
 			q_testCat = 1.e-10
@@ -148,6 +184,24 @@ class test_IonPair(test_object):
 		lmp.command("set atom ${idx_testCat} charge ${q_testCat}")
 		lmp.command("set atom ${idx_testAn}  charge ${q_testAn}" )
 
+	#-----------------------------------------------
+	def define_test_groups(self,lmp):
+		"""
+		(Re)defines a lammps group for each of the test ions and the
+		group ee_rest with all the other atoms. Returns the names of
+		the test groups. Called again automatically after a shuffle.
+		"""
+		if (len(self.testGroups) > 0):
+			lmp.command("group ee_testCat clear")
+			lmp.command("group ee_testAn  clear")
+			lmp.command("group ee_rest    clear")
+		lmp.command("group ee_testCat id ${idx_testCat}")
+		lmp.command("group ee_testAn  id ${idx_testAn}")
+		lmp.command("group ee_rest    subtract all ee_testCat ee_testAn")
+
+		self.testGroups = ['ee_testCat', 'ee_testAn']
+		return self.testGroups
+
 	#-----------------------------------------------
 	def print_idx(self):
 		"""Prints the indices of the test ion pair"""
@@ -155,7 +209,7 @@ class test_IonPair(test_object):
 
 
 	#-----------------------------------------------
-	def shuffle_testPart(self,lmp,comm):
+	def shuffle_testPart(self,lmp,comm,rand=None):
 		"""
 		If all ion pairs have full fractional charges, 
 		randomly select ions to be the test pair.
@@ -163,21 +217,32 @@ class test_IonPair(test_object):
 		lmp  : an initialized lammps simulation
 		comm : is the mpi instance. Used for parallel
 		execution
+		rand : (OPTIONAL) two uniform random numbers in [0,1)
+		       that are identical on all ranks. If given, 
+		       nothing is broadcasted
 		"""
-
-		if (comm.Get_rank() == 0):
-			NIonPairs     = self.NIonPairs
-			idx_shift_cat = np.random.randint(0,NIonPairs)
-			idx_shift_an  = np.random.randint(0,NIonPairs)
-
-			self.idxCat   = self.idxCat1 + idx_shift_cat 
-			self.idxAn    = self.idxAn1  + idx_shift_an
+		NIonPairs = self.NIonPairs
+
+		if (rand is not None):
+			self.idxCat = self.idxCat1 + int(rand[0]*NIonPairs)
+			self.idxAn  = self.idxAn1  + int(rand[1]*NIonPairs)
+		else:
+			if (comm.Get_rank() == 0):
+				idx_shift_cat = np.random.randint(0,NIonPairs)
+				idx_shift_an  = np.random.randint(0,NIonPairs)
+
+				self.idxCat   = self.idxCat1 + idx_shift_cat 
+				self.idxAn    = self.idxAn1  + idx_shift_an
 	
-		self.idxCat = comm.bcast(self.idxCat,root=0)
-		self.idxAn  = comm.bcast(self.idxAn ,root=0)
+			self.idxCat = comm.bcast(self.idxCat,root=0)
+			self.idxAn  = comm.bcast(self.idxAn ,root=0)
+
 		flag        = lmp.set_variable("idx_testCat",self.idxCat)
 		flag        = lmp.set_variable("idx_testAn", self.idxAn)
 
+		if (len(self.testGroups) > 0):
+			self.define_test_groups(lmp)
+
 # ----------------------------------------------------------
 class test_Ion(test_object):
 	"""
@@ -189,13 +254,15 @@ class test_Ion(test_object):
 	"""
 
 	idx        = -1     # global index of the test cation
-	Dcharge    =  0.0   # charge parturbation between sub-ensembles
+	Dcharge    =  0.0   # smallest charge parturbation between sub-ensembles
+	EEHist     =  0     # the ee histo. Its nodes are the charges of the sub-ensembles
 	charge     =  0.0   # currect charge of the test particle
 	chargeMin  =  0.0   # is the minimum charge of the ee simulation (absolute)
 	chargeMax  =  1.0   # is the maximum charge of the ee simulation (absolute)
 	fullCharge =  1.0   # set by default to be 1.0                   (absolute)
 	Type       = 'Ion' 
 	sign       =  0     # +1 for cation and -1 for anion
+	testGroups = []     # names of the lammps groups of the test atoms (see define_test_groups)
 
 	# ----------------------------------------------------------
 	def __init__(self,   name:    str,\
@@ -233,10 +300,11 @@ class test_Ion(test_object):
 		# Choose the initial test ion pair to be idxCat1 and idxAn1
 		flag1          = lmp.set_variable("idx_testIon", self.idx)
 
+		self.EEHist    = sim.EEHist
 		self.Dcharge   = sim.EEHist.width_bin # inherited from the ee histo
 		self.chargeMin = sim.EEHist.min
 		self.chargeMax = sim.EEHist.max
-		self.fullCharge = sim.EEHist.max
+		self.fullCharge = sim.fullCoord
 	
 		# set a string flag that denotes the type of the test particle
 		self.Type     = 'Ion'
@@ -244,6 +312,13 @@ class test_Ion(test_object):
 
 		self.charge     = charge
 		self.sign       = np.sign(charge)
+		self.testGroups = []
+
+		# when the ee histo is a window that ends before full charge
+		# the charge of the configuration has to be scaled down
+		if (abs(self.charge) > self.chargeMax + self.Dcharge*0.1):
+			self.charge = self.sign * self.chargeMax
+			self.set_lmp_charge(lmp,self.chargeMax)
 
 	#-----------------------------------------------
 	def ee_coord(self):
@@ -259,25 +334,61 @@ class test_Ion(test_object):
 		"""
 		Changes the sub Ens to the specified direction iDir
 		lmp  : is an initialized lammps simulation
-		iDir : is the direction of the change
-		       -1 decreases the sub index
+		iDir : is the direction of the change, in sub-ensembles
+		       <0 decreases the sub index
 		        0 is a remain move
-		       +1 increases the sub index
+		       >0 increases the sub index
 		"""
 
+		iSub           = self.EEHist.idx_of(abs(self.charge))
+		self.charge    = self.EEHist.coord(iSub + iDir) * self.sign
 
-		delta_q        = iDir * self.Dcharge * self.sign
-		self.charge    = self.charge + delta_q
-		q_testIon      = self.charge
+		self.set_lmp_charge(lmp,abs(self.charge))
 
-		if (self.charge  == 0.0):
+	#-----------------------------------------------
+	def move_to(self,lmp,charge):
+		"""
+		Moves the test ion to the ee coordinate 'charge' (absolute 
+		value), e.g. when the nodes of the ee histo are moved
+		"""
+		self.charge    = charge * self.sign
+
+		self.set_lmp_charge(lmp,charge)
+
+	#-----------------------------------------------
+	def set_lmp_charge(self,lmp,charge):
+		"""
+		Sets the charge of the test ion within lammps to the ee
+		coordinate 'charge' (absolute value). The state of the test
+		object is not changed, so this can be used to probe other
+		sub-ensembles. Use it with self.ee_coord() to restore.
+		"""
+		q_testIon      = charge * self.sign
+
+		if (q_testIon  == 0.0):
 			q_testIon  = 1.e-10 * self.sign
 
 		flag = lmp.set_variable("q_testIon", q_testIon)
 
 		lmp.command("set atom ${idx_testIon} charge ${q_testIon}")
 
+	#-----------------------------------------------
+	def define_test_groups(self,lmp):
+		"""
+		(Re)defines a lammps group for the test ion and the group
+		ee_rest with all the other atoms. Returns the names of the
+		test groups.
+		"""
+		if (len(self.testGroups) > 0):
+			lmp.command("group ee_testIon clear")
+			lmp.command("group ee_rest    clear")
+		lmp.command("group ee_testIon id ${idx_testIon}")
+		lmp.command("group ee_rest    subtract all ee_testIon")
+
+		self.testGroups = ['ee_testIon']
+		return self.testGroups
+
 	#-----------------------------------------------
 	def print_idx(self):
 		"""Prints the indices of the test ion pair"""
-		return "Ion%d" %(self.idx)
\ No newline at end of file
+		return "Ion%d" %(self.idx)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+# -------------------------------------------------------------
+# The tests run on the mock lammps backend. The modules of the package
+# live in the repo root, the generator of the test system in the
+# benchmarks.
+# -------------------------------------------------------------
+os.environ['EE_LAMMPS_BACKEND'] = 'mock'
+
+TestDir = os.path.dirname(os.path.abspath(__file__))
+RepoDir = os.path.dirname(TestDir)
+sys.path.insert(0, RepoDir)
+sys.path.insert(1, os.path.join(RepoDir, "benchmarks"))
+
+RunInput = """ee_histo        0.0 1.0 0.1
+use_wl          yes 1.0 0.5 0.8 0.0001
+use_tmmc        yes 20
+roam_ee_with    wl_and_tmmc
+ee_energy       quadratic
+ee_attempts     2
+iseed           123456
+read_data       data.bench
+sim_steps       50 600 10
+tp_IonPair      2 Na 3 Cl
+set_temp        300.00
+checkpoint      100 chk 0
+ee_moves        %s
+"""
+
+
+# -------------------------------------------------------------
+def write_input(FileName,ee_moves='segments',**keywords):
+  """
+  Writes the input of the test run (RunInput) in FileName. The keywords
+  replace the arguments of the lines they name, or are appended to the
+  input. None drops the line
+  """
+  lines = {line.split()[0]: line for line in (RunInput %ee_moves).splitlines()}
+  for key, args in keywords.items():
+    if (args is None):
+      lines.pop(key, None)
+    else:
+      lines[key] = "%-15s %s" %(key, args)
+
+  with open(str(FileName),"w") as InputFile:
+    InputFile.write("\n".join(lines.values()) + "\n")
+
+# -------------------------------------------------------------
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+  """
+  A directory with a small LJ + ions system, its force field and the
+  inputs of a short WL + TMMC run for each ee_moves option
+  (input.segments, input.in_run). The tests run in it
+  """
+  from bench_ee_loop import write_system, ForceField
+
+  write_system(str(tmp_path / "data.bench"), 300, 6)
+  (tmp_path / "CGLJ.ff").write_text(ForceField)
+  for ee_moves in ('segments', 'in_run'):
+    (tmp_path / ("input.%s" %ee_moves)).write_text(RunInput %ee_moves)
+
+  monkeypatch.chdir(tmp_path)
+  return tmp_path
+
+# -------------------------------------------------------------
+@pytest.fixture
+def mock_lmp(run_dir):
+  """A mock lammps instance of the test system of run_dir, after a first run"""
+  from mock_lammps import mock_lammps
+  from sim_lmp     import setup_LJ_with_Ions
+
+  lmp = mock_lammps()
+  lmp.command("variable seed string 1234")
+  lmp.command("read_data data.bench")
+  setup_LJ_with_Ions(lmp, 300.0)
+  lmp.command("run 10")
+  return lmp
+
+# -------------------------------------------------------------
+def make_driver(InputFile,resume=False):
+  """The driver of the run in InputFile (see run_dir)"""
+  from input         import input_data
+  from simData       import simData
+  from sim_lmp       import setup_LJ_with_Ions
+  from test_particle import test_IonPair
+  from ee_driver     import ExpandedEnsembleDriver
+
+  inData = input_data(InputFile)
+  sim    = simData(inData)
+  make_test = lambda sim, lmp: test_IonPair(inData.cationName, inData.iTypeTestCat,
+                                            inData.anionName,  inData.iTypeTestAn, sim, lmp)
+  return ExpandedEnsembleDriver(sim, make_test, setup_LJ_with_Ions, resume=resume, verbose=False)
+
+# -------------------------------------------------------------
+def run_state(driver,NSteps=None):
+  """Runs the driver and returns what the run learned (its weights, CM, WL visits and charge)"""
+  driver.run(NSteps)
+  sim   = driver.sim
+  state = (driver.state()['wts'].copy(), sim.TMHist.CM.copy(), sim.WLHist.NVisits.copy(),
+           sim.WLHist.lnf, driver.testPart.charge)
+  driver.finish()
+  return state
+
+# -------------------------------------------------------------
+def assert_same_state(a,b):
+  """The states of run_state are the same (the CM up to the order of its sums)"""
+  wtsA, CMA, visitsA, lnfA, chargeA = a
+  wtsB, CMB, visitsB, lnfB, chargeB = b
+  np.testing.assert_allclose(wtsA, wtsB, rtol=1.e-12, atol=1.e-12)
+  np.testing.assert_allclose(CMA,  CMB,  rtol=1.e-12, atol=1.e-12)
+  np.testing.assert_array_equal(visitsA, visitsB)
+  assert lnfA    == lnfB
+  assert chargeA == chargeB
+
+# -------------------------------------------------------------
+def run_mpi(Script,args,cwd,NRanks=2):
+  """
+  Runs the python Script with args on NRanks ranks of mpirun (mock
+  backend) in the directory cwd. Skips the test without an MPI launcher
+  or mpi4py
+  """
+  mpirun = shutil.which("mpirun") or shutil.which("mpiexec")
+  if (mpirun is None):
+    pytest.skip("an MPI launcher is needed")
+  pytest.importorskip("mpi4py")
+
+  env = dict(os.environ, EE_LAMMPS_BACKEND="mock", PYTHONPATH=RepoDir,
+             OMPI_ALLOW_RUN_AS_ROOT="1", OMPI_ALLOW_RUN_AS_ROOT_CONFIRM="1",
+             OMPI_MCA_rmaps_base_oversubscribe="1")
+  run = subprocess.run([mpirun, "-n", str(NRanks), sys.executable, "-m", "mpi4py", str(Script)] + list(args),
+                       cwd=str(cwd), env=env, capture_output=True, text=True, timeout=120)
+  assert run.returncode == 0, run.stdout[-2000:] + run.stderr[-2000:]
@@ -0,0 +1,94 @@
+import os
+import types
+
+import numpy as np
+import pytest
+
+from conftest import make_driver, write_input
+from ee_cache import state_cache
+from sim_lmp  import setup_LJ_with_Ions
+
+
+# -------------------------------------------------------------
+def cache_sim(DataFileName,**settings):
+  """The settings of a simulation the fingerprint depends on"""
+  sim = types.SimpleNamespace(DataFileName=DataFileName, Temp=300.0, NSteps_equil=1000,
+                              EEHist=types.SimpleNamespace(max=1.0), EquilMonitor=0)
+  sim.__dict__.update(settings)
+  return sim
+
+# -------------------------------------------------------------
+def test_fingerprint(run_dir):
+  """The key follows the data file, the setup and the settings, and nothing else"""
+  cache = state_cache("cache", 1.e6)
+  key   = cache.fingerprint(cache_sim("data.bench"), setup_LJ_with_Ions)
+  assert key == cache.fingerprint(cache_sim("data.bench"), setup_LJ_with_Ions)
+
+  other = [cache.fingerprint(cache_sim("data.bench", Temp=310.0), setup_LJ_with_Ions),
+           cache.fingerprint(cache_sim("data.bench", NSteps_equil=2000), setup_LJ_with_Ions),
+           cache.fingerprint(cache_sim("data.bench", EEHist=types.SimpleNamespace(max=0.5)), setup_LJ_with_Ions),
+           cache.fingerprint(cache_sim("data.bench"), setup_LJ_with_Ions, iPartition=1),
+           cache.fingerprint(cache_sim("data.bench"), lambda lmp, Temp: None)]
+  assert len(set(other + [key])) == len(other) + 1
+
+  # the content of the data file and of the force field, not their names
+  with open("data.bench","a") as DataFile:
+    DataFile.write("\n")
+  assert cache.fingerprint(cache_sim("data.bench"), setup_LJ_with_Ions) != key
+
+# -------------------------------------------------------------
+def test_store_and_lookup(mock_lmp):
+  """An entry is complete once stored, and restores the state of lammps"""
+  cache = state_cache("cache", 1.e6)
+  assert cache.lookup("abc") is None
+
+  cache.store("abc", mock_lmp, {'NSteps_equil': 10}, True)
+  RestartFile, meta = cache.lookup("abc")
+  assert meta['NSteps_equil'] == 10 and meta['key'] == "abc"
+  assert sorted(os.listdir("cache")) == ["abc.json", "abc.restart"] # no temporary files left
+
+  x = np.copy(mock_lmp.x)
+  mock_lmp.command("run 10")
+  mock_lmp.command("read_restart %s" %RestartFile)
+  np.testing.assert_array_equal(mock_lmp.x, x)
+
+# -------------------------------------------------------------
+def test_evict_least_recently_used(mock_lmp):
+  """When the cache is full the least recently used entries go first, never the new one"""
+  cache = state_cache("cache", 1.e12)
+  for iEntry, key in enumerate(("a", "b", "c")):
+    cache.store(key, mock_lmp, {}, True)
+    os.utime(cache.paths(key)[0], (1000.0*(iEntry+1), 1000.0*(iEntry+1)))
+  size = sum(os.path.getsize(FileName) for FileName in cache.paths("a"))
+
+  cache.lookup("a") # a is now the most recently used
+  cache.maxBytes = 2*size
+  cache.evict()
+  assert cache.lookup("b") is None
+  assert cache.lookup("a") is not None and cache.lookup("c") is not None
+
+  cache.maxBytes = 0
+  cache.store("d", mock_lmp, {}, True)
+  assert sorted(os.listdir("cache")) == ["d.json", "d.restart"]
+
+# -------------------------------------------------------------
+def test_driver_reuses_the_equilibration(run_dir):
+  """A second job with the same inputs starts from the cached state, with its equilibration length and segments"""
+  pytest.importorskip("mpi4py")
+  write_input("input.cache", sim_steps='2000 600 10', auto_equil='10 200', tune_segments='10',
+              equil_cache='cache 10', checkpoint=None)
+
+  first = make_driver("input.cache")
+  x     = np.copy(first.lmp.x)
+  first.finish()
+
+  second = make_driver("input.cache")
+  sim    = second.sim
+  assert sim.EquilMonitor.NSamples == 0 # not equilibrated again
+  assert sim.NSteps_equil == first.sim.NSteps_equil < 2000
+  assert sim.NSteps_subEns == first.sim.NSteps_subEns
+  assert second.lmp.extract_global('ntimestep') == sim.NSteps_equil
+  np.testing.assert_array_equal(second.lmp.x, x)
+  second.run()
+  assert second.NStepsRan == 600
+  second.finish()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mpi4py")
+
+from conftest import make_driver, run_state, assert_same_state
+
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("ee_moves", ["segments", "in_run"])
+def test_resume_matches_uninterrupted(run_dir,ee_moves):
+  """A run resumed from a checkpoint ends where the uninterrupted run does"""
+  InputFile = "input.%s" %ee_moves
+  full      = run_state(make_driver(InputFile))
+  assert np.sum(full[1]) > 0.0
+
+  stopped = make_driver(InputFile) # stopped after its checkpoint at step 300
+  stopped.run(300)
+  stopped.finish()
+
+  driver = make_driver(InputFile, resume=True)
+  assert driver.NStepsRan == 300
+
+  assert_same_state(run_state(driver), full)
@@ -0,0 +1,27 @@
+import pytest
+
+from conftest import write_input
+from input    import input_data
+from simData  import simData
+
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("ee_energy,NAttempts,used", [("quadratic", 1, "quadratic"),
+                                                      ("quadratic", 2, "quadratic"),
+                                                      ("auto",      1, "run0"),
+                                                      ("auto",      2, "quadratic"),
+                                                      ("run0",      2, "run0")])
+def test_energy_method(run_dir,capsys,ee_energy,NAttempts,used):
+  """An explicit choice is kept, auto uses the charge model where it pays off"""
+  write_input("input.energy", ee_energy=ee_energy, ee_attempts=NAttempts)
+  sim = simData(input_data("input.energy"))
+  assert sim.ee_energy == used
+
+  warned = ("WARNING - ee_energy quadratic" in capsys.readouterr().out)
+  assert warned == (ee_energy == "quadratic" and NAttempts == 1)
+
+# -------------------------------------------------------------
+def test_auto_with_mbar(run_dir):
+  """The MBAR samples need the charge model"""
+  write_input("input.energy", ee_energy='auto', ee_attempts=1, write_mbar='100 mbar.dat')
+  assert simData(input_data("input.energy")).ee_energy == "quadratic"
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from conftest import make_driver, write_input
+from ee_equil import equilibration_start, equil_monitor
+
+
+# -------------------------------------------------------------
+def relaxing(rng,N,tau=20.0,amplitude=20.0):
+  """White noise on top of an exponential relaxation with time constant tau (samples)"""
+  return amplitude*np.exp(-np.arange(N)/tau) + rng.normal(size=N)
+
+# -------------------------------------------------------------
+def test_equilibration_start():
+  """The transient is cut away, a stationary series is kept whole, a constant one counts as stationary"""
+  rng = np.random.default_rng(17)
+
+  t0, g, Neff = equilibration_start(relaxing(rng, 400))
+  assert 40 <= t0 <= 150
+  assert g == pytest.approx(1.0, abs=0.3) and Neff > 200
+
+  t0, g, Neff = equilibration_start(rng.normal(size=400))
+  assert t0 <= 20
+
+  assert equilibration_start(np.full(50, 3.0)) == (0, 1.0, 50.0)
+
+# -------------------------------------------------------------
+def test_monitor():
+  """
+  The equilibration is over once all the observables are stationary
+  over the second half of the samples, and not before NStepsMin
+  """
+  rng     = np.random.default_rng(19)
+  monitor = equil_monitor(10, 1000, NAlloc=4)
+  for pe, temp, dens in zip(relaxing(rng, 200), 300.0 + rng.normal(size=200), np.full(200, 0.8)):
+    monitor.add((pe, temp, dens))
+    if (monitor.NSamples < 100):
+      assert not monitor.is_equilibrated() # too few steps
+  assert monitor.is_equilibrated()
+  assert monitor.start() == monitor.starts[0][0] > 0
+  assert monitor.report().startswith("pe from step %d" %(10*monitor.start()))
+
+  # a drift is never stationary
+  drifting = equil_monitor(10, 0)
+  for t in range(200):
+    drifting.add((0.1*t + rng.normal(), 300.0 + rng.normal(), 0.8))
+  assert not drifting.is_equilibrated()
+
+# -------------------------------------------------------------
+def test_driver_ends_the_equilibration(run_dir):
+  """The equilibration ends on a chunk, within its bounds, and the production keeps its length"""
+  pytest.importorskip("mpi4py")
+  write_input("input.equil", sim_steps='2000 600 10', auto_equil='10 200')
+  driver = make_driver("input.equil")
+  driver.run()
+  sim    = driver.sim
+
+  assert 200 <= sim.NSteps_equil < 2000 # the mock system relaxes quickly
+  assert np.mod(sim.NSteps_equil, 10) == 0
+  assert sim.EquilMonitor.NSamples == sim.NSteps_equil // 10
+  assert driver.NStepsRan == 600
+  assert driver.lmp.extract_global('ntimestep') == sim.NSteps_equil + 600
+  driver.finish()
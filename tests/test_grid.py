@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from Hist    import Histogram
+from ee_grid import grid_feedback
+
+
+# -------------------------------------------------------------
+def test_non_uniform_nodes():
+  """idx_of finds the closest of non-uniform nodes, which are moved in place"""
+  EE    = Histogram(0.0, 1.0, 0.1, nodes=[0.0, 0.1, 0.15, 0.5, 1.0])
+  nodes = EE.nodes
+  assert not EE.uniform and EE.width_bin == pytest.approx(0.05)
+  assert [EE.idx_of(q) for q in (0.0, 0.04, 0.12, 0.13, 0.3, 0.33, 0.8, 1.0)] == [0, 0, 1, 2, 2, 3, 4, 4]
+
+  EE.set_nodes([0.0, 0.2, 0.4, 0.6, 1.0])
+  assert nodes is EE.nodes and EE.coord(3) == 0.6
+  with pytest.raises(SystemExit):
+    EE.set_nodes([0.0, 0.4, 0.2, 0.6, 1.0])
+
+# -------------------------------------------------------------
+def test_acceptance_feedback_equalizes_the_acceptance():
+  """
+  Moves of width dq at q are accepted with exp(-(s(q) dq)^2), so the
+  nodes have to crowd where s is large. A few feedback rounds make the
+  acceptance the same across all the gaps
+  """
+  s     = lambda q: 2.0 + 20.0*q*q
+  nodes = np.linspace(0.0, 1.0, 11)
+  fb    = grid_feedback(len(nodes), 'acceptance', 100, 10)
+
+  def acceptance(nodes):
+    mid = 0.5*(nodes[1:] + nodes[:-1])
+    return np.exp(-(s(mid)*np.diff(nodes))**2)
+
+  spread = np.std(acceptance(nodes)) / np.mean(acceptance(nodes))
+  for iRound in range(6):
+    for iGap, acc in enumerate(acceptance(nodes)):
+      for iAtt in range(fb.NMinData):
+        fb.log_attempt(iGap+1, -1, acc)
+    nodes = fb.new_nodes(nodes)
+
+  acc = acceptance(nodes)
+  assert nodes[0] == 0.0 and nodes[-1] == 1.0 and np.all(np.diff(nodes) > 0.0)
+  assert np.std(acc) / np.mean(acc) < 0.05 < spread
+  assert fb.NDone == 6 and fb.active()
+
+# -------------------------------------------------------------
+def test_feedback_needs_data():
+  """Without enough attempts across every gap the nodes stay and the statistics are kept"""
+  fb = grid_feedback(5, 'acceptance', 100, 1)
+  for iGap in range(3):
+    for iAtt in range(fb.NMinData):
+      fb.log_attempt(iGap, +1, 0.5)
+
+  assert fb.new_nodes(np.linspace(0.0, 1.0, 5)) is None
+  assert np.sum(fb.NAtt) == 3*fb.NMinData and fb.NDone == 0
+
+# -------------------------------------------------------------
+def test_roundtrip_feedback():
+  """The nodes crowd where the fraction of walkers coming from the first node drops"""
+  nodes = np.linspace(0.0, 1.0, 11)
+  fb    = grid_feedback(len(nodes), 'roundtrip', 100, 1)
+
+  # a walk from the first to the last node and back labels the visits
+  for i_sub in list(range(11)) + list(range(10, -1, -1)):
+    fb.log_visit(i_sub)
+  assert list(fb.NUp)   == [2] + [1]*9 + [0]
+  assert list(fb.NDown) == [0] + [1]*9 + [2]
+
+  # f drops from 1 to 0 around the middle of the ee coordinate
+  f        = 1.0 / (1.0 + np.exp((nodes - 0.5) / 0.05))
+  fb.NUp   = np.rint(1000*f).astype(np.int64)
+  fb.NDown = 1000 - fb.NUp
+  moved    = fb.new_nodes(nodes)
+
+  gaps = np.diff(moved)
+  assert moved[0] == 0.0 and moved[-1] == 1.0
+  assert gaps[5] < 0.1 < gaps[0]
+  assert not fb.active()
+
+# -------------------------------------------------------------
+def test_driver_moves_the_nodes(run_dir):
+  """
+  When due, the driver moves the nodes, interpolates the weights, drops
+  the statistics of the old nodes and keeps the test particles in
+  their sub-ensemble
+  """
+  pytest.importorskip("mpi4py")
+  from conftest import make_driver, write_input
+
+  write_input("input.grid", ee_grid_feedback='acceptance 100 1', checkpoint=None)
+  driver = make_driver("input.grid")
+  driver.run(100)
+  sim    = driver.sim
+
+  # steep acceptance at the upper end of the ee coordinate
+  fb            = sim.GridFeedback
+  assert fb.NDone == 0 # too few attempts across each gap in 100 steps
+  fb.NAtt  [:]  = fb.NMinData
+  fb.accSum[:]  = fb.NMinData * np.exp(-np.linspace(0.1, 3.0, sim.EEHist.NBins-1))
+  oldNodes      = np.copy(sim.EEHist.nodes)
+  oldWts        = np.copy(sim.wts)
+  iSub          = driver.sub_ensemble()
+  driver.adapt_grid_if_due()
+
+  nodes = sim.EEHist.nodes
+  assert not fb.active() and np.sum(fb.NAtt) == 0
+  assert nodes[0] == oldNodes[0] and nodes[-1] == oldNodes[-1]
+  assert np.diff(nodes)[-1] < np.diff(oldNodes)[-1] < np.diff(nodes)[0]
+  np.testing.assert_allclose(sim.wts, np.interp(nodes, oldNodes, oldWts))
+  assert np.all(sim.TMHist.CM == 0.0)
+  assert driver.sub_ensemble() == iSub
+  assert driver.testPart.ee_coord() == pytest.approx(nodes[iSub])
+
+  driver.run(200)
+  assert np.all(sim.EEHist.nodes == nodes) # fixed after NAdapt moves
+  driver.finish()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mpi4py")
+
+from conftest import make_driver, run_state, assert_same_state
+
+
+# -------------------------------------------------------------
+def test_in_run_matches_segments(run_dir):
+  """The sub-ensemble moves inside the lammps run follow the same trajectory as the segments"""
+  segments = run_state(make_driver("input.segments"))
+  in_run   = run_state(make_driver("input.in_run"))
+
+  assert np.sum(segments[2]) > 0
+  assert_same_state(in_run, segments)
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("ee_energy", ["run0", "quadratic"])
+def test_in_run_forces_follow_the_charges(run_dir,ee_energy):
+  """No segment of the run continues from the forces of other charges than those of the test particles"""
+  InputFile = run_dir / "input.energy"
+  InputFile.write_text((run_dir / "input.in_run").read_text().replace("quadratic", ee_energy))
+
+  driver = make_driver(str(InputFile))
+  driver.run()
+  assert driver.NJumpAccepted > 0
+  assert driver.lmp.NStaleForces == 0
+  driver.finish()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from ee_mbar import mbar_samples, mbar_estimate
+
+
+# -------------------------------------------------------------
+def test_mbar_estimate_gaussian():
+  """
+  Linear energies b*q with b gaussian in the first sub-ensemble, whose
+  free energies are known, f(q) = mu*q - Beta*sigma^2*q^2/2 (in kT)
+  """
+  rng     = np.random.default_rng(1234)
+  coords  = np.linspace(0.0, 1.0, 5)
+  Beta    = 2.0
+  mu, sig = 1.5, 0.8
+  samples = mbar_samples(coords, Beta, NAlloc=16)
+  for iSub, q in enumerate(coords):
+    # the energies b*q tilt the gaussian: b ~ N(mu - Beta*sig^2*q, sig^2)
+    for b in rng.normal(mu - Beta*sig*sig*q, sig, 4000):
+      samples.add(iSub, b, 0.0)
+
+  f, err, N_k = mbar_estimate(samples)
+  exact       = Beta*(mu*coords - 0.5*Beta*sig*sig*coords**2)
+
+  assert list(N_k) == [4000]*len(coords)
+  assert err[0] == pytest.approx(0.0, abs=1.e-6)
+  assert np.all(err[1:] > 0.0) and np.all(err[1:] < 0.05)
+  assert np.all(np.abs(f - exact) < 4.0*err + 1.e-8)
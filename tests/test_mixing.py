@@ -0,0 +1,106 @@
+import io
+
+import numpy as np
+import pytest
+
+from ee_mixing import mixing_diagnostics, statistical_inefficiency
+
+
+# -------------------------------------------------------------
+def walk(diag,path):
+  """Logs the segments of a walk over the sub-ensembles in path, after the segments already logged"""
+  for iSeg in range(1,len(path)):
+    diag.log_segment(path[iSeg-1], path[iSeg], (diag.NLogged+1)*diag.NSteps_seg)
+
+# -------------------------------------------------------------
+def test_round_trips():
+  """A round trip runs from a visit of the first sub-ensemble to the next one after a visit of the last"""
+  diag = mixing_diagnostics(np.linspace(0.0, 1.0, 4), 10, NAlloc=2)
+  assert diag.round_trip() is None
+
+  # 0 1 0 1 2 3 2 3 2 1 0 : one round trip, from the second visit of 0 (step 20) to step 100
+  walk(diag, [0, 1, 0, 1, 2, 3, 2, 3, 2, 1, 0])
+  assert diag.NTrips == 1 and diag.round_trip() == 80.0
+
+  # 0 1 2 3 2 1 0 : a second one of 60 steps
+  walk(diag, [0, 1, 2, 3, 2, 1, 0])
+  assert diag.NTrips == 2 and diag.round_trip() == 70.0
+  assert diag.NLogged == 16 and len(diag.series) >= 16
+  assert list(diag.series[:5]) == [1, 0, 1, 2, 3]
+
+# -------------------------------------------------------------
+def test_local_diagnostics():
+  """The acceptance of each side and the diffusivity of the sub-ensembles the segments started in"""
+  nodes = np.linspace(0.0, 1.0, 3)
+  diag  = mixing_diagnostics(nodes, 10)
+  for accepted in (True, True, False, False):
+    diag.log_attempt(1, +1, accepted)
+  diag.log_attempt(1, -1, True)
+  diag.log_segment(1, 2, 10)
+  diag.log_segment(1, 1, 20)
+
+  acc = diag.acceptance()
+  assert acc[1,1] == 0.5 and acc[1,0] == 1.0
+  assert np.all(np.isnan(acc[0])) and np.all(np.isnan(acc[2]))
+
+  D = diag.diffusivity()
+  assert D[1] == pytest.approx(0.5**2 / (2.0*10*2))
+  assert np.isnan(D[0]) and np.isnan(D[2])
+
+  diag.set_segment(5)
+  assert np.all(diag.NAtt == 0) and np.all(diag.NDq == 0) and diag.NLogged == 2
+
+# -------------------------------------------------------------
+def test_inefficiency_of_an_ar1_series():
+  """g = (1+phi)/(1-phi) for an AR(1) series, 1 for white noise, None when there is nothing to tell"""
+  rng = np.random.default_rng(3)
+  phi = 0.8
+  x   = np.zeros(100000)
+  for t in range(1,len(x)):
+    x[t] = phi*x[t-1] + rng.normal()
+
+  assert statistical_inefficiency(x) == pytest.approx((1.0+phi)/(1.0-phi), rel=0.1)
+  assert statistical_inefficiency(rng.normal(size=10000)) == pytest.approx(1.0, abs=0.1)
+  assert statistical_inefficiency([1, 2, 3]) is None
+  assert statistical_inefficiency(np.full(100, 4)) is None
+
+# -------------------------------------------------------------
+def test_state_and_report():
+  """The state survives arrays/set_arrays and the report has a line per sub-ensemble"""
+  nodes = np.linspace(0.0, 1.0, 4)
+  diag  = mixing_diagnostics(nodes, 10)
+  walk(diag, [0, 1, 2, 3, 2, 1, 0, 1, 2])
+  diag.log_attempt(2, -1, True)
+
+  copy = mixing_diagnostics(nodes, 10)
+  copy.set_arrays(diag.arrays())
+  assert copy.summary() == diag.summary()
+  walk(diag, [2, 3, 2, 1, 0])
+  walk(copy, [2, 3, 2, 1, 0])
+  assert copy.NTrips == diag.NTrips == 1 # the walk reached the last sub-ensemble before the first
+  assert copy.round_trip() == diag.round_trip() == 60.0
+
+  out = io.StringIO()
+  diag.write("mixing", out)
+  lines = out.getvalue().splitlines()
+  assert "round trips" in lines[1]
+  assert len([line for line in lines if line and not line.startswith("#")]) == len(nodes)
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("ee_moves", ['segments', 'in_run'])
+def test_driver_logs_every_segment(run_dir,ee_moves):
+  """The driver logs the index after each production segment and every attempt to a neighbor"""
+  pytest.importorskip("mpi4py")
+  from conftest import make_driver
+
+  driver = make_driver("input.%s" %ee_moves)
+  driver.run()
+  sim    = driver.sim
+  mixing = sim.Mixing
+
+  assert mixing.NLogged == driver.NStepsRan // sim.NSteps_subEns
+  assert np.sum(mixing.NDq) == mixing.NLogged
+  assert 0 < np.sum(mixing.NAtt) <= sim.NAttempts_subEns * mixing.NLogged
+  assert mixing.series[mixing.NLogged-1] == driver.sub_ensemble()
+  assert driver.mixing_report().startswith("mixing : %d round trips" %mixing.NTrips)
+  driver.finish()
@@ -0,0 +1,37 @@
+import sys
+
+import numpy as np
+import pytest
+
+
+# -------------------------------------------------------------
+def test_run0_without_setup_is_stale(mock_lmp):
+  """Like lammps, run 0 pre no evaluates nothing: thermo_pe is that of the old charges"""
+  pe = mock_lmp.extract_compute("thermo_pe",0,0)
+
+  mock_lmp.command("set atom %d charge 0.0" %mock_lmp.NAtoms)
+  mock_lmp.command("run 0 pre no post no")
+  assert mock_lmp.extract_compute("thermo_pe",0,0) == pe
+
+  mock_lmp.command("run 0 post no")
+  pe_new = mock_lmp.extract_compute("thermo_pe",0,0)
+  assert pe_new != pytest.approx(pe)
+  assert pe_new == pytest.approx(0.5*mock_lmp.pair_energy(np.arange(mock_lmp.NAtoms), mock_lmp.groups['all'], mock_lmp.q))
+
+# -------------------------------------------------------------
+def test_run_every_without_setup(mock_lmp,monkeypatch):
+  """
+  The first chunk of a run with every does the setup, the next ones
+  start from the forces of the last evaluation
+  """
+  calls = []
+  def change_charge():
+    calls.append(mock_lmp.ntimestep)
+    mock_lmp.command("set atom %d charge %f" %(mock_lmp.NAtoms, -0.5*len(calls)))
+
+  mock_lmp.command("set atom %d charge 0.0" %mock_lmp.NAtoms)
+  monkeypatch.setattr(sys.modules['__main__'], 'change_charge', change_charge, raising=False)
+  mock_lmp.command("run 30 pre no post no every 10 \"python change_charge invoke\"")
+
+  assert calls == [20, 30, 40]
+  assert mock_lmp.NStaleForces == 2 # the second and third chunks
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from sim_lmp   import pe_probe
+from ee_energy import quad_charge_model
+
+
+# -------------------------------------------------------------
+def full_energy(lmp):
+  """The energy of the current configuration and charges of the mock, from scratch"""
+  return 0.5*lmp.pair_energy(np.arange(lmp.NAtoms), lmp.groups['all'], lmp.q)
+
+# -------------------------------------------------------------
+class test_charge():
+  """A test object whose ee coordinate is the charge of the last atom"""
+  Dcharge   = 0.1
+  chargeMin = 0.0
+  chargeMax = 1.0
+
+  def __init__(self,lmp):
+    self.charge = lmp.q[-1]
+
+  def ee_coord(self):
+    return self.charge
+
+  def set_lmp_charge(self,lmp,charge):
+    lmp.command("set atom %d charge %f" %(lmp.NAtoms, -charge))
+
+
+# -------------------------------------------------------------
+def test_probe_follows_the_charges(mock_lmp):
+  """Each probe is the energy of the charges it is done at, also when they are restored"""
+  probe = pe_probe(mock_lmp)
+  pe    = mock_lmp.extract_compute("thermo_pe",0,0)
+
+  mock_lmp.command("set atom %d charge 0.25" %mock_lmp.NAtoms)
+  pe_trial = probe()
+  assert pe_trial != pytest.approx(pe)
+  assert pe_trial == pytest.approx(full_energy(mock_lmp))
+
+  mock_lmp.command("set atom %d charge -1.0" %mock_lmp.NAtoms)
+  assert probe() == pytest.approx(pe)
+
+  assert probe.NProbes == 2
+  assert "2 energy probes" in probe.report()
+
+# -------------------------------------------------------------
+def test_quad_model_from_probes(mock_lmp):
+  """The model fitted from probes predicts the energy at any charge"""
+  probe    = pe_probe(mock_lmp)
+  testPart = test_charge(mock_lmp)
+  testPart.charge = 1.0
+  pe       = mock_lmp.extract_compute("thermo_pe",0,0)
+
+  model = quad_charge_model()
+  model.refit(mock_lmp, testPart, pe, probe)
+  assert probe.NProbes == 2
+  assert model.b != pytest.approx(0.0)
+
+  for q in (0.0, 0.35, 0.8):
+    testPart.set_lmp_charge(mock_lmp, q)
+    assert model(q) == pytest.approx(full_energy(mock_lmp), rel=1.e-9, abs=1.e-6)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from Hist import Histogram
+from tmmc import TMMC_histogram
+
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("NJump", [1, 2, 3])
+def test_reduce_CM_recovers_weights(NJump):
+  """The weights of a CM built by detailed balance from known weights"""
+  EE  = Histogram(0.0, 1.0, 0.1)
+  TM  = TMMC_histogram(EE, NJumpMax=NJump)
+  wts = np.array([0.0, 1.3, -0.4, 2.1, 0.7, 3.0, 2.2, -1.0, 0.5, 1.8, 4.0])
+
+  # Metropolis acceptance of i -> i+d: wts[i+d] - wts[i] = ln(T[i+d->i] / T[i->i+d])
+  NProposed = np.zeros_like(TM.NProposed)
+  CM        = np.zeros_like(TM.CM)
+  for i in range(TM.NSubs):
+    for d in range(-NJump, NJump+1):
+      if (d != 0 and 0 <= i+d < TM.NSubs):
+        NProposed[i,NJump+d] = 1000
+        CM       [i,NJump+d] = 1000 * min(1.0, np.exp(wts[i] - wts[i+d]))
+
+  reduced = TM.reduce_CM(CM, NProposed)
+  assert reduced is not None
+  np.testing.assert_allclose(reduced[0], wts - wts[0], atol=1.e-10)
+  np.testing.assert_allclose(reduced[1][NProposed > 0], CM[NProposed > 0] / 1000)
+
+# -------------------------------------------------------------
+def test_reduce_CM_disconnected():
+  """A CM with a gap between the sub-ensembles cannot be reduced"""
+  EE = Histogram(0.0, 1.0, 0.1)
+  TM = TMMC_histogram(EE, NJumpMax=2)
+  NProposed = np.ones_like(TM.NProposed)
+  CM        = np.full_like(TM.CM, 0.5)
+  CM[4,TM.NJumpMax+1:] = 0.0 # no jumps out of 4 upwards ...
+  CM[3,TM.NJumpMax+2]  = 0.0 # ... nor over it
+
+  assert TM.reduce_CM(CM, NProposed) is None
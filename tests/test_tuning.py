@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from conftest  import make_driver, write_input
+from ee_tuning import divisors, segment_tuner
+
+
+# -------------------------------------------------------------
+def ar1(rng,phi,N):
+  """An AR(1) series of N points with lag-1 correlation phi"""
+  x = np.zeros(N)
+  for t in range(1,N):
+    x[t] = phi*x[t-1] + rng.normal()
+  return x
+
+# -------------------------------------------------------------
+def test_best_length():
+  """
+  The candidates divide the base. Without a fixed cost per segment the
+  shortest one wins, and the longer the fixed cost the longer the segment
+  """
+  assert divisors(12) == [1, 2, 3, 4, 6, 12] and divisors(1) == [1]
+  tuner = segment_tuner(5, 0, 600)
+  assert tuner.candidates == divisors(600)
+
+  assert tuner.best_length(50.0, 1.0, 0.0) == 1
+  lengths = [tuner.best_length(50.0, 1.0, tFixed) for tFixed in (1.0, 10.0, 100.0, 1000.0)]
+  assert lengths == sorted(lengths) and lengths[0] < lengths[-1]
+  # uncorrelated attempts: only the cost matters
+  assert tuner.best_length(1.e-3, 1.0, 1000.0) == 1
+
+# -------------------------------------------------------------
+def test_tau_of_series():
+  """The correlation time of an exponentially correlated series, half the interval when none is resolved"""
+  rng   = np.random.default_rng(7)
+  tuner = segment_tuner(10, 0, 600)
+  tau   = 40.0
+  dE    = ar1(rng, np.exp(-10.0/tau), 50000)
+  assert tuner.tau_of_series(dE, 10) == pytest.approx(tau, rel=0.15)
+  assert tuner.tau_of_series(rng.normal(size=50000), 10) <= 5.0
+  assert tuner.tau_of_series(ar1(rng, -0.5, 1000), 10) == 5.0
+
+# -------------------------------------------------------------
+def test_lag_correlation():
+  """
+  Only the attempts of consecutive segments from the same sub-ensemble
+  and direction are paired, and each pair is centered on its own means
+  """
+  rng   = np.random.default_rng(9)
+  phi   = 0.6
+  tuner = segment_tuner(10, 100, 600)
+  dE    = {(1,+1): 30.0 + ar1(rng, phi, 2000), (4,-1): -50.0 + ar1(rng, phi, 2000)}
+
+  NStepsRan = 0
+  for key in dE:
+    for dEAtt in dE[key]:
+      NStepsRan += 10
+      tuner.log_attempt(NStepsRan, 10, key, dEAtt)
+    NStepsRan += 10 # a segment without attempt: the next one is not paired
+
+  assert [len(pairs) for pairs in tuner.pairs.values()] == [1999, 1999]
+  assert tuner.lag_correlation() == pytest.approx(phi, abs=0.05)
+
+  tuner.reset()
+  for NStepsRan in range(10, 200, 10):
+    tuner.log_attempt(NStepsRan, 10, (1,+1), rng.normal())
+  assert tuner.lag_correlation() is None # fewer than NMinPairs
+
+# -------------------------------------------------------------
+def test_retune():
+  """
+  A retune weighs the correlation of the attempts against the timers of
+  the period and starts a new period
+  """
+  rng   = np.random.default_rng(13)
+  tuner = segment_tuner(10, 1000, 1000)
+  tuner.start_period(0, 0.0, 0.0)
+  assert tuner.retune(10, 1000, 10.0, 5.0, False) is None # no attempts logged
+
+  for iSeg, dEAtt in enumerate(ar1(rng, 0.9, 100)):
+    tuner.log_attempt(10*(iSeg+1), 10, (2,+1), dEAtt)
+  # 100 segments of 10 steps: 1 ms per MD step and 50 ms per attempt
+  NSteps_seg = tuner.retune(10, 1000, 6.0, 1.0, True)
+
+  tau = -10.0 / np.log(tuner.lag_correlation() or 0.9)
+  assert NSteps_seg == tuner.best_length(tau, 1.e-3, 0.05)
+  assert NSteps_seg > 10
+  assert tuner.pairs == {} and tuner.stepStart == 1000 and tuner.wallStart == 6.0
+
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("ee_moves", ['segments', 'in_run'])
+def test_equilibration_tuning(run_dir,ee_moves):
+  """The probes of the equilibration choose a segment length that divides the intervals of the run"""
+  pytest.importorskip("mpi4py")
+  write_input("input.tune", ee_moves, tune_segments='5')
+  driver = make_driver("input.tune")
+  driver.run()
+  sim    = driver.sim
+
+  assert sim.NSteps_subEns in sim.Tuner.candidates
+  assert np.mod(100, sim.NSteps_subEns) == 0 # checkpoint
+  assert driver.NStepsRan == 600
+  assert sim.Mixing.NLogged == 600 // sim.NSteps_subEns
+  driver.finish()
+
+# -------------------------------------------------------------
+def test_in_run_retune(run_dir):
+  """The segments of the in_run blocks after a retune have the new length"""
+  pytest.importorskip("mpi4py")
+  write_input("input.tune", 'in_run', ee_energy='run0', sim_steps='100 600 20',
+              tune_segments='5 100', checkpoint=None)
+  driver = make_driver("input.tune")
+  driver.sim.Tuner.retune = lambda *args: 5 # 20 -> 5 steps at the first retune
+  driver.run()
+
+  assert driver.sim.NSteps_subEns == 5
+  assert driver.NStepsRan == 600
+  assert driver.lmp.extract_global('ntimestep') == driver.sim.NSteps_equil + driver.NStepsRan
+  driver.finish()
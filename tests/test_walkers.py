@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from conftest import run_mpi
+
+# -------------------------------------------------------------
+# The merges of the walkers are collective, so they are tested on 2
+# ranks launched with mpirun. Each rank writes its WL visits after the
+# merges in a json file of its own.
+# -------------------------------------------------------------
+
+MergeScript = """
+import json, types
+import numpy as np
+from mpi4py import MPI
+from Hist    import Histogram
+from WL      import WL_histogram
+from walkers import walker_team
+
+world = MPI.COMM_WORLD
+EE    = Histogram(0.0,1.0,0.5)
+wl    = WL_histogram(EE,1.0,0.5,0.8,1.e-4)
+sim   = types.SimpleNamespace(WLHist=wl,TMHist=0,EEHist=EE,NWalkers=2)
+wl.NVisits[:] = 10
+wl.recount_visits()
+team  = walker_team(world,sim)
+out   = {}
+
+# both walkers visit every sub-ensemble once more
+wl.NVisits += 1
+wl.recount_visits()
+team.merge(sim)
+out['same_stage'] = wl.NVisits.tolist()
+
+# a new WL stage on the ranks ResetRanks, then a visit of every sub-ensemble
+if (world.Get_rank() in ResetRanks):
+  wl.lnf *= 0.5
+  wl.reset_visits()
+wl.NVisits += 1
+wl.recount_visits()
+team.merge(sim)
+out['new_stage'] = wl.NVisits.tolist()
+
+with open("merge.%d.json" %world.Get_rank(),"w") as OutFile:
+  json.dump(out, OutFile)
+"""
+
+
+# -------------------------------------------------------------
+def run_merge(tmp_path,resetRanks):
+  """Runs the merges on 2 ranks, with a new WL stage on resetRanks, and returns the output of each rank"""
+  Script = tmp_path / "merge.py"
+  Script.write_text(MergeScript.replace("ResetRanks", str(resetRanks)))
+  run_mpi(Script, [], tmp_path)
+
+  return [json.loads((tmp_path / ("merge.%d.json" %rank)).read_text()) for rank in range(2)]
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("resetRanks", [(0, 1), (0,)])
+def test_merge_across_wl_stage(tmp_path,resetRanks):
+  """
+  Within a stage the visits of both walkers add up on top of the common
+  reference. The visits of the previous stage do not survive the reset:
+  when both walkers started the new stage their visits of the stage
+  add up, when only one did the other catches up with its lnf and the
+  stage starts over for both
+  """
+  for out in run_merge(tmp_path, list(resetRanks)):
+    assert out['same_stage'] == [12, 12, 12]
+    if (len(resetRanks) == 2):
+      assert out['new_stage'] == [2, 2, 2]
+    else:
+      assert out['new_stage'] == [0, 0, 0]
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import RepoDir, run_mpi, write_input
+from windows  import make_windows, stitch_dos
+
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("NWindows,NOverlap", [(2, 1), (3, 2), (4, 3)])
+def test_stitch_dos(NWindows, NOverlap):
+  """A DOS split in windows, each shifted by an arbitrary constant"""
+  rng     = np.random.default_rng(4321)
+  NSubs   = 21
+  dos     = np.cumsum(rng.normal(0.0, 2.0, NSubs))
+  windows = make_windows(NSubs, NWindows, NOverlap)
+
+  assert windows[0][0] == 0 and windows[-1][1] == NSubs-1
+  for (iFirst, iLast), (jFirst, jLast) in zip(windows[:-1], windows[1:]):
+    assert iLast - jFirst + 1 == NOverlap
+
+  dos_list = [dos[iFirst:iLast+1] + rng.uniform(-50.0, 50.0) for (iFirst, iLast) in windows]
+  np.testing.assert_allclose(stitch_dos(NSubs, windows, dos_list), dos - dos[0], atol=1.e-10)
+
+  # the order of the windows does not matter
+  order = rng.permutation(NWindows)
+  np.testing.assert_allclose(stitch_dos(NSubs, [windows[i] for i in order], [dos_list[i] for i in order]),
+                             dos - dos[0], atol=1.e-10)
+
+# -------------------------------------------------------------
+def test_stitch_dos_gap():
+  """Windows that do not overlap cannot be stitched"""
+  with pytest.raises(SystemExit):
+    stitch_dos(6, [(0, 2), (3, 5)], [np.zeros(3), np.zeros(3)])
+
+# -------------------------------------------------------------
+def test_windows_without_wl(run_dir):
+  """The DOS of windows roaming with TMMC alone is stitched before every sub-ensemble was logged"""
+  write_input("input.windows", use_wl='no', roam_ee_with='tmmc', ee_energy='run0', sim_steps='20 40 10',
+              checkpoint=None, ee_windows='2 2 stitched.dat')
+  run_mpi(os.path.join(RepoDir, "examples", "ee_run", "ee_lammps.py"), ["input.windows"], run_dir)
+
+  dos = np.loadtxt(str(run_dir / "stitched.dat"))
+  assert dos.shape == (11, 3)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from Hist import Histogram
+from WL   import WL_histogram
+
+
+# -------------------------------------------------------------
+def make_wl(schedule,lnf_scaler=0.5,ratio_crit=0.8):
+  return WL_histogram(Histogram(0.0, 1.0, 0.1), 1.0, lnf_scaler, ratio_crit, 1.e-6, schedule)
+
+# -------------------------------------------------------------
+def test_flatness_tracking():
+  """The O(1) bookkeeping of the visits follows the visits themselves"""
+  rng = np.random.default_rng(11)
+  wl  = make_wl('geometric', ratio_crit=2.0) # never flat: the visits are not reset
+  for i_sub in rng.integers(0, wl.NSubs, 2000):
+    wl.incr_visits(i_sub)
+    assert wl.minVisits  == np.min(wl.NVisits)
+    assert wl.NVisitsTot == np.sum(wl.NVisits)
+
+  assert wl.flatness() == pytest.approx(np.min(wl.NVisits) / np.mean(wl.NVisits))
+  assert sum(wl.NSubsWith.values()) == wl.NSubs
+
+  # rebuilt from visits set directly (merges, checkpoints)
+  wl.NVisits[:] = rng.integers(3, 9, wl.NSubs)
+  wl.recount_visits()
+  assert wl.minVisits == np.min(wl.NVisits) and wl.NVisitsTot == np.sum(wl.NVisits)
+
+# -------------------------------------------------------------
+def test_geometric_stage():
+  """Once the visits are flat lnf is scaled and a new stage starts"""
+  wl = make_wl('geometric')
+  for i_sub in range(wl.NSubs):
+    wl.penalize(i_sub)
+
+  assert wl.lnf == 0.5
+  assert wl.NResets == 2
+  assert np.all(wl.NVisits == 0)
+  np.testing.assert_array_equal(wl.wts, -np.ones(wl.NSubs))
+
+# -------------------------------------------------------------
+@pytest.mark.parametrize("schedule", ['geometric', '1/t'])
+def test_one_over_t(schedule):
+  """With 1/t, lnf follows NSubs/NPenalties once it drops below it. The geometric schedule never does"""
+  rng   = np.random.default_rng(5)
+  wl    = make_wl(schedule, lnf_scaler=0.1)
+  lnfs  = []
+  for i_sub in rng.integers(0, wl.NSubs, 20000):
+    wl.penalize(i_sub)
+    lnfs.append(wl.lnf)
+    if (wl.oneOverT):
+      assert wl.lnf == pytest.approx(wl.NSubs / wl.NPenalties)
+
+  assert np.all(np.diff(lnfs) <= 0.0)
+  assert wl.oneOverT == (schedule == '1/t')
+  if (schedule == '1/t'):
+    assert wl.lnf == pytest.approx(wl.NSubs / 20000)
+
+# -------------------------------------------------------------
+def test_set_time():
+  """The MC time shared by the walkers sets lnf in the 1/t stage"""
+  wl = make_wl('1/t')
+  wl.set_time(500, False)
+  assert wl.lnf == 1.0
+  wl.set_time(550, True)
+  assert wl.oneOverT and wl.lnf == pytest.approx(wl.NSubs / 550)
+
+# -------------------------------------------------------------
+def test_unknown_schedule():
+  with pytest.raises(SystemExit):
+    make_wl('linear')
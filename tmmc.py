@@ -2,6 +2,7 @@ import numpy as np
 import sys
 
 from Hist   import Histogram  # parent class
+from hist_history import write_record
 from typing import Dict       # used to enforce the parent class typing
 
 
@@ -15,28 +16,65 @@ class TMMC_histogram(Histogram):
   wts       =  0.0
   NSubs     =  0
   NVisits   =  0 
-  CM        =  0.0      # collection matrix
-  TM        =  0.0      # transition matrix
+  NJumpMax  =  1        # bandwidth of the matrices: jumps of up to NJumpMax sub-ensembles are logged
+  CM        =  0.0      # collection matrix: CM[i,NJumpMax+d] collects the acceptance of i -> i+d
+  NProposed =  0        # number of times each i -> i+d was proposed (same layout as CM)
+  TM        =  0.0      # transition matrix: the probability of accepting i -> i+d (same layout as CM)
   activated =  False    # if True the simulation uses the wts of TMMC to roam the sub-ensembles
   allSubsLogged = False # if True it is safe to reduce the CM to weights
 
+  # blocks of the CM for the uncertainty of the weights (jackknife)
+  NBlocksMax    = 16    # max number of blocks. When reached, neighboring blocks are merged in pairs
+  NBlocks       = 0     # number of complete blocks
+  NPerBlock     = 1     # weight updates (update_TMMC_weights calls) per block
+  NUpdatesBlock = 0     # weight updates in the current block so far
+  CMBlocks      = 0.0   # the CM increments of each block
+  NPBlocks      = 0     # the NProposed increments of each block
+  CMStart       = 0.0   # the CM at the start of the current block
+  NPStart       = 0     # the NProposed at the start of the current block
+
   # ----------------------------------
-  def __init__(self,EEHisto: Histogram):
-    """Initialize the class with a histogram of size NSubs"""
+  def __init__(self,EEHisto: Histogram,NJumpMax=1,NBlocksMax=16):
+    """
+    Initialize the class with a histogram of size NSubs
+
+    NJumpMax   : (OPTIONAL) the largest sub-ensemble jump that is proposed.
+                 The matrices are banded, with 2*NJumpMax+1 columns
+    NBlocksMax : (OPTIONAL) the max number of blocks the CM is split in
+                 to estimate the uncertainty of the weights (even)
+    """
+    if (NJumpMax < 1 or NJumpMax > EEHisto.NBins-1):
+      sys.exit('TMMC_histogram.__init__ : ERROR - The jumps should be between 1 and NSubs-1 sub-ensembles')
+    if (NBlocksMax < 2 or np.mod(NBlocksMax,2) != 0):
+      sys.exit('TMMC_histogram.__init__ : ERROR - The number of blocks should be even and at least 2')
+
     NSubs               = EEHisto.NBins
+    NBand               = 2*NJumpMax + 1
     self.wts            = np.zeros(NSubs,np.double)
     self.wts            = np.copy(EEHisto.binValue)
     self.NSubs          = NSubs
+    self.NJumpMax       = NJumpMax
     self.NVisits        = np.zeros(NSubs,np.int64)
-    self.CM             = np.zeros((NSubs  ,3),np.double) 
-    self.TM             = np.ones( (NSubs  ,2),np.double) 
+    self.CM             = np.zeros((NSubs  ,NBand),np.double) 
+    self.NProposed      = np.zeros((NSubs  ,NBand),np.int64) 
+    self.TM             = np.ones( (NSubs  ,NBand),np.double) 
     self.activated      = False                           
     self.allSubsLogged  = False                           
 
+    self.NBlocksMax     = NBlocksMax
+    self.NBlocks        = 0
+    self.NPerBlock      = 1
+    self.NUpdatesBlock  = 0
+    self.CMBlocks       = np.zeros((NBlocksMax,NSubs,NBand),np.double)
+    self.NPBlocks       = np.zeros((NBlocksMax,NSubs,NBand),np.int64)
+    self.CMStart        = np.zeros((NSubs,NBand),np.double)
+    self.NPStart        = np.zeros((NSubs,NBand),np.int64)
+
     # inherited histogram variables
     self.min            = EEHisto.min
     self.max            = EEHisto.max
     self.width_bin      = EEHisto.width_bin
+    self.nodes          = EEHisto.nodes    # shared, follows moves of the nodes
     self.binValue       = self.wts
 
   # ----------------------------------
@@ -53,33 +91,48 @@ class TMMC_histogram(Histogram):
     Returns True if trans probabalities for all the 
     sub-ensembles have been logged
     """
-    allSubsLogged = True # assume this is true and check if false
-    for i_sub in range(self.NSubs):
-      if (np.sum(self.CM[i_sub,:]) == 0.0):
-        # in this case no trans_prob has been logged for i_sub yet
-        allSubsLogged = False
-        break
-    return allSubsLogged
+    return bool(np.all(np.sum(self.CM,axis=1) > 0.0))
+
+
+  # ----------------------------------
+  def reset_collection(self):
+    """
+    Drops the collected transitions and their blocks, e.g. when the 
+    sub-ensembles are moved. The weights are kept until the new
+    collection matrix can be reduced
+    """
+    self.CM[:,:]        = 0.0
+    self.NProposed[:,:] = 0
+    self.TM             = np.ones_like(self.CM)
+    self.NVisits[:]     = 0
+    self.allSubsLogged  = False
 
+    self.NBlocks        = 0
+    self.NPerBlock      = 1
+    self.NUpdatesBlock  = 0
+    self.CMBlocks[:]    = 0.0
+    self.NPBlocks[:]    = 0
+    self.CMStart[:]     = 0.0
+    self.NPStart[:]     = 0
 
   # ---------------------------------- 
   def update_collection_matrix(self,i_sub,iDir,trans_prob):
     """
-    The transition probability between two neighboring sub-ensembles 
-    from i_sub to a neighbor is stored in the collection matrix. Instead
-    of giving as input the second sub-ensemble, a direction iDir is
-    given instead. Applicable values are iDir=-1,0,+1. -1 means a decrease
-    of the sub-ensemble coordinate, +1 an increase and 0 a move that
-    keeps us in sub-ensemble i_sub
+    The transition probability from i_sub to the sub-ensemble iDir 
+    away is stored in the collection matrix. iDir is between -NJumpMax 
+    and +NJumpMax. Negative values mean a decrease of the sub-ensemble 
+    coordinate, positive an increase and 0 a move that keeps us in
+    sub-ensemble i_sub
     """
-    if (iDir < -1 or iDir > 1):
+    if (abs(iDir) > self.NJumpMax):
       sys.exit('update_collection_matrix : ERROR - Invalid direction')
       
-    i_sub_local = 1
+    i_sub_local = self.NJumpMax
     j_sub_local = i_sub_local + iDir
     
     self.CM[i_sub,j_sub_local] +=  trans_prob 
     self.CM[i_sub,i_sub_local] += -trans_prob + 1.0 
+    self.NProposed[i_sub,j_sub_local] += 1
 
   # ----------------------------------
   def update_TMMC_weights(self):
@@ -87,31 +140,139 @@ class TMMC_histogram(Histogram):
     Use this to compute a weight/free energy and transition matrix
     estimate based on the current collection matrix. 
     """
+    self.update_blocks()
+
     # first avoid doing anything if 
     if (not self.allSubsLogged):
       self.allSubsLogged = self.check_if_all_subensembles_have_been_logged()
       if (not self.allSubsLogged):
         return # leaves the current estimate to be all zeros
 
-    self.wts[0] = 0.0  # set i_sub=0 as the reference state
+    estimate = self.reduce_CM(self.CM, self.NProposed)
+    if (estimate is None):
+      self.allSubsLogged = False # adresses a small bug appearing when not all directions havent been logged
+      return
 
-    # loop over all entries of the transition matrix
-    for i_sub in range(self.NSubs-1):
-      self.TM[i_sub,1]  =  self.CM[i_sub+1,0] / np.sum(self.CM[i_sub+1,:]) # trans i_sub <- i_sub+1
-      self.TM[i_sub,0]  =  self.CM[i_sub  ,2] / np.sum(self.CM[i_sub  ,:]) # trans i_sub -> i_sub+1
+    self.wts[:], self.TM = estimate
 
+  # ----------------------------------
+  def reduce_CM(self,CM,NProposed):
+    """
+    Reduces a collection matrix to weights. Returns the weights and the
+    transition matrix, or None if CM does not connect all sub-ensembles.
 
-      if (self.TM[i_sub,0] == 0):
-        self.allSubsLogged = False # adresses a small bug appearing when not all directions havent been logged
-        return
+    Every pair of sub-ensembles i, i+d that has been proposed in both 
+    directions gives an estimate of the weight difference by detailed
+    balance, wts[i+d] - wts[i] = ln( TM[i+d -> i] / TM[i -> i+d] ), with
+    the TM the probabilities of accepting the proposed jumps. For nearest
+    neighbors (NJumpMax=1) these estimates are chained. For wider bands 
+    the weights are the weighted least squares solution of all the pair
+    estimates, each weighted by the (harmonic mean of the) acceptance 
+    it is based on.
+    """
+    NJump   = self.NJumpMax
+    NSubs   = self.NSubs
+    logged  = (NProposed > 0)
+    TM      = np.ones_like(CM)
+    TM[logged] = CM[logged] / NProposed[logged]
 
-      # compute the weight of i_sub+1
-      self.wts[i_sub+1] =  self.wts[i_sub] + np.log( self.TM[i_sub,1] / self.TM[i_sub,0] )
-      
-      #if (irank == 0):
-      #  print(i_sub+1, self.TM[i_sub,1], self.TM[i_sub,0], self.wts[i_sub+1], flush=True)
+    # the pairs i -> i+d (d = 1 ... NJump) and their reverse i+d -> i
+    iPair, dPair = np.nonzero(np.ones((NSubs,NJump),bool))
+    dPair += 1
+    inside       = (iPair + dPair < NSubs)
+    iPair, dPair = iPair[inside], dPair[inside]
+    jPair        = iPair + dPair
 
+    T_fwd = TM[iPair, NJump+dPair] # i   -> i+d
+    T_bwd = TM[jPair, NJump-dPair] # i+d -> i
+    C_fwd = CM[iPair, NJump+dPair]
+    C_bwd = CM[jPair, NJump-dPair]
+    valid = (C_fwd > 0.0) & (C_bwd > 0.0)
 
+    # the valid pairs have to connect all the sub-ensembles
+    NCover = np.zeros(NSubs,np.int64)
+    np.add.at(NCover, iPair[valid], 1)
+    np.add.at(NCover, jPair[valid], -1)
+    if (np.any(np.cumsum(NCover)[:-1] == 0)):
+      return None
+
+    dw  = np.log(T_bwd[valid] / T_fwd[valid])
+    wts = np.zeros(NSubs,np.double) # i_sub=0 is the reference state
+
+    if (NJump == 1):
+      wts[1:] = np.cumsum(dw)
+      return wts, TM
+
+    # weighted least squares
+    iPair, jPair = iPair[valid], jPair[valid]
+    sqrtW  = np.sqrt(C_fwd[valid]*C_bwd[valid] / (C_fwd[valid] + C_bwd[valid]))
+    A      = np.zeros((len(dw),NSubs),np.double)
+    A[np.arange(len(dw)),jPair] = +1.0
+    A[np.arange(len(dw)),iPair] = -1.0
+
+    wts[1:] = np.linalg.lstsq(A[:,1:]*sqrtW[:,None], dw*sqrtW, rcond=None)[0]
+    return wts, TM
+
+  # ----------------------------------
+  def update_blocks(self):
+    """
+    Closes the current block of the CM every NPerBlock weight updates.
+    Once NBlocksMax blocks are complete, neighboring blocks are merged
+    in pairs and the blocks become twice as long, so the blocks grow
+    with the run while the memory stays fixed.
+    """
+    self.NUpdatesBlock += 1
+    if (self.NUpdatesBlock < self.NPerBlock):
+      return
+
+    if (self.NBlocks == self.NBlocksMax):
+      half = self.NBlocksMax // 2
+      self.CMBlocks[:half] = self.CMBlocks[0::2] + self.CMBlocks[1::2]
+      self.NPBlocks[:half] = self.NPBlocks[0::2] + self.NPBlocks[1::2]
+      self.CMBlocks[half:] = 0.0
+      self.NPBlocks[half:] = 0
+      self.NBlocks         = half
+      self.NPerBlock      *= 2
+      return  # the current block is half way through the new length
+
+    self.CMBlocks[self.NBlocks] = self.CM        - self.CMStart
+    self.NPBlocks[self.NBlocks] = self.NProposed - self.NPStart
+    self.CMStart       = np.copy(self.CM)
+    self.NPStart       = np.copy(self.NProposed)
+    self.NBlocks      += 1
+    self.NUpdatesBlock = 0
+
+  # ----------------------------------
+  def uncertainty(self):
+    """
+    Returns the standard error of each weight and of the free energy 
+    difference between the last and the first sub-ensemble (in kT),
+    estimated with a jackknife over the blocks of the CM (the complete
+    ones and the current one). Returns None if there are less than 2
+    blocks or a block cannot be left out without disconnecting the CM.
+    """
+    CMBlocks = self.CMBlocks[:self.NBlocks]
+    NPBlocks = self.NPBlocks[:self.NBlocks]
+    if (np.sum(self.NProposed - self.NPStart) > 0):
+      CMBlocks = np.concatenate((CMBlocks, [self.CM        - self.CMStart]))
+      NPBlocks = np.concatenate((NPBlocks, [self.NProposed - self.NPStart]))
+
+    NBlocks = len(CMBlocks)
+    if (NBlocks < 2 or not self.allSubsLogged):
+      return None
+
+    wts_jk = np.zeros((NBlocks,self.NSubs),np.double)
+    for iBlock in range(NBlocks):
+      estimate = self.reduce_CM(self.CM - CMBlocks[iBlock], self.NProposed - NPBlocks[iBlock])
+      if (estimate is None):
+        return None
+      wts_jk[iBlock] = estimate[0]
+
+    wts_err = np.sqrt((NBlocks-1)/NBlocks * np.sum((wts_jk - np.mean(wts_jk,axis=0))**2, axis=0))
+    dF_jk   = wts_jk[:,-1] - wts_jk[:,0]
+    dF_err  = np.sqrt((NBlocks-1)/NBlocks * np.sum((dF_jk - np.mean(dF_jk))**2))
+
+    return wts_err, dF_err
 
   # ----------------------------------
   def incr_visits(self,i_sub):
@@ -133,25 +294,66 @@ class TMMC_histogram(Histogram):
     else:
       TMMCInfoString   = "The weights of TMMC are inactive"
 
+    # standard errors of the weights (jackknife over the blocks of the CM)
+    wts_err  = np.full(self.NSubs,np.nan)
+    ErrorString = "Insufficient blocks to estimate the uncertainty"
+    if (self.allSubsLogged):
+      errors = self.uncertainty()
+      if (errors is not None):
+        wts_err, dF_err = errors
+        ErrorString     = "dF(last-first) = %.4f +/- %.4f kT (%d blocks of %d weight updates)" \
+                          %(self.wts[-1] - self.wts[0], dF_err, self.NBlocks, self.NPerBlock)
+
     file.write("# %s\n" %tag           )
     file.write('# %s\n' %TMMCInfoString)
+    file.write('# %s\n' %ErrorString   )
     file.write("#\n")
 
+    if (self.NJumpMax == 1):
+      CMLabels = ["dir_left", "stay", "dir_right"]
+    else:
+      CMLabels = ["dir%+d" %iDir for iDir in range(-self.NJumpMax,0)] + ["stay"] + \
+                 ["dir%+d" %iDir for iDir in range(1,self.NJumpMax+1)]
+
     if (not self.allSubsLogged):
       file.write("# Insufficient sampling - Weights cannot be reduced from the CM\n")
       file.write("# > Printing the CM instead ...\n")
-      file.write("#  iSub   dir_left       stay       dir_right\n")
+      file.write("#  iSub" + "".join(" %12s" %label for label in CMLabels) + "\n")
       file.write("#\n")
       for i_sub in range(self.NSubs):
-        file.write('%6d %12.3e %12.3e %12.3e \n' \
-                 %(i_sub, self.CM[i_sub,0], self.CM[i_sub,1], self.CM[i_sub,2] ))   
+        file.write('%6d' %i_sub + "".join(' %12.3e' %CM for CM in self.CM[i_sub,:]) + ' \n')
     else:
-      file.write("#   subEnsCoord   devFromMeanVisits      DOS       CM/dir_left      CM/stay      CM/dir_right\n")
+      file.write("#   subEnsCoord   devFromMeanVisits      DOS          err(DOS)" + "".join(" %14s" %("CM/" + label) for label in CMLabels) + "\n")
       file.write("#\n")
       for i_sub in range(self.NSubs):
-        subEnsCoord = self.min + i_sub*self.width_bin
-        file.write('%12.3f %16.3f %16.5f %14.3e %14.3e %14.3e\n' \
-                 %(subEnsCoord, dev_from_mean[i_sub], self(i_sub), self.CM[i_sub,0], self.CM[i_sub,1], self.CM[i_sub,2]))
+        subEnsCoord = self.nodes[i_sub]
+        file.write('%12.3f %16.3f %16.5f %12.5f' %(subEnsCoord, dev_from_mean[i_sub], self(i_sub), wts_err[i_sub]) + \
+                   "".join(' %14.3e' %CM for CM in self.CM[i_sub,:]) + '\n')
     
     file.write("\n")
     file.flush()
+
+  # ----------------------------------
+  def write_record(self,step,file):
+    """Append the TMMC histogram at step as a record of a binary history file"""
+    record = np.zeros(1,[('step','<i8'), ('activated','?'), ('allSubsLogged','?'), \
+                         ('wts','<f8',(self.NSubs,)), ('NVisits','<i8',(self.NSubs,)),  \
+                         ('CM','<f8',self.CM.shape), ('NProposed','<i8',self.NProposed.shape),      \
+                         ('wts_err','<f8',(self.NSubs,)), ('dF_err','<f8'), ('coords','<f8',(self.NSubs,))])
+    record['step']          = step
+    record['activated']     = self.activated
+    record['allSubsLogged'] = self.allSubsLogged
+    record['wts']           = self.wts
+    record['NVisits']       = self.NVisits
+    record['CM']            = self.CM
+    record['NProposed']     = self.NProposed
+    record['wts_err']       = np.nan
+    record['dF_err']        = np.nan
+    record['coords']        = self.nodes
+
+    errors = self.uncertainty()
+    if (errors is not None):
+      record['wts_err']     = errors[0]
+      record['dF_err']      = errors[1]
+
+    write_record(self,record,file)
@@ -0,0 +1,145 @@
+import numpy as np
+import sys
+
+from mpi4py  import MPI
+from simData import simData
+
+
+# -------------------------------------------------------------
+class walker_team():
+  """
+  Splits the world communicator in NWalkers partitions of equal size.
+  Each partition (walker) runs its own lammps instance on its own
+  communicator and explores the expanded ensemble independently.
+
+  Every rank of a walker keeps an identical copy of the WL and TMMC
+  histograms. Periodically, the WL penalties and the TMMC collection
+  matrix increments that each walker accumulated since the last merge
+  are summed into shared estimates, which all the walkers continue from.
+  """
+  NWalkers  = 1      # number of walkers
+  iWalker   = 0      # index of the walker this rank belongs to
+  isLeader  = False  # True for rank 0 of each walker
+  NMerges   = 0      # number of merges done so far
+  ref       = 0.0    # packed histograms after the last merge
+  refPenalties = 0  # WL penalties (MC time of the 1/t schedule) after the last merge
+  refResets    = 0  # WL visit resets of this walker after the last merge
+
+  # ----------------------------------
+  def __init__(self,world,sim: simData,NWalkers=None):
+    """
+    world    : the mpi communicator to split (typically MPI.COMM_WORLD)
+    sim      : the simulation info. The histograms should be in their
+               initial state
+    NWalkers : (OPTIONAL) number of partitions. By default sim.NWalkers.
+               The number of ranks has to be a multiple of it
+    """
+    if (NWalkers is None):
+      NWalkers = sim.NWalkers
+    NRanks   = world.Get_size()
+    if (NWalkers < 1 or np.mod(NRanks,NWalkers) != 0):
+      sys.exit('walker_team.__init__ : ERROR - %d ranks cannot be split in %d walkers' %(NRanks,NWalkers))
+
+    self.world    = world
+    self.NWalkers = NWalkers
+    self.iWalker  = world.Get_rank() // (NRanks // NWalkers)
+    self.comm     = world.Split(color=self.iWalker, key=world.Get_rank())
+    self.isLeader = (self.comm.Get_rank() == 0)
+    self.NMerges  = 0
+    self.ref      = self.pack(sim) # the merged state all walkers started from
+    if (sim.WLHist != 0):
+      self.refPenalties = sim.WLHist.NPenalties
+      self.refResets    = sim.WLHist.NResets
+
+  # ----------------------------------
+  def pack(self,sim: simData):
+    """
+    Packs the WL and TMMC arrays that are merged in a single array
+    """
+    arrays = []
+    if (sim.WLHist != 0):
+      arrays += [sim.WLHist.wts, sim.WLHist.NVisits]
+    if (sim.TMHist != 0):
+      arrays += [sim.TMHist.CM.ravel(), sim.TMHist.NProposed.ravel(), sim.TMHist.NVisits]
+
+    return np.concatenate([np.asarray(a,np.double) for a in arrays])
+
+  # ----------------------------------
+  def unpack(self,sim: simData,packed):
+    """Inverse of pack(). The merged state is copied to the histograms"""
+    NSubs = sim.EEHist.NBins
+    i0    = 0
+    if (sim.WLHist != 0):
+      sim.WLHist.wts[:]     = packed[i0      :i0+NSubs  ]
+      sim.WLHist.NVisits[:] = np.rint(packed[i0+NSubs:i0+2*NSubs])
+      sim.WLHist.recount_visits()
+      i0 += 2*NSubs
+    if (sim.TMHist != 0):
+      NCM = sim.TMHist.CM.size
+      sim.TMHist.CM[:,:]        = packed[i0:i0+NCM].reshape(sim.TMHist.CM.shape)
+      sim.TMHist.NProposed[:,:] = np.rint(packed[i0+NCM:i0+2*NCM]).reshape(sim.TMHist.CM.shape)
+      sim.TMHist.NVisits[:]     = np.rint(packed[i0+2*NCM:i0+2*NCM+NSubs])
+
+  # ----------------------------------
+  def merge(self,sim: simData):
+    """
+    Merges the histograms of all walkers. Has to be called by all the
+    ranks of the world communicator at the same point of the run.
+    """
+    state = self.pack(sim)
+
+    # only the leader of each walker contributes its increments, since
+    # the rest of the ranks of the walker hold identical copies
+    delta = np.zeros_like(state)
+    if (self.isLeader):
+      delta = state - self.ref
+
+    # a walker that reset its visits since the last merge (lnf was updated)
+    # started a new WL stage: its visits of the stage are all it has now
+    anyReset = False
+    if (sim.WLHist != 0):
+      NSubs  = sim.EEHist.NBins
+      visits = slice(NSubs,2*NSubs)
+      wasReset = (self.isLeader and sim.WLHist.NResets != self.refResets)
+      if (wasReset):
+        delta[visits] = state[visits]
+      anyReset = self.world.allreduce(int(wasReset),op=MPI.MAX) > 0
+
+    merged = np.zeros_like(state)
+    self.world.Allreduce(delta,merged,op=MPI.SUM)
+    merged += self.ref
+
+    # the visits of the previous stage do not count in the new one
+    if (anyReset):
+      merged[visits] -= self.ref[visits]
+
+    if (sim.WLHist != 0):
+      # all walkers continue with the smallest lnf any of them reached.
+      # If it changed, a new WL stage starts and the visits are reset
+      lnf     = self.world.allreduce(sim.WLHist.lnf,op=MPI.MIN)
+      lnf_max = self.world.allreduce(sim.WLHist.lnf,op=MPI.MAX)
+      self.unpack(sim,merged)
+      sim.WLHist.lnf = lnf
+      if (lnf != lnf_max and not sim.WLHist.oneOverT):
+        sim.WLHist.reset_visits()
+
+      # the MC time of the 1/t schedule is the sum of the penalties of all
+      # walkers, and all of them switch to 1/t once any of them has
+      dPenalties = 0
+      if (self.isLeader):
+        dPenalties = sim.WLHist.NPenalties - self.refPenalties
+      NPenalties = self.refPenalties + self.world.allreduce(dPenalties,op=MPI.SUM)
+      oneOverT   = self.world.allreduce(int(sim.WLHist.oneOverT),op=MPI.MAX) > 0
+      sim.WLHist.set_time(NPenalties,oneOverT)
+      self.refPenalties = NPenalties
+      self.refResets    = sim.WLHist.NResets
+
+      sim.WLHist.isItDone = (sim.WLHist.lnf <= sim.WLHist.lnf_crit)
+    else:
+      self.unpack(sim,merged)
+
+    if (sim.TMHist != 0):
+      sim.TMHist.update_TMMC_weights()
+
+    self.ref      = self.pack(sim)
+    self.NMerges += 1
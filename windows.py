@@ -0,0 +1,85 @@
+import numpy as np
+import sys
+
+
+# -------------------------------------------------------------
+def make_windows(NSubs,NWindows,NOverlap):
+  """
+  Splits the sub-ensembles 0...NSubs-1 in NWindows windows of (nearly)
+  equal size. Neighboring windows share NOverlap sub-ensembles.
+
+  Returns a list with the (first, last) sub-ensemble of each window
+  """
+  if (NWindows < 1 or NOverlap < 1):
+    sys.exit('make_windows : ERROR - At least one window and one overlapping sub-ensemble are needed')
+
+  # the windows tile NSubs + (NWindows-1)*NOverlap sub-ensembles in total
+  NTiled = NSubs + (NWindows-1)*NOverlap
+  if (NTiled < NWindows*(NOverlap+1)):
+    sys.exit('make_windows : ERROR - %d sub-ensembles are too few for %d windows with overlap %d' %(NSubs,NWindows,NOverlap))
+
+  edges   = np.rint(np.linspace(0,NTiled,NWindows+1)).astype(int)
+  windows = []
+  for iWin in range(NWindows):
+    iFirst = edges[iWin]   - iWin*NOverlap
+    iLast  = edges[iWin+1] - iWin*NOverlap - 1
+    windows.append((int(iFirst),int(iLast)))
+
+  return windows
+
+# -------------------------------------------------------------
+def stitch_dos(NSubs,windows,dos_list):
+  """
+  Stitches the DOS of overlapping windows in a single profile over all
+  NSubs sub-ensembles. Each window's DOS is defined up to a constant,
+  which is chosen to match the profile assembled so far in the least
+  squares sense over the overlapping sub-ensembles. In the overlaps
+  the shifted estimates are averaged.
+
+  windows  : the (first, last) sub-ensemble of each window
+  dos_list : the DOS of each window (same order as windows)
+
+  Returns the stitched DOS, with the first sub-ensemble as reference (0)
+  """
+  order  = np.argsort([iFirst for (iFirst, iLast) in windows])
+  dosSum = np.zeros(NSubs,np.double)
+  NEst   = np.zeros(NSubs,np.int64)
+
+  for iWin in order:
+    iFirst, iLast = windows[iWin]
+    dos           = np.asarray(dos_list[iWin],np.double)
+    known         = NEst[iFirst:iLast+1] > 0
+
+    if (np.any(known)):
+      profile = dosSum[iFirst:iLast+1][known] / NEst[iFirst:iLast+1][known]
+      offset  = np.mean(profile - dos[known])
+    elif (np.sum(NEst) > 0):
+      sys.exit('stitch_dos : ERROR - Window %d does not overlap with the previous ones' %iWin)
+    else:
+      offset  = 0.0
+
+    dosSum[iFirst:iLast+1] += dos + offset
+    NEst  [iFirst:iLast+1] += 1
+
+  if (np.any(NEst == 0)):
+    sys.exit('stitch_dos : ERROR - The windows do not cover all sub-ensembles')
+
+  dos = dosSum / NEst
+  return dos - dos[0]
+
+# -------------------------------------------------------------
+def write_stitched_dos(EEHist,dos,file):
+  """
+  Writes the stitched DOS in a file. The DOS is in the third
+  column, so the file can be used with init_dos
+  """
+  file.write("# DOS stitched from overlapping windows\n")
+  file.write("#\n")
+  file.write("#   subEnsCoord    subEnsIdx      DOS\n")
+  file.write("#\n")
+  for i_sub in range(EEHist.NBins):
+    subEnsCoord = EEHist.nodes[i_sub]
+    file.write('%12.3f %12d %16.5f \n' %(subEnsCoord, i_sub, dos[i_sub]))
+
+  file.write("\n")
+  file.flush()